@@ -0,0 +1,67 @@
+"""
+Recall@k and latency of the IVF-flat episode index against exact search.
+
+Uses synthetic clustered embeddings, so it needs neither Mongo nor Ollama:
+    python -m ai_memory_fastapi.benchmarks.ann_recall --episodes 100000 --dim 768
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+
+from ..storage.ann_index import AnnIndexRegistry
+from ..storage.episode_index import EpisodeIndex
+
+
+def synthetic_embeddings(rng: np.random.Generator, count: int, dim: int, topics: int) -> np.ndarray:
+    # Episodes cluster around topics, like real facts about a user's recurring interests
+    centers = rng.normal(size=(topics, dim))
+    return (centers[rng.integers(0, topics, count)] + 0.35 * rng.normal(size=(count, dim))).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--episodes", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = synthetic_embeddings(rng, args.episodes, args.dim, args.topics)
+    queries = synthetic_embeddings(rng, args.queries, args.dim, args.topics)
+    ids = [i.to_bytes(12, "big") for i in range(args.episodes)]
+
+    exact = EpisodeIndex.from_rows(ids, vectors)
+    start = time.perf_counter()
+    truth = [{ids[row] for row, _ in exact.search(q, args.k)} for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+    with tempfile.TemporaryDirectory() as root:
+        registry = AnnIndexRegistry(root)
+        start = time.perf_counter()
+        index = registry.build("bench", ids, vectors)
+        build_s = time.perf_counter() - start
+        size_mb = sum(
+            os.path.getsize(os.path.join(dirpath, name))
+            for dirpath, _, names in os.walk(root) for name in names
+        ) / 2**20
+
+        print(f"{args.episodes} episodes x {args.dim} dims, {index.nlist} lists, "
+              f"built in {build_s:.2f}s, {size_mb:.1f} MiB on disk")
+        print(f"exact search: {exact_ms:.3f} ms/query")
+        print(f"{'nprobe':>8} {'recall@' + str(args.k):>10} {'ms/query':>10} {'speedup':>8}")
+        for nprobe in args.nprobe:
+            start = time.perf_counter()
+            found = [{episode_id for episode_id, _, _ in index.search(q, args.k, nprobe)} for q in queries]
+            ann_ms = (time.perf_counter() - start) * 1000 / args.queries
+            recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+            print(f"{nprobe:>8} {recall:>10.3f} {ann_ms:>10.3f} {exact_ms / ann_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Stand-in Ollama server for load tests.
+
+Serves /api/chat (plain and NDJSON streaming), /api/embeddings and /api/embed with a
+configurable time-to-first-token, token rate and embedding latency. Extraction prompts get
+a JSON fact list back, so the memory pipeline does its full amount of work.
+
+In-process (see load_test.py) it is mounted through httpx.ASGITransport. Standalone:
+    python -m ai_memory_fastapi.benchmarks.fake_ollama --port 11434 --tokens-per-second 40
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeOllamaConfig:
+    first_token_ms: float = 150.0  # Prompt processing before the first token
+    tokens_per_second: float = 50.0
+    reply_tokens: int = 60
+    embed_ms: float = 10.0  # Per /api/embed(dings) call
+    embed_ms_per_input: float = 1.0
+    embed_dim: int = 768
+    jitter: float = 0.2  # +- fraction applied to every delay
+
+
+WORDS = ("memory", "session", "user", "likes", "coffee", "travel", "project", "weekend",
+         "music", "plans", "remember", "today", "friend", "work", "book", "idea")
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """Deterministic per text, so repeated texts behave like a real model (and hit caches)."""
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+    return np.random.default_rng(seed).normal(size=dim).astype(np.float32).tolist()
+
+
+def create_app(config: FakeOllamaConfig = None) -> FastAPI:
+    config = config or FakeOllamaConfig()
+    app = FastAPI(title="Fake Ollama")
+
+    async def delay(ms: float):
+        await asyncio.sleep(max(0.0, ms * random.uniform(1 - config.jitter, 1 + config.jitter)) / 1000)
+
+    def reply_for(messages: List[dict]) -> List[str]:
+        last = messages[-1]["content"] if messages else ""
+        if "Extract up to" in last:
+            facts = [{"fact": f"User mentioned {random.choice(WORDS)} {random.choice(WORDS)}",
+                      "importance": round(random.random(), 2)} for _ in range(random.randint(0, 3))]
+            return [json.dumps(facts)]
+        return [random.choice(WORDS) + " " for _ in range(config.reply_tokens)]
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        tokens = reply_for(body.get("messages", []))
+        prompt_tokens = sum(len(m.get("content", "")) // 4 for m in body.get("messages", []))
+        token_ms = 1000 / config.tokens_per_second
+
+        if not body.get("stream"):
+            await delay(config.first_token_ms + token_ms * len(tokens))
+            return {"model": body.get("model"), "message": {"role": "assistant", "content": "".join(tokens)}, "done": True,
+                    "prompt_eval_count": prompt_tokens, "eval_count": len(tokens)}
+
+        async def stream():
+            await delay(config.first_token_ms)
+            for token in tokens:
+                yield json.dumps({"message": {"role": "assistant", "content": token}, "done": False}) + "\n"
+                await delay(token_ms)
+            yield json.dumps({"message": {"role": "assistant", "content": ""}, "done": True,
+                              "prompt_eval_count": prompt_tokens, "eval_count": len(tokens)}) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.post("/api/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        await delay(config.embed_ms + config.embed_ms_per_input)
+        return {"embedding": fake_embedding(body.get("prompt", ""), config.embed_dim)}
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        texts = body.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        await delay(config.embed_ms + config.embed_ms_per_input * len(texts))
+        return JSONResponse({"embeddings": [fake_embedding(t, config.embed_dim) for t in texts]})
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    defaults = FakeOllamaConfig()
+    parser.add_argument("--first-token-ms", type=float, default=defaults.first_token_ms)
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--reply-tokens", type=int, default=defaults.reply_tokens)
+    parser.add_argument("--embed-ms", type=float, default=defaults.embed_ms)
+    parser.add_argument("--embed-ms-per-input", type=float, default=defaults.embed_ms_per_input)
+    parser.add_argument("--embed-dim", type=int, default=defaults.embed_dim)
+    parser.add_argument("--jitter", type=float, default=defaults.jitter)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeOllamaConfig:
+    return FakeOllamaConfig(
+        first_token_ms=args.first_token_ms,
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        embed_ms=args.embed_ms,
+        embed_ms_per_input=args.embed_ms_per_input,
+        embed_dim=args.embed_dim,
+        jitter=args.jitter,
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Ollama server for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    add_arguments(parser)
+    parsed = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(parsed)), host=parsed.host, port=parsed.port, log_level="warning")
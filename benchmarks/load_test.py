@@ -0,0 +1,350 @@
+"""
+End-to-end load test of the HTTP API with local stand-ins for Ollama and MongoDB.
+
+Seeds users with skewed activity (Zipf-distributed traffic, Poisson session counts,
+log-normal episode counts), then drives /api/chat, /api/memory/{user_id} and
+/api/aggregate/{user_id} in-process and reports latency percentiles, throughput and the
+per-stage context-assembly timings returned by /api/chat. Requests turned away by admission
+control (429) are counted apart from errors; CHAT_USER_RATE_PER_MINUTE=0 lifts the per-user
+chat rate limit, which a few hot users of the Zipf mix otherwise hit.
+
+With the default Mongo backend it needs mongomock_motor for the in-process stand-in
+(pip install mongomock-motor), or --mongo-uri to run against a real server. With
+STORAGE_BACKEND=sqlite it runs on a throwaway SQLite file and needs nothing extra. Ollama is faked in-process unless --ollama-url
+points at a real (or standalone fake) server:
+    python -m ai_memory_fastapi.benchmarks.load_test --users 50 --requests 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from ..config import settings
+from ..models import Episode, Message
+from ..storage.store import store
+from ..services.embeddings import embedding_cache
+from ..services.memory_worker import memory_worker
+from ..services.ollama_client import ollama_client
+from . import fake_ollama
+
+CHAT_MESSAGES = (
+    "What did I tell you about my weekend plans?",
+    "Remind me what book I was reading.",
+    "I just got back from a trip to Lisbon, it was great.",
+    "Can you help me plan my project for next week?",
+    "I've started learning the piano again.",
+    "What do you know about my coffee preferences?",
+)
+
+
+# ------------------------------------------------------------------
+# Workload model
+# ------------------------------------------------------------------
+class Population:
+    """Synthetic users with skewed activity, and their sessions."""
+
+    def __init__(self, rng: np.random.Generator, users: int, zipf_s: float, sessions_mean: float):
+        self.rng = rng
+        self.user_ids = [f"bench-user-{i}" for i in range(users)]
+        weights = 1.0 / np.arange(1, users + 1) ** zipf_s
+        self.weights = weights / weights.sum()
+        self.sessions = {
+            user_id: [f"{user_id}-s{j}" for j in range(1 + rng.poisson(max(sessions_mean - 1, 0)))]
+            for user_id in self.user_ids
+        }
+
+    def pick_user(self) -> str:
+        return self.user_ids[self.rng.choice(len(self.user_ids), p=self.weights)]
+
+    def pick_session(self, user_id: str) -> str:
+        sessions = self.sessions[user_id]
+        # Most traffic continues a recent session; some starts a new one
+        if self.rng.random() < 0.05:
+            sessions.append(f"{user_id}-s{len(sessions)}")
+        return sessions[-1] if self.rng.random() < 0.7 else sessions[self.rng.integers(len(sessions))]
+
+
+async def seed(population: Population, args: argparse.Namespace):
+    rng = population.rng
+    now = datetime.utcnow()
+    topics = rng.normal(size=(64, args.embed_dim))
+    totals = {"messages": 0, "episodes": 0}
+
+    for user_id in population.user_ids:
+        messages: List[Message] = []
+        for session_id in population.sessions[user_id]:
+            start = now - timedelta(days=float(rng.uniform(0, args.history_days)))
+            for i in range(1 + rng.geometric(1 / args.messages_per_session)):
+                messages.append(Message(
+                    user_id=user_id, session_id=session_id,
+                    role="user" if i % 2 == 0 else "assistant",
+                    content=CHAT_MESSAGES[rng.integers(len(CHAT_MESSAGES))],
+                    created_at=start + timedelta(minutes=i)
+                ))
+        totals["messages"] += await store.save_messages_bulk(messages)
+
+        count = int(min(args.episodes_max, rng.lognormal(math.log(args.episodes_median), args.episodes_sigma)))
+        user_topics = topics[rng.choice(len(topics), 8)]
+        vectors = user_topics[rng.integers(0, 8, count)] + 0.4 * rng.normal(size=(count, args.embed_dim))
+        sessions = population.sessions[user_id]
+        for start in range(0, count, 200):
+            await asyncio.gather(*(
+                store.save_episode(Episode(
+                    user_id=user_id,
+                    session_id=sessions[rng.integers(len(sessions))],
+                    fact=f"Synthetic fact {i} about {user_id}",
+                    importance=float(rng.random()),
+                    embedding=vectors[i].tolist(),
+                    created_at=now - timedelta(days=float(rng.uniform(0, args.history_days)))
+                ))
+                for i in range(start, min(start + 200, count))
+            ))
+        totals["episodes"] += count
+    return totals
+
+
+# ------------------------------------------------------------------
+# Load generation
+# ------------------------------------------------------------------
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.rejected: Dict[str, int] = defaultdict(int)
+        self.stages: Dict[str, List[float]] = defaultdict(list)
+        self.missed: Dict[str, int] = defaultdict(int)
+        self.prompt_tokens: List[int] = []
+
+    def record(self, op: str, elapsed_ms: float, response: Optional[httpx.Response]):
+        self.latencies[op].append(elapsed_ms)
+        if response is not None and response.status_code == 429:
+            self.rejected[op] += 1
+            return
+        if response is None or response.status_code >= 400:
+            self.errors[op] += 1
+            return
+        if op == "chat":
+            body = response.json()
+            for stage, ms in (body.get("context_latency_ms") or {}).items():
+                self.stages[stage].append(ms)
+            for stage in body.get("missed_context_sources") or []:
+                self.missed[stage] += 1
+            if body.get("prompt_tokens") is not None:
+                self.prompt_tokens.append(body["prompt_tokens"])
+
+
+async def drive(client: httpx.AsyncClient, population: Population, args: argparse.Namespace, recorder: Recorder) -> float:
+    ops, weights = zip(*args.mix.items())
+    weights = np.array(weights) / sum(weights)
+    rng = population.rng
+    remaining = args.requests
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    async def one():
+        op = ops[rng.choice(len(ops), p=weights)]
+        user_id = population.pick_user()
+        if op == "chat":
+            call = client.post("/api/chat/", json={
+                "user_id": user_id,
+                "session_id": population.pick_session(user_id),
+                "message": CHAT_MESSAGES[rng.integers(len(CHAT_MESSAGES))],
+            })
+        elif op == "memory":
+            call = client.get(f"/api/memory/{user_id}", params={"session_id": population.pick_session(user_id)})
+        else:
+            call = client.get(f"/api/aggregate/{user_id}")
+
+        start = time.perf_counter()
+        try:
+            response = await call
+        except Exception as e:
+            print(f"[WARN] {op} request failed: {e!r}")
+            response = None
+        recorder.record(op, (time.perf_counter() - start) * 1000, response)
+
+    async def worker():
+        nonlocal remaining
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    return
+            else:
+                if remaining <= 0:
+                    return
+                remaining -= 1
+            await one()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return time.perf_counter() - start
+
+
+# ------------------------------------------------------------------
+# Reporting
+# ------------------------------------------------------------------
+def summarize(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(values),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "max_ms": round(float(max(values)), 2),
+    }
+
+
+def build_report(recorder: Recorder, elapsed: float, seeded: Dict[str, int], drain_s: Optional[float]) -> Dict[str, Any]:
+    total = sum(len(v) for v in recorder.latencies.values())
+    return {
+        "seeded": seeded,
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "rps": round(total / elapsed, 1) if elapsed else None,
+        "endpoints": {
+            op: {**summarize(values), "errors": recorder.errors[op], "rejected": recorder.rejected[op],
+                 "rps": round(len(values) / elapsed, 1)}
+            for op, values in sorted(recorder.latencies.items())
+        },
+        "chat_stages": {stage: summarize(values) for stage, values in sorted(recorder.stages.items())},
+        "chat_missed_sources": dict(recorder.missed),
+        "prompt_tokens_p50": float(np.percentile(recorder.prompt_tokens, 50)) if recorder.prompt_tokens else None,
+        "background_drain_s": drain_s,
+        "ollama": ollama_client.stats(),
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\nSeeded {report['seeded']['messages']} messages and {report['seeded']['episodes']} episodes")
+    print(f"{report['requests']} requests in {report['elapsed_s']}s -> {report['rps']} req/s\n")
+    header = f"{'':<18} {'count':>7} {'err':>5} {'429':>5} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(header)
+    for op, s in report["endpoints"].items():
+        print(f"{op:<18} {s['count']:>7} {s['errors']:>5} {s['rejected']:>5} {s['rps']:>7} {s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9} {s['max_ms']:>9}")
+    print("\nchat context stages")
+    for stage, s in report["chat_stages"].items():
+        print(f"  {stage:<16} {s['count']:>7} {'':>5} {'':>5} {'':>7} {s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9} {s['max_ms']:>9}")
+    if report["chat_missed_sources"]:
+        print(f"missed context sources: {report['chat_missed_sources']}")
+    if report["prompt_tokens_p50"] is not None:
+        print(f"prompt tokens p50: {report['prompt_tokens_p50']:.0f}")
+    if report["background_drain_s"] is not None:
+        print(f"background memory jobs drained {report['background_drain_s']}s after load stopped")
+
+
+# ------------------------------------------------------------------
+# Entry point
+# ------------------------------------------------------------------
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("chat", "memory", "aggregate"):
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}")
+        mix[name] = float(weight)
+    return mix
+
+
+async def connect(args: argparse.Namespace, scratch_dir: str):
+    if settings.STORAGE_BACKEND == "sqlite":
+        await store.connect(path=os.path.join(scratch_dir, "bench.db"))
+    elif args.mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        settings.DB_NAME = args.db_name or f"bench_{uuid.uuid4().hex[:8]}"
+        await store.connect(AsyncIOMotorClient(args.mongo_uri))
+    else:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("The in-process Mongo stand-in needs mongomock_motor (pip install mongomock-motor); "
+                             "pass --mongo-uri, or run with STORAGE_BACKEND=sqlite")
+        await store.connect(AsyncMongoMockClient())
+
+    if args.ollama_url:
+        for backend in ollama_client.backends:
+            backend.base_url = args.ollama_url.rstrip("/")
+    else:
+        await ollama_client.client.aclose()
+        fake = fake_ollama.create_app(fake_ollama.config_from_args(args))
+        ollama_client.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake))
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    # Imported late: the app module mounts routers and static files at import
+    from ..main import app
+
+    rng = np.random.default_rng(args.seed)
+    population = Population(rng, args.users, args.zipf, args.sessions_mean)
+    # Keep the service's own logging off the report unless asked for; importing the app
+    # already configured the root logger, so only its level is overridden here
+    logging.getLogger().setLevel(args.log_level)
+
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        await connect(args, scratch_dir)
+        await embedding_cache.purge_stale()
+        seeded = await seed(population, args)
+        if settings.BACKGROUND_MEMORY_JOBS:
+            await memory_worker.start()
+
+        recorder = Recorder()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+            elapsed = await drive(client, population, args, recorder)
+
+        drain_s = None
+        if memory_worker.running:
+            start = time.perf_counter()
+            while memory_worker.backlog:
+                await asyncio.sleep(0.05)
+            drain_s = round(time.perf_counter() - start, 2)
+            await memory_worker.stop()
+        if settings.STORAGE_BACKEND == "mongo" and args.mongo_uri and not args.db_name:
+            await store.client.drop_database(settings.DB_NAME)
+        await store.close()
+
+    return build_report(recorder, elapsed, seeded, drain_s)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the API with local Ollama and Mongo stand-ins.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Skew of traffic across users")
+    parser.add_argument("--sessions-mean", type=float, default=4)
+    parser.add_argument("--messages-per-session", type=float, default=20)
+    parser.add_argument("--episodes-median", type=float, default=200)
+    parser.add_argument("--episodes-sigma", type=float, default=1.0)
+    parser.add_argument("--episodes-max", type=int, default=20000)
+    parser.add_argument("--history-days", type=float, default=90)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--duration", type=float, help="Run for this many seconds instead of --requests")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("chat=0.7,memory=0.2,aggregate=0.1"))
+    parser.add_argument("--mongo-uri", help="Use a real MongoDB (a throwaway database unless --db-name)")
+    parser.add_argument("--db-name")
+    parser.add_argument("--ollama-url", help="Use a real or standalone fake Ollama instead of the in-process one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON")
+    parser.add_argument("--log-level", default="ERROR", help="Level for the service's own log output")
+    fake_ollama.add_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
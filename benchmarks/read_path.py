@@ -0,0 +1,172 @@
+"""
+Per-request CPU of the memory read endpoints, and of the fast read path against the
+validate-then-dump path it replaced.
+
+Seeds one user with messages, summaries and session counters, then:
+  - requests GET /api/memory/{user_id} in-process and reports CPU time per request, rendered
+    fresh each time, served from the versioned response cache, and revalidated (304)
+  - decodes and renders that full snapshot both ways: pydantic validation + model_dump() +
+    jsonable_encoder + json, versus model_construct() + the fast encoder (orjson if installed)
+
+With the default Mongo backend it needs mongomock_motor for the in-process stand-in
+(pip install mongomock-motor); with STORAGE_BACKEND=sqlite it runs on a throwaway file:
+    python -m ai_memory_fastapi.benchmarks.read_path --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+
+from ..config import settings
+from ..models import Message, SessionState, Summary
+from ..responses import dumps, orjson, response_cache
+from ..storage.store import store
+
+USER_ID = "bench_user"
+SESSION_ID = "bench_session"
+
+
+async def connect(scratch_dir: str):
+    if settings.STORAGE_BACKEND == "sqlite":
+        await store.connect(path=os.path.join(scratch_dir, "bench.db"))
+        return
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        raise SystemExit("The in-process Mongo stand-in needs mongomock_motor (pip install mongomock-motor); "
+                         "or run with STORAGE_BACKEND=sqlite")
+    await store.connect(AsyncMongoMockClient())
+
+
+async def seed(messages: int):
+    now = datetime.utcnow() - timedelta(hours=1)
+    await store.save_messages_bulk([
+        Message(
+            user_id=USER_ID, session_id=SESSION_ID, role="user" if i % 2 == 0 else "assistant",
+            content=f"Message {i}: " + "a fairly ordinary chat turn about plans for the week " * 3,
+            created_at=now + timedelta(seconds=i)
+        )
+        for i in range(messages)
+    ])
+    await store.upsert_summary(Summary(user_id=USER_ID, session_id=SESSION_ID, scope="session", text="- " * 200))
+    await store.upsert_summary(Summary(user_id=USER_ID, scope="user", text="- " * 400))
+
+
+def cpu_per_call(fn: Callable[[], Any], iterations: int) -> float:
+    """Microseconds of process CPU per call."""
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) * 1e6 / iterations
+
+
+def codec_comparison(snapshot: Dict[str, Any], iterations: int) -> Dict[str, float]:
+    """Decodes and renders the same stored documents the old way and the fast way."""
+    message_docs = [dict(m.__dict__) for m in snapshot["messages"]]
+    summary_docs = [dict(s.__dict__) for s in snapshot["summaries"]]
+    state_doc = dict(snapshot["session_state"].__dict__)
+
+    def legacy():
+        messages = [Message(**doc) for doc in message_docs]
+        summaries = [Summary(**doc) for doc in summary_docs]
+        state = SessionState(**state_doc)
+        content = jsonable_encoder({
+            "messages": [m.model_dump() for m in messages],
+            "latest_session_summary": summaries[0].text,
+            "latest_lifetime_summary": summaries[1].text,
+            "episodic_facts": snapshot["episodic_facts"],
+            "session_state": state.model_dump(),
+        })
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    def fast():
+        messages = [Message.model_construct(**doc) for doc in message_docs]
+        summaries = [Summary.model_construct(**doc) for doc in summary_docs]
+        state = SessionState.model_construct(**state_doc)
+        return dumps({
+            "messages": messages,
+            "latest_session_summary": summaries[0].text,
+            "latest_lifetime_summary": summaries[1].text,
+            "episodic_facts": snapshot["episodic_facts"],
+            "session_state": state,
+        })
+
+    assert json.loads(legacy()) == json.loads(fast()), "fast path renders a different document"
+    return {"legacy_us": cpu_per_call(legacy, iterations), "fast_us": cpu_per_call(fast, iterations)}
+
+
+async def run(args: argparse.Namespace):
+    # Imported late: the app module mounts routers and static files at import
+    from ..main import app
+    from ..routers.introspect import get_memory_view
+    logging.getLogger().setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        await connect(scratch_dir)
+        try:
+            await seed(args.messages)
+            snapshot = {
+                "messages": await store.get_last_n_messages(USER_ID, None, 16),
+                "summaries": [
+                    await store.get_latest_summary(USER_ID, "session", SESSION_ID),
+                    await store.get_latest_summary(USER_ID, "user", None),
+                ],
+                "episodic_facts": [f"Synthetic fact {i}" for i in range(20)],
+                "session_state": await store.get_session_state(USER_ID, SESSION_ID),
+            }
+
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+                url = f"/api/memory/{USER_ID}"
+
+                async def per_request(headers: Dict[str, str], status: int = 200) -> float:
+                    start = time.process_time()
+                    for _ in range(args.requests):
+                        response = await client.get(url, params={"session_id": SESSION_ID}, headers=headers)
+                        assert response.status_code == status, response.status_code
+                    return (time.process_time() - start) * 1e6 / args.requests
+
+                max_entries, response_cache.max_entries = response_cache.max_entries, 0
+                await client.get(url, params={"session_id": SESSION_ID})  # Warm-up
+                endpoint_us = await per_request({})
+                response_cache.max_entries = max_entries
+                etag = (await client.get(url, params={"session_id": SESSION_ID})).headers["etag"]
+                cached_us = await per_request({})
+                not_modified_us = await per_request({"If-None-Match": etag}, 304)
+
+            start = time.process_time()
+            for _ in range(args.requests):
+                await get_memory_view(USER_ID, SESSION_ID)
+            introspect_us = (time.process_time() - start) * 1e6 / args.requests
+
+            codec = codec_comparison(snapshot, args.iterations)
+        finally:
+            await store.close()
+
+    print(f"backend: {settings.STORAGE_BACKEND}, encoder: {'orjson' if orjson else 'json'}")
+    print(f"GET /api/memory/{{user_id}}       {endpoint_us:9.1f} us CPU/request (includes the in-process HTTP client)")
+    print(f"  from the response cache        {cached_us:9.1f} us CPU/request")
+    print(f"  revalidated, 304               {not_modified_us:9.1f} us CPU/request")
+    print(f"introspect get_memory_view       {introspect_us:9.1f} us CPU/request (handler only)")
+    print(f"snapshot decode + render, legacy {codec['legacy_us']:9.1f} us")
+    print(f"snapshot decode + render, fast   {codec['fast_us']:9.1f} us "
+          f"({codec['legacy_us'] / codec['fast_us']:.1f}x less CPU)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200, help="Messages seeded into the session")
+    parser.add_argument("--requests", type=int, default=1000, help="Endpoint requests timed")
+    parser.add_argument("--iterations", type=int, default=5000, help="Decode/render rounds per variant")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,12 @@ import os
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
-    MONGO_URI: str
-    DB_NAME: str
+    LOG_LEVEL: str = "INFO"  # DEBUG logs every embedding, saved episode and retrieval
+    LOG_FORMAT: str = "text"  # "text" or "json" (one object per line)
+    STORAGE_BACKEND: str = "mongo"  # "mongo", or "sqlite" for an embedded single-node store
+    SQLITE_PATH: str = "ai_memory.db"  # Embeddings go in "<path>.vec<dim>.f32" next to it
+    MONGO_URI: str = "mongodb://localhost:27017"
+    DB_NAME: str = "ai_memory_db"
     OLLAMA_BASE_URL: str
     CHAT_MODEL: str
     EMBED_MODEL: str
@@ -11,6 +15,71 @@ class Settings(BaseSettings):
     SUMMARIZE_EVERY_USER_MSGS: int
     EPISODE_EXTRACTION_LIMIT: int
     EPISODE_RETRIEVAL_K: int
+    EPISODE_INDEX_MAX_BYTES: int = 256 * 1024 * 1024  # In-memory episode index budget across all users
+    BACKGROUND_MEMORY_JOBS: bool = True  # Run extraction/summarization off the chat request path
+    # Without background jobs, overlap a turn's fact extraction with retrieval and reply generation
+    PIPELINED_EXTRACTION: bool = True
+    MEMORY_WORKERS: int = 2
+    MEMORY_QUEUE_MAXSIZE: int = 1000
+    MEMORY_JOB_MAX_ATTEMPTS: int = 3
+    MEMORY_JOB_LEASE_SECONDS: int = 300
+    MEMORY_JOB_POLL_SECONDS: int = 30
+    EMBED_BATCH_MAX_SIZE: int = 32  # Texts per upstream /api/embed call
+    EMBED_BATCH_MAX_WAIT_MS: float = 5.0  # How long a request waits for others to join its batch
+    EMBED_CACHE_SIZE: int = 10000  # In-process LRU entries
+    EMBED_CACHE_PERSIST: bool = True  # Second level in the Mongo embedding_cache collection
+    # Write-through windows of each session's newest SHORT_TERM_N * 2 messages, for this many
+    # sessions (LRU); assumes a session's turns reach one app process. 0 disables
+    SESSION_WINDOW_MAX_SESSIONS: int = 10000
+    RESPONSE_CACHE_SIZE: int = 5000  # Rendered memory/aggregate views kept in-process per version; 0 disables
+    # Per-source deadlines for chat context assembly; a late source is left out of the prompt
+    CONTEXT_SHORT_TERM_TIMEOUT_MS: int = 500
+    CONTEXT_SUMMARY_TIMEOUT_MS: int = 500
+    CONTEXT_EMBEDDING_TIMEOUT_MS: int = 2000
+    CONTEXT_EPISODES_TIMEOUT_MS: int = 500
+    PROMPT_TOKEN_BUDGET: int = 4096  # Estimated tokens for the packed chat prompt
+    PROMPT_LIFETIME_SUMMARY_TOKENS: int = 512  # Fixed cap for the lifetime summary, reserved from the budget
+    PROMPT_SESSION_SUMMARY_TOKENS: int = 384  # Fixed cap for the session summary, reserved from the budget
+    LIFETIME_MERGE_BATCH: int = 8  # Max summaries folded into a rollup per LLM call
+    # Approximate nearest-neighbor (IVF-flat) episode search for large users; empty dir disables it
+    ANN_INDEX_DIR: str = ""
+    ANN_MIN_EPISODES: int = 20000  # Below this, exact in-memory search is used
+    ANN_NPROBE: int = 8  # Inverted lists scanned per query: higher = better recall, more latency
+    ANN_REBUILD_DELTA_FRACTION: float = 0.2  # Rebuild once incremental inserts exceed this share
+    ANN_RETIRED_GRACE_SECONDS: float = 300.0  # How long a superseded index version stays on disk for readers
+    # Ollama client: extra backends (comma-separated, used alongside OLLAMA_BASE_URL), pooling, limits, retries
+    OLLAMA_BASE_URLS: str = ""
+    OLLAMA_MAX_CONNECTIONS: int = 100
+    OLLAMA_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    OLLAMA_KEEPALIVE_EXPIRY: float = 30.0  # Seconds an idle pooled connection is kept
+    OLLAMA_CHAT_CONCURRENCY: int = 4  # In-flight chat generations across all backends
+    OLLAMA_EMBED_CONCURRENCY: int = 16  # In-flight embedding calls across all backends
+    OLLAMA_MAX_RETRIES: int = 2  # Extra attempts on connection errors, timeouts and 429/5xx
+    OLLAMA_RETRY_BACKOFF_MS: float = 200.0  # Base delay, doubled per attempt with +-50% jitter
+    OLLAMA_HEDGE_DELAY_MS: float = 0.0  # With several backends, re-send a slow call after this; 0 disables
+    # Calls beyond the concurrency caps queue by priority (reply > query embedding > extraction >
+    # summarization); a full queue sheds its least important waiter, or turns the call away (0: no bound)
+    LLM_CHAT_QUEUE_MAX: int = 64  # Calls waiting for a chat slot
+    LLM_EMBED_QUEUE_MAX: int = 256  # Calls waiting for an embedding slot
+    CHAT_USER_RATE_PER_MINUTE: float = 30.0  # Chat turns per user per minute, token-bucket refill (0: no limit)
+    CHAT_USER_BURST: int = 10  # Turns a user can send back to back before the rate applies
+    # Near-duplicate episodes: a new fact this similar (cosine) to an existing one is merged into it; >1 disables
+    EPISODE_DEDUP_THRESHOLD: float = 0.92
+    EPISODE_DEDUP_IMPORTANCE_BOOST: float = 0.05  # Added to the kept episode's importance per merge
+    EPISODE_COMPACTION_INTERVAL_SECONDS: int = 3600  # Background compaction + retention of recently active users; 0 disables
+    # Episode retention: live search scans a bounded hot set per user; the rest is demoted to a cold tier
+    EPISODE_HOT_MAX: int = 5000  # Hot episodes kept per user; 0 keeps everything hot
+    EPISODE_HOT_MIN_AGE_DAYS: float = 7.0  # Younger episodes are never demoted
+    RETENTION_IMPORTANCE_WEIGHT: float = 1.0
+    RETENTION_RECENCY_WEIGHT: float = 1.0  # Recency decays from the last create/restate/retrieval
+    RETENTION_RECENCY_HALF_LIFE_DAYS: float = 30.0
+    RETENTION_HITS_WEIGHT: float = 1.0  # Saturating credit for retrieval hits
+    RETENTION_HITS_HALF: float = 3.0  # Hits that earn half of RETENTION_HITS_WEIGHT
+    EPISODE_COLD_SEARCH_THRESHOLD: float = 0.5  # Search cold too when the best hot match is below this; 0 = on demand only
+    EPISODE_COLD_INDEX_MAX_BYTES: int = 32 * 1024 * 1024  # In-memory budget for cold indexes loaded by such searches
+    INGEST_BATCH_SIZE: int = 1000  # Messages per insert_many during bulk import
+    EXPORT_BATCH_SIZE: int = 500  # Records per cursor batch / write batch when exporting or restoring a user
+    BACKFILL_CONCURRENCY: int = 4  # Sessions processed in parallel by the import backfill
 
     class Config:
         # Construct the absolute path to the .env file
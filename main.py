@@ -1,11 +1,22 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
+import logging
 import os
 
-# Import your Mongo manager and routers
-from ai_memory_fastapi.mongoimpl.mongo import mongo_manager
-from ai_memory_fastapi.routers import chat, memory, aggregate
+# Import the storage backend and routers
+from ai_memory_fastapi.config import settings
+from ai_memory_fastapi.logging_config import configure_logging
+from ai_memory_fastapi.storage.store import store
+from ai_memory_fastapi.routers import chat, memory, aggregate, ingest, export, stats, metrics
+from ai_memory_fastapi.services.embeddings import embedding_cache
+from ai_memory_fastapi.services.llm_scheduler import LLMOverloaded
+from ai_memory_fastapi.services.memory_worker import memory_worker
+from ai_memory_fastapi.services.ollama_client import ollama_client
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 
 # ------------------------------
@@ -13,10 +24,18 @@ from ai_memory_fastapi.routers import chat, memory, aggregate
 # ------------------------------
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Handles MongoDB connection setup and teardown."""
-    await mongo_manager.connect_to_mongo()
+    """Handles storage connection and background memory worker setup and teardown."""
+    await store.connect()
+    purged = await embedding_cache.purge_stale()
+    if purged:
+        logger.info("Dropped %d cached embeddings from a previous EMBED_MODEL.", purged)
+    if settings.BACKGROUND_MEMORY_JOBS:
+        await memory_worker.start()
     yield
-    await mongo_manager.close_mongo_connection()
+    if memory_worker.running:
+        await memory_worker.stop()
+    await store.close()
+    await ollama_client.close()
 
 
 # ------------------------------
@@ -25,12 +44,26 @@ async def lifespan(app: FastAPI):
 app = FastAPI(lifespan=lifespan, title="AI Memory FastAPI")
 
 
+@app.exception_handler(LLMOverloaded)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloaded):
+    """Rate-limited or shed chat turns: 429 with a Retry-After hint."""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 # ------------------------------
 # Include Routers
 # ------------------------------
 app.include_router(chat.router, prefix="/api/chat", tags=["Chat"])
 app.include_router(memory.router, prefix="/api/memory", tags=["Memory"])  # ← Updated prefix
 app.include_router(aggregate.router, prefix="/api/aggregate", tags=["Aggregate"])
+app.include_router(ingest.router, prefix="/api/ingest", tags=["Ingest"])
+app.include_router(export.router, prefix="/api/export", tags=["Export"])
+app.include_router(stats.router, prefix="/api/stats", tags=["Stats"])
+app.include_router(metrics.router, prefix="/metrics", tags=["Metrics"])
 app.mount("/static", StaticFiles(directory=os.path.join(os.path.dirname(__file__), "static")), name="static")
 
 
@@ -43,7 +76,13 @@ async def root():
         "message": "Welcome to AI Memory FastAPI! 🚀",
         "routes": [
             "/api/chat",
+            "/api/chat/stream",
             "/api/memory/{user_id}",
-            "/api/aggregate/{user_id}"
+            "/api/aggregate/{user_id}",
+            "/api/ingest",
+            "/api/export/{user_id}",
+            "/api/export/restore",
+            "/api/stats",
+            "/metrics"
         ]
     }
\ No newline at end of file
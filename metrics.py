@@ -0,0 +1,250 @@
+"""
+Minimal in-process Prometheus metrics (text exposition format 0.0.4), with no client library.
+
+Metrics are module-level singletons updated on the hot path with a dict lookup and an add;
+gauges that mirror existing state (index sizes, queue depth) are read via callbacks at
+scrape time instead of being kept in sync.
+"""
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; spans in-process index lookups up to slow LLM generations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Gauge(Metric):
+    """
+    Reads its value(s) from a callback at scrape time: a number, or {label value: number}
+    (a tuple of label values with several labelnames).
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], object], labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def samples(self):
+        value = self.callback()
+        if isinstance(value, dict):
+            for label_value, number in sorted(value.items()):
+                values = label_value if isinstance(label_value, tuple) else (label_value,)
+                yield f"{self.name}{_labels(self.labelnames, values)} {_number(number)}"
+        elif value is not None:
+            yield f"{self.name} {_number(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _number(bound)))} {cumulative}"
+            yield f"{self.name}_bucket{_labels(self.labelnames, key, ('le', '+Inf'))} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        parts = []
+        for metric in self._metrics.values():
+            try:
+                parts.append(metric.render())
+            except Exception:
+                # A failing gauge callback must not take the whole scrape down
+                continue
+        return "\n".join(parts) + "\n"
+
+
+registry = Registry()
+
+# ------------------------------------------------------------------
+# Request pipeline
+# ------------------------------------------------------------------
+STAGE_SECONDS = registry.register(Histogram(
+    "ai_memory_stage_seconds",
+    "Duration of chat pipeline and memory maintenance stages.",
+    ["stage"]
+))
+CHAT_REQUEST_SECONDS = registry.register(Histogram(
+    "ai_memory_chat_request_seconds",
+    "End-to-end chat request duration.",
+    ["endpoint"]
+))
+CHAT_SIDE_TASK_FAILURES = registry.register(Counter(
+    "ai_memory_chat_side_task_failures_total",
+    "Side branches of pipelined chat turns (e.g. fact extraction) that failed.",
+    ["task"]
+))
+CONTEXT_MISSES = registry.register(Counter(
+    "ai_memory_context_source_misses_total",
+    "Context sources left out of a prompt because they timed out or failed.",
+    ["source"]
+))
+
+# ------------------------------------------------------------------
+# Ollama
+# ------------------------------------------------------------------
+OLLAMA_REQUESTS = registry.register(Counter(
+    "ai_memory_ollama_requests_total",
+    "Ollama HTTP calls by backend, endpoint and outcome.",
+    ["backend", "endpoint", "outcome"]
+))
+OLLAMA_SECONDS = registry.register(Histogram(
+    "ai_memory_ollama_request_seconds",
+    "Ollama HTTP call duration.",
+    ["endpoint"]
+))
+OLLAMA_RETRIES = registry.register(Counter(
+    "ai_memory_ollama_retries_total",
+    "Ollama calls retried after a transient error.",
+    ["endpoint"]
+))
+OLLAMA_HEDGES = registry.register(Counter(
+    "ai_memory_ollama_hedges_total",
+    "Hedged Ollama calls, and how many the hedge won.",
+    ["result"]
+))
+LLM_QUEUE_WAIT_SECONDS = registry.register(Histogram(
+    "ai_memory_llm_queue_wait_seconds",
+    "Time LLM calls waited for a chat or embedding slot, by pool and priority.",
+    ["pool", "priority"]
+))
+LLM_REJECTIONS = registry.register(Counter(
+    "ai_memory_llm_rejections_total",
+    "LLM calls and chat turns turned away: rate_limited, queue_full, or shed from a full queue.",
+    ["pool", "priority", "reason"]
+))
+LLM_TOKENS = registry.register(Counter(
+    "ai_memory_llm_tokens_total",
+    "Tokens processed by the chat model, as reported by Ollama.",
+    ["kind"]
+))
+
+# ------------------------------------------------------------------
+# Episodes
+# ------------------------------------------------------------------
+EPISODE_MERGES = registry.register(Counter(
+    "ai_memory_episode_merges_total",
+    "Near-duplicate episodes folded into an existing one, at write time or by compaction.",
+    ["path"]
+))
+
+EPISODE_TIER_MOVES = registry.register(Counter(
+    "ai_memory_episode_tier_moves_total",
+    "Episodes demoted to the cold tier by retention, or promoted back by a retrieval hit.",
+    ["direction"]
+))
+COLD_EPISODE_SEARCHES = registry.register(Counter(
+    "ai_memory_cold_episode_searches_total",
+    "Similarity searches that also scanned the cold tier, by what triggered them.",
+    ["trigger"]
+))
+
+# ------------------------------------------------------------------
+# Caches
+# ------------------------------------------------------------------
+EMBEDDING_CACHE_LOOKUPS = registry.register(Counter(
+    "ai_memory_embedding_cache_lookups_total",
+    "Embedding cache lookups by result.",
+    ["result"]
+))
+SESSION_WINDOW_LOOKUPS = registry.register(Counter(
+    "ai_memory_session_window_lookups_total",
+    "Short-term session window reads by result (hit, or miss and cold load).",
+    ["result"]
+))
+RESPONSE_CACHE_LOOKUPS = registry.register(Counter(
+    "ai_memory_response_cache_lookups_total",
+    "Versioned response cache lookups by result (hit, miss, not_modified).",
+    ["result"]
+))
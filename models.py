@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, Field
 
 class Message(BaseModel):
@@ -9,11 +9,23 @@ class Message(BaseModel):
     content: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class SessionState(BaseModel):
+    """Per-session counters, maintained atomically on every saved message."""
+    user_id: str
+    session_id: str
+    user_messages: int = 0
+    assistant_messages: int = 0
+    last_summarized_user_messages: int = 0 # user_messages when the last session summary was triggered
+    last_activity_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow) # When the session started (its earliest message)
+
 class Summary(BaseModel):
     user_id: str
     session_id: Optional[str] = None # Nullable for lifetime summary
-    scope: str # "session" or "user"
+    scope: str # "session" or "user" (lifetime)
     text: str
+    period: Optional[str] = None # "YYYY-MM" on monthly rollups written by older versions
+    watermark: Optional[datetime] = None # Newest source summary already folded into a rollup
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Episode(BaseModel):
@@ -23,27 +35,62 @@ class Episode(BaseModel):
     importance: float # 0.0 to 1.0
     embedding: List[float]
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_seen_at: Optional[datetime] = None  # Last time a near-duplicate was merged in
+    seen_count: int = 1  # How many times the fact was stated, merged duplicates included
+    retrieval_hits: int = 0  # Times the episode made it into a chat prompt
+    last_retrieved_at: Optional[datetime] = None
 
 class ChatRequest(BaseModel):
     user_id: str
     session_id: Optional[str] = None
     message: str
+    search_cold_memory: bool = False  # Also search episodes demoted to the cold tier
 
 class ChatResponse(BaseModel):
     assistant_reply: str
     short_term_messages_count: int
     long_term_summary_text: Optional[str] = None
     episodic_facts_retrieved: List[str]
+    context_latency_ms: Dict[str, float] = Field(default_factory=dict)  # Per memory source
+    missed_context_sources: List[str] = Field(default_factory=list)  # Timed out or failed
+    prompt_tokens: Optional[int] = None  # Estimated size of the packed prompt
+    side_task_errors: Dict[str, str] = Field(default_factory=dict)  # Failed side branches of a pipelined turn
+
+class MemoryContext(BaseModel):
+    """Memory gathered for a prompt, with per-source latency and any sources left out."""
+    short_term_messages: List[Message] = Field(default_factory=list)
+    latest_session_summary: Optional[Summary] = None
+    latest_lifetime_summary: Optional[Summary] = None
+    episodic_facts: List[str] = Field(default_factory=list)
+    latency_ms: Dict[str, float] = Field(default_factory=dict)
+    missed_sources: List[str] = Field(default_factory=list)
+
+class ChatTurn(BaseModel):
+    """Everything gathered for one chat turn before the reply is generated."""
+    user_id: str
+    session_id: str
+    user_message: Message
+    short_term_messages: List[Message]
+    latest_session_summary: Optional[Summary] = None
+    latest_lifetime_summary: Optional[Summary] = None
+    episodic_facts: List[str]
+    prompt: List[Dict]
+    context_latency_ms: Dict[str, float] = Field(default_factory=dict)
+    missed_context_sources: List[str] = Field(default_factory=list)
+    side_tasks: Dict[str, Any] = Field(default_factory=dict, exclude=True)  # name -> asyncio.Task
+    side_task_errors: Dict[str, str] = Field(default_factory=dict)
 
 class MemoryViewResponse(BaseModel):
     last_messages: List[Message]
     latest_session_summary: Optional[Summary] = None
     latest_lifetime_summary: Optional[Summary] = None
     last_episodic_facts: List[str]
+    session_state: Optional[SessionState] = None
 
 class DailyMessageCount(BaseModel):
     date: str
     count: int
+    by_role: Dict[str, int] = Field(default_factory=dict)
 
 class AggregateResponse(BaseModel):
     daily_message_counts: List[DailyMessageCount]
@@ -0,0 +1,25 @@
+from typing import List, Union
+from bson.binary import Binary
+import numpy as np
+
+# Embeddings are stored as little-endian float32 blobs, L2-normalized at write time
+EMBEDDING_DTYPE = np.dtype("<f4")
+
+
+def encode_embedding(embedding: Union[List[float], np.ndarray], normalize: bool = True) -> Binary:
+    """Packs an embedding into a float32 BSON Binary, normalized unless asked otherwise."""
+    vec = np.asarray(embedding, dtype=EMBEDDING_DTYPE)
+    norm = float(np.linalg.norm(vec))
+    if normalize and norm > 0:
+        vec = vec / norm
+    return Binary(vec.astype(EMBEDDING_DTYPE, copy=False).tobytes())
+
+
+def decode_embedding(raw) -> np.ndarray:
+    """
+    Returns a float32 view over a stored embedding.
+    Binary blobs decode zero-copy; legacy BSON arrays of doubles are converted.
+    """
+    if isinstance(raw, (bytes, bytearray, memoryview)):
+        return np.frombuffer(raw, dtype=EMBEDDING_DTYPE)
+    return np.asarray(raw, dtype=EMBEDDING_DTYPE)
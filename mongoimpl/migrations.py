@@ -0,0 +1,151 @@
+"""
+One-shot data migrations.
+
+Run from the directory containing the package:
+    python -m ai_memory_fastapi.mongoimpl.migrations <migration>
+"""
+import argparse
+import asyncio
+from pymongo import UpdateOne
+
+from ..config import settings
+from ..logging_config import configure_logging
+from .codec import encode_embedding
+from .mongo import MongoManager
+
+# Migrations operate on Mongo collections directly, whatever STORAGE_BACKEND says
+mongo_manager = MongoManager()
+
+
+async def migrate_episode_embeddings(batch_size: int = 500) -> int:
+    """Rewrites legacy array-of-doubles episode embeddings as normalized float32 Binary blobs."""
+    converted = 0
+    cursor = mongo_manager.db.episodes.find(
+        {"embedding": {"$type": "array"}}, {"embedding": 1}
+    ).batch_size(batch_size)
+
+    batch = []
+    async for doc in cursor:
+        batch.append(UpdateOne(
+            {"_id": doc["_id"], "embedding": {"$type": "array"}},
+            {"$set": {"embedding": encode_embedding(doc["embedding"])}}
+        ))
+        if len(batch) >= batch_size:
+            result = await mongo_manager.db.episodes.bulk_write(batch, ordered=False)
+            converted += result.modified_count
+            batch = []
+    if batch:
+        result = await mongo_manager.db.episodes.bulk_write(batch, ordered=False)
+        converted += result.modified_count
+
+    return converted
+
+
+async def backfill_session_states(batch_size: int = 500) -> int:
+    """
+    Builds per-session state documents from existing messages.
+    The summarize watermark is set to the last multiple of SUMMARIZE_EVERY_USER_MSGS,
+    which keeps the old every-N-messages cadence.
+    """
+    every = max(1, settings.SUMMARIZE_EVERY_USER_MSGS)
+    pipeline = [
+        {"$match": {"session_id": {"$ne": None}}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "session_id": "$session_id"},
+            "user_messages": {"$sum": {"$cond": [{"$eq": ["$role", "user"]}, 1, 0]}},
+            "assistant_messages": {"$sum": {"$cond": [{"$eq": ["$role", "assistant"]}, 1, 0]}},
+            "first_activity_at": {"$min": "$created_at"},
+            "last_activity_at": {"$max": "$created_at"},
+        }},
+    ]
+
+    updated = 0
+    batch = []
+    async for row in mongo_manager.db.messages.aggregate(pipeline, allowDiskUse=True):
+        batch.append(UpdateOne(
+            {"user_id": row["_id"]["user_id"], "session_id": row["_id"]["session_id"]},
+            {
+                "$set": {
+                    "user_messages": row["user_messages"],
+                    "assistant_messages": row["assistant_messages"],
+                    "last_summarized_user_messages": row["user_messages"] - row["user_messages"] % every,
+                    "last_activity_at": row["last_activity_at"],
+                },
+                "$setOnInsert": {"created_at": row["first_activity_at"]},
+            },
+            upsert=True
+        ))
+        if len(batch) >= batch_size:
+            result = await mongo_manager.db.sessions.bulk_write(batch, ordered=False)
+            updated += result.upserted_count + result.modified_count
+            batch = []
+    if batch:
+        result = await mongo_manager.db.sessions.bulk_write(batch, ordered=False)
+        updated += result.upserted_count + result.modified_count
+
+    return updated
+
+
+async def backfill_daily_activity(batch_size: int = 500) -> int:
+    """
+    Rebuilds the per-user, per-day, per-session activity rollups from existing messages.
+    Counters are overwritten, so run it while no messages are being written.
+    """
+    pipeline = [
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "session_id": "$session_id",
+                "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                "role": "$role",
+            },
+            "count": {"$sum": 1},
+        }},
+        {"$group": {
+            "_id": {"user_id": "$_id.user_id", "session_id": "$_id.session_id", "date": "$_id.date"},
+            "roles": {"$push": {"k": "$_id.role", "v": "$count"}},
+            "total": {"$sum": "$count"},
+        }},
+    ]
+
+    updated = 0
+    batch = []
+    async for row in mongo_manager.db.messages.aggregate(pipeline, allowDiskUse=True):
+        batch.append(UpdateOne(
+            row["_id"],
+            {"$set": {"roles": {r["k"]: r["v"] for r in row["roles"]}, "total": row["total"]}},
+            upsert=True
+        ))
+        if len(batch) >= batch_size:
+            result = await mongo_manager.db.daily_activity.bulk_write(batch, ordered=False)
+            updated += result.upserted_count + result.modified_count
+            batch = []
+    if batch:
+        result = await mongo_manager.db.daily_activity.bulk_write(batch, ordered=False)
+        updated += result.upserted_count + result.modified_count
+
+    return updated
+
+
+MIGRATIONS = {
+    "episode-embeddings": migrate_episode_embeddings,
+    "session-states": backfill_session_states,
+    "daily-activity": backfill_daily_activity,
+}
+
+
+async def run(name: str):
+    await mongo_manager.connect()
+    try:
+        count = await MIGRATIONS[name]()
+        print(f"Migration '{name}' updated {count} documents.")
+    finally:
+        await mongo_manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a one-shot data migration.")
+    parser.add_argument("migration", choices=sorted(MIGRATIONS))
+    args = parser.parse_args()
+    configure_logging()
+    asyncio.run(run(args.migration))
@@ -1,21 +1,37 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ASCENDING, DESCENDING
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
 from ..config import settings
-from ..models import Message, Summary, Episode
-from typing import List, Optional
+from ..models import Message, SessionState, Summary, Episode
+from ..storage.base import MemoryStore
+from .codec import encode_embedding, decode_embedding
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import logging
 import numpy as np
 
-class MongoManager:
+logger = logging.getLogger(__name__)
+
+# Read projections: exactly the model fields, so trusted documents decode with model_construct()
+MESSAGE_FIELDS = {"_id": 0, **dict.fromkeys(Message.model_fields, 1)}
+SESSION_FIELDS = {"_id": 0, **dict.fromkeys(SessionState.model_fields, 1)}
+SUMMARY_FIELDS = {"_id": 0, **dict.fromkeys(Summary.model_fields, 1)}
+
+class MongoManager(MemoryStore):
+    """MongoDB backend (motor). Episode embeddings are stored inline as float32 Binary blobs."""
     client: AsyncIOMotorClient = None
     db = None
 
     # ------------------------------------------------------------------
     # Connection Management
     # ------------------------------------------------------------------
-    async def connect_to_mongo(self):
-        self.client = AsyncIOMotorClient(settings.MONGO_URI)
+    async def connect(self, client: Optional[AsyncIOMotorClient] = None):
+        """Connects to MONGO_URI, or adopts a given motor-compatible client (e.g. an in-process stand-in)."""
+        self.client = client or AsyncIOMotorClient(settings.MONGO_URI)
         self.db = self.client[settings.DB_NAME]
-        print(f"Connected to MongoDB: {settings.DB_NAME}")
+        logger.info("Connected to MongoDB: %s", settings.DB_NAME)
 
         # Ensure indexes for efficient querying
         await self.db.messages.create_index([
@@ -23,42 +39,226 @@ class MongoManager:
             ("session_id", ASCENDING),
             ("created_at", DESCENDING)
         ])
+        await self.db.sessions.create_index(
+            [("user_id", ASCENDING), ("session_id", ASCENDING)],
+            unique=True
+        )
+        await self.db.daily_activity.create_index(
+            [("user_id", ASCENDING), ("date", ASCENDING), ("session_id", ASCENDING)],
+            unique=True
+        )
         await self.db.summaries.create_index([
             ("user_id", ASCENDING),
             ("session_id", ASCENDING),
             ("scope", ASCENDING),
             ("created_at", DESCENDING)
         ])
+        await self.db.summaries.create_index([
+            ("user_id", ASCENDING),
+            ("scope", ASCENDING),
+            ("period", ASCENDING),
+            ("created_at", ASCENDING)
+        ])
         await self.db.episodes.create_index([
             ("user_id", ASCENDING),
             ("session_id", ASCENDING),
             ("created_at", DESCENDING)
         ])
+        # Demoted by the retention policy; only loaded for cold searches
+        await self.db.episodes_cold.create_index([("user_id", ASCENDING)])
+        await self.db.jobs.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+        await self.db.backfill_tasks.create_index(
+            [("run_id", ASCENDING), ("kind", ASCENDING), ("user_id", ASCENDING), ("session_id", ASCENDING)],
+            unique=True
+        )
+        await self.db.backfill_tasks.create_index([("run_id", ASCENDING), ("status", ASCENDING)])
+        # At most one queued job per dedup key; running jobs don't block a fresh one
+        await self.db.jobs.create_index(
+            "dedup_key",
+            unique=True,
+            partialFilterExpression={"status": "queued", "dedup_key": {"$exists": True}}
+        )
+        await self.db.embedding_cache.create_index(
+            [("model", ASCENDING), ("hash", ASCENDING)],
+            unique=True
+        )
 
-    async def close_mongo_connection(self):
+    async def close(self):
         self.client.close()
-        print("MongoDB connection closed.")
+        logger.info("MongoDB connection closed.")
+
+    @property
+    def connected(self) -> bool:
+        return self.db is not None
 
     # ------------------------------------------------------------------
     # Message Operations
     # ------------------------------------------------------------------
-    async def save_message(self, message: Message):
+    async def _save_message(self, message: Message) -> Optional[SessionState]:
+        """
+        Stores the message, then bumps its session's counters, its daily activity rollup and
+        the user's memory version in one concurrent round-trip. Returns the updated session state.
+        """
         await self.db.messages.insert_one(message.model_dump())
+        rollup = self.db.daily_activity.update_one(
+            *self._daily_activity_update(
+                message.user_id, message.session_id, message.created_at.strftime("%Y-%m-%d"), {message.role: 1}
+            ),
+            upsert=True
+        )
+        bump = self._bump_memory_versions([message.user_id])
+        if not message.session_id:
+            await asyncio.gather(rollup, bump)
+            return None
+
+        doc, _, _ = await asyncio.gather(
+            self.db.sessions.find_one_and_update(
+                {"user_id": message.user_id, "session_id": message.session_id},
+                {
+                    "$inc": {f"{message.role}_messages": 1},
+                    "$max": {"last_activity_at": message.created_at},
+                    "$min": {"created_at": message.created_at},  # Session start: its earliest message
+                    "$setOnInsert": {"last_summarized_user_messages": 0}
+                },
+                projection=SESSION_FIELDS,
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            ),
+            rollup,
+            bump
+        )
+        return SessionState.model_construct(**doc)
+
+    @staticmethod
+    def _daily_activity_update(user_id: str, session_id: Optional[str], day: str, role_counts: Dict[str, int]):
+        """Filter and $inc update for one (user, YYYY-MM-DD day, session) activity counter document."""
+        return (
+            {"user_id": user_id, "date": day, "session_id": session_id},
+            {"$inc": {
+                "total": sum(role_counts.values()),
+                **{f"roles.{role}": count for role, count in role_counts.items()}
+            }}
+        )
+
+    async def _save_messages_bulk(self, messages: List[Message]) -> int:
+        """
+        Bulk-loads messages with an unordered insert_many, then applies the matching session
+        counter increments, daily rollups and memory version bumps concurrently.
+        """
+        if not messages:
+            return 0
+        result = await self.db.messages.insert_many([m.model_dump() for m in messages], ordered=False)
+
+        increments: Dict[tuple, Dict[str, Any]] = {}
+        for m in messages:
+            if not m.session_id:
+                continue
+            entry = increments.setdefault(
+                (m.user_id, m.session_id), {"counts": {}, "first": m.created_at, "last": m.created_at}
+            )
+            field = f"{m.role}_messages"
+            entry["counts"][field] = entry["counts"].get(field, 0) + 1
+            entry["first"] = min(entry["first"], m.created_at)
+            entry["last"] = max(entry["last"], m.created_at)
+
+        operations = [
+            UpdateOne(
+                {"user_id": user_id, "session_id": session_id},
+                {
+                    "$inc": entry["counts"],
+                    "$max": {"last_activity_at": entry["last"]},
+                    "$min": {"created_at": entry["first"]},
+                    "$setOnInsert": {"last_summarized_user_messages": 0}
+                },
+                upsert=True
+            )
+            for (user_id, session_id), entry in increments.items()
+        ]
+        writes = [self._bump_memory_versions(list({m.user_id for m in messages}))]
+        if operations:
+            writes.append(self.db.sessions.bulk_write(operations, ordered=False))
+
+        daily: Dict[tuple, Dict[str, int]] = {}
+        for m in messages:
+            roles = daily.setdefault((m.user_id, m.session_id, m.created_at.strftime("%Y-%m-%d")), {})
+            roles[m.role] = roles.get(m.role, 0) + 1
+        writes.append(self.db.daily_activity.bulk_write([
+            UpdateOne(*self._daily_activity_update(user_id, session_id, day, roles), upsert=True)
+            for (user_id, session_id, day), roles in daily.items()
+        ], ordered=False))
+        await asyncio.gather(*writes)
+        return len(result.inserted_ids)
+
+    async def get_daily_activity(self, user_id: str, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Per-day message counts (total, by role, sessions active) from the rollup collection.
+        `start` and `end` are inclusive YYYY-MM-DD bounds. Cost is O(days x sessions), not O(messages).
+        """
+        query: Dict[str, Any] = {"user_id": user_id}
+        if start or end:
+            query["date"] = {}
+            if start:
+                query["date"]["$gte"] = start
+            if end:
+                query["date"]["$lte"] = end
+
+        days: Dict[str, Dict[str, Any]] = {}
+        cursor = self.db.daily_activity.find(query, {"_id": 0, "user_id": 0}).sort("date", ASCENDING)
+        async for doc in cursor:
+            day = days.setdefault(doc["date"], {"date": doc["date"], "count": 0, "by_role": {}, "sessions": 0})
+            day["count"] += doc.get("total", 0)
+            day["sessions"] += 1
+            for role, count in doc.get("roles", {}).items():
+                day["by_role"][role] = day["by_role"].get(role, 0) + count
+        return list(days.values())
+
+    async def get_session_messages(self, user_id: str, session_id: str, role: str, skip: int, limit: int) -> List[Message]:
+        """Oldest-first page of one role's messages in a session."""
+        cursor = self.db.messages.find(
+            {"user_id": user_id, "session_id": session_id, "role": role}, MESSAGE_FIELDS
+        ).sort("created_at", ASCENDING).skip(skip).limit(limit)
+        return [Message.model_construct(**doc) async for doc in cursor]
 
-    async def get_last_n_messages(self, user_id: str, session_id: Optional[str], n: int) -> List[Message]:
+    async def _get_last_n_messages(self, user_id: str, session_id: Optional[str], n: int) -> List[Message]:
         query = {"user_id": user_id}
         if session_id:
             query["session_id"] = session_id
         
-        cursor = self.db.messages.find(query).sort("created_at", DESCENDING).limit(n)
-        return [Message(**doc) async for doc in cursor]
+        cursor = self.db.messages.find(query, MESSAGE_FIELDS).sort("created_at", DESCENDING).limit(n)
+        return [Message.model_construct(**doc) async for doc in cursor]
 
-    async def count_user_messages_in_session(self, user_id: str, session_id: str) -> int:
-        return await self.db.messages.count_documents({
-            "user_id": user_id,
-            "session_id": session_id,
-            "role": "user"
-        })
+    async def get_session_state(self, user_id: str, session_id: str) -> Optional[SessionState]:
+        doc = await self.db.sessions.find_one({"user_id": user_id, "session_id": session_id}, SESSION_FIELDS)
+        return SessionState.model_construct(**doc) if doc else None
+
+    async def claim_session_summary(self, state: SessionState, every: int) -> bool:
+        """
+        Compare-and-set on the session's summarize watermark. Returns True for exactly one
+        caller once `every` user messages have accumulated since the last summary trigger.
+        """
+        if state.user_messages - state.last_summarized_user_messages < every:
+            return False
+        result = await self.db.sessions.update_one(
+            {
+                "user_id": state.user_id,
+                "session_id": state.session_id,
+                "last_summarized_user_messages": state.last_summarized_user_messages
+            },
+            {"$set": {"last_summarized_user_messages": state.user_messages}}
+        )
+        return result.modified_count == 1
+
+    # ------------------------------------------------------------------
+    # Memory Versions (response cache invalidation)
+    # ------------------------------------------------------------------
+    async def get_memory_version(self, user_id: str) -> int:
+        doc = await self.db.memory_versions.find_one({"_id": user_id})
+        return doc["version"] if doc else 0
+
+    async def _bump_memory_versions(self, user_ids: List[str]):
+        await self.db.memory_versions.bulk_write([
+            UpdateOne({"_id": user_id}, {"$inc": {"version": 1}}, upsert=True) for user_id in user_ids
+        ], ordered=False)
 
     # ------------------------------------------------------------------
     # Summary Operations
@@ -67,11 +267,12 @@ class MongoManager:
         query = {"user_id": summary.user_id, "scope": summary.scope}
         if summary.session_id:
             query["session_id"] = summary.session_id
-        
-        await self.db.summaries.update_one(
-            query,
-            {"$set": summary.model_dump()},
-            upsert=True
+        if summary.period:
+            query["period"] = summary.period
+
+        await asyncio.gather(
+            self.db.summaries.update_one(query, {"$set": summary.model_dump()}, upsert=True),
+            self._bump_memory_versions([summary.user_id])
         )
 
     async def get_latest_summary(self, user_id: str, scope: str, session_id: Optional[str] = None) -> Optional[Summary]:
@@ -81,66 +282,271 @@ class MongoManager:
         elif scope == "user":  # Lifetime summary has null session_id
             query["session_id"] = None
         
-        doc = await self.db.summaries.find_one(query, sort=[("created_at", DESCENDING)])
-        return Summary(**doc) if doc else None
+        doc = await self.db.summaries.find_one(query, SUMMARY_FIELDS, sort=[("created_at", DESCENDING)])
+        return Summary.model_construct(**doc) if doc else None
+
+    async def get_all_session_summaries(self, user_id: str, limit: Optional[int] = None) -> List[Summary]:
+        cursor = self.db.summaries.find(
+            {"user_id": user_id, "scope": "session"}, SUMMARY_FIELDS
+        ).sort("created_at", DESCENDING).limit(limit or 0)
+        return [Summary.model_construct(**doc) async for doc in cursor]
 
-    async def get_all_session_summaries(self, user_id: str) -> List[Summary]:
-        cursor = self.db.summaries.find({"user_id": user_id, "scope": "session"}).sort("created_at", DESCENDING)
-        return [Summary(**doc) async for doc in cursor]
+    async def get_session_summaries_since(self, user_id: str, since: Optional[datetime], limit: int) -> List[Summary]:
+        """Oldest-first session summaries created (or last updated) after `since`."""
+        query = {"user_id": user_id, "scope": "session"}
+        if since is not None:
+            query["created_at"] = {"$gt": since}
+        cursor = self.db.summaries.find(query, SUMMARY_FIELDS).sort("created_at", ASCENDING).limit(limit)
+        return [Summary.model_construct(**doc) async for doc in cursor]
 
     # ------------------------------------------------------------------
     # Episode Operations
     # ------------------------------------------------------------------
-    async def save_episode(self, episode: Episode):
-        await self.db.episodes.insert_one(episode.model_dump())
+    async def _insert_episodes(self, episodes: List[Episode]) -> List[ObjectId]:
+        if not episodes:
+            return []
+        docs = []
+        for episode in episodes:
+            doc = episode.model_dump()
+            doc["embedding"] = encode_embedding(episode.embedding)
+            docs.append(doc)
+        # Ordered, so inserted_ids line up with the episodes
+        result = await self.db.episodes.insert_many(docs)
+        return result.inserted_ids
 
-    async def get_top_k_episodes_by_similarity(self, user_id: str, embedding: List[float], k: int) -> List[Episode]:
-        """
-        Retrieves the top-k most similar episodic memories for a given user.
-        Skips any episode whose embedding dimension doesn't match the query vector.
-        """
-        cursor = self.db.episodes.find({"user_id": user_id})
-        all_episodes = [Episode(**doc) async for doc in cursor]
+    def _episodes(self, cold: bool):
+        return self.db.episodes_cold if cold else self.db.episodes
 
-        if not all_episodes:
-            print(f"[DEBUG] No episodes found for user {user_id}")
-            return []
+    async def _load_episode_vectors(self, user_id: str, cold: bool = False) -> Tuple[List[ObjectId], List[np.ndarray]]:
+        cursor = self._episodes(cold).find({"user_id": user_id}, {"embedding": 1})
+        ids, rows = [], []
+        async for doc in cursor:
+            ids.append(doc["_id"])
+            rows.append(decode_embedding(doc["embedding"]))
+        return ids, rows
 
-        query_vec = np.array(embedding, dtype=np.float32)
-        query_dim = len(query_vec)
-        similarities = []
+    async def _get_episode_fields(self, episode_ids: List[ObjectId], cold: bool = False) -> Dict[ObjectId, Dict[str, Any]]:
+        cursor = self._episodes(cold).find({"_id": {"$in": episode_ids}}, {"embedding": 0})
+        return {doc["_id"]: doc async for doc in cursor}
 
-        for episode in all_episodes:
-            episode_vec = np.array(episode.embedding, dtype=np.float32)
-            ep_dim = len(episode_vec)
+    async def _get_retention_fields(self, user_id: str) -> Dict[ObjectId, Dict[str, Any]]:
+        cursor = self.db.episodes.find(
+            {"user_id": user_id},
+            {"importance": 1, "created_at": 1, "last_seen_at": 1, "retrieval_hits": 1, "last_retrieved_at": 1}
+        )
+        return {doc["_id"]: doc async for doc in cursor}
 
-            # --- Dimension mismatch guard ---
-            if ep_dim != query_dim:
-                print(f"[WARN] Skipping episode (dim mismatch): query={query_dim}, episode={ep_dim}")
+    async def _set_episode_tier(self, episode_ids: List[ObjectId], cold: bool) -> List[ObjectId]:
+        source, target = self._episodes(not cold), self._episodes(cold)
+        moved = []
+        for start in range(0, len(episode_ids), 500):
+            docs = [doc async for doc in source.find({"_id": {"$in": episode_ids[start:start + 500]}})]
+            if not docs:
                 continue
+            # Copy, then delete: a crash in between leaves both copies, and a retry overwrites the target one
+            await target.bulk_write([ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs], ordered=False)
+            ids = [doc["_id"] for doc in docs]
+            await source.delete_many({"_id": {"$in": ids}})
+            moved.extend(ids)
+        return moved
 
-            # --- Safe cosine similarity computation ---
-            try:
-                denom = (np.linalg.norm(query_vec) * np.linalg.norm(episode_vec)) + 1e-10
-                similarity = float(np.dot(query_vec, episode_vec) / denom)
-                similarities.append((similarity, episode))
-            except Exception as e:
-                print(f"[ERROR] Similarity computation failed for episode {getattr(episode, 'id', None)}: {e}")
-                continue
+    async def _record_episode_hits(self, episode_ids: List[ObjectId], retrieved_at: datetime):
+        await self.db.episodes.update_many(
+            {"_id": {"$in": episode_ids}},
+            {"$inc": {"retrieval_hits": 1}, "$set": {"last_retrieved_at": retrieved_at}}
+        )
+
+    async def _reinforce_episode(self, episode_id: ObjectId, importance: float, seen: int, seen_at: datetime):
+        # Pipeline update so episodes stored before seen_count/last_seen_at existed count as seen once
+        await self.db.episodes.update_one({"_id": episode_id}, [{"$set": {
+            "importance": {"$max": ["$importance", importance]},
+            "seen_count": {"$add": [{"$ifNull": ["$seen_count", 1]}, seen]},
+            "last_seen_at": {"$max": [{"$ifNull": ["$last_seen_at", "$created_at"]}, seen_at]},
+        }}])
+
+    async def _delete_episodes(self, episode_ids: List[ObjectId]):
+        await self.db.episodes.delete_many({"_id": {"$in": episode_ids}})
 
-        # Sort by similarity descending
-        similarities.sort(key=lambda x: x[0], reverse=True)
-        top_k = [ep for sim, ep in similarities[:k]]
+    def _episode_id_to_bytes(self, episode_id: ObjectId) -> bytes:
+        return episode_id.binary
 
-        print(f"[DEBUG] Retrieved {len(top_k)} episodic facts for user={user_id} (from {len(all_episodes)} total)")
-        return top_k
+    def _episode_id_from_bytes(self, raw: bytes) -> ObjectId:
+        return ObjectId(raw)
 
     async def get_last_n_episodic_facts(self, user_id: str, n: int) -> List[str]:
-        cursor = self.db.episodes.find({"user_id": user_id}).sort("created_at", DESCENDING).limit(n)
+        cursor = self.db.episodes.find(
+            {"user_id": user_id}, {"fact": 1, "_id": 0}
+        ).sort("created_at", DESCENDING).limit(n)
         return [doc["fact"] async for doc in cursor]
 
+    # ------------------------------------------------------------------
+    # Job Operations (background memory maintenance)
+    # ------------------------------------------------------------------
+    async def enqueue_job(self, kind: str, payload: Dict[str, Any], dedup_key: Optional[str] = None):
+        """
+        Persists a queued job and returns its id.
+        Returns None when an identical job (same dedup_key) is already queued.
+        """
+        now = datetime.utcnow()
+        doc = {
+            "kind": kind,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        if dedup_key is None:
+            result = await self.db.jobs.insert_one(doc)
+            return result.inserted_id
+
+        try:
+            result = await self.db.jobs.update_one(
+                {"dedup_key": dedup_key, "status": "queued"},
+                {"$setOnInsert": doc},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Lost an upsert race against an identical job
+            return None
+        return result.upserted_id
+
+    async def claim_job(self, job_id) -> Optional[Dict[str, Any]]:
+        """Atomically moves a queued job to running; returns None if someone else got it."""
+        return await self.db.jobs.find_one_and_update(
+            {"_id": job_id, "status": "queued"},
+            {"$set": {"status": "running", "updated_at": datetime.utcnow()}, "$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def complete_job(self, job_id):
+        await self.db.jobs.delete_one({"_id": job_id})
+
+    async def release_job(self, job_id, error: Optional[str] = None, failed: bool = False):
+        """Puts a job back in the queue, or parks it as failed."""
+        update = {"status": "failed" if failed else "queued", "updated_at": datetime.utcnow()}
+        if error:
+            update["last_error"] = error
+        try:
+            await self.db.jobs.update_one({"_id": job_id}, {"$set": update})
+        except DuplicateKeyError:
+            # An identical job was queued meanwhile and will cover this one
+            await self.db.jobs.delete_one({"_id": job_id})
+
+    async def requeue_stale_jobs(self, lease_seconds: int) -> int:
+        """Returns running jobs whose lease expired (e.g. the process died) to the queue."""
+        cutoff = datetime.utcnow() - timedelta(seconds=lease_seconds)
+        cursor = self.db.jobs.find({"status": "running", "updated_at": {"$lt": cutoff}}, {"_id": 1})
+        stale = [doc["_id"] async for doc in cursor]
+        for job_id in stale:
+            await self.release_job(job_id, error="lease expired")
+        return len(stale)
+
+    async def get_queued_job_ids(self, limit: int) -> List[Any]:
+        cursor = self.db.jobs.find({"status": "queued"}, {"_id": 1}).sort("created_at", ASCENDING).limit(limit)
+        return [doc["_id"] async for doc in cursor]
+
+    # ------------------------------------------------------------------
+    # Embedding Cache Operations
+    # ------------------------------------------------------------------
+    async def get_cached_embeddings(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        cursor = self.db.embedding_cache.find(
+            {"model": model, "hash": {"$in": hashes}},
+            {"hash": 1, "vector": 1, "_id": 0}
+        )
+        return {doc["hash"]: decode_embedding(doc["vector"]) async for doc in cursor}
+
+    async def save_cached_embeddings(self, model: str, vectors: Dict[str, List[float]]):
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"model": model, "hash": text_hash},
+                {"$setOnInsert": {"vector": encode_embedding(vector, normalize=False), "created_at": now}},
+                upsert=True
+            )
+            for text_hash, vector in vectors.items()
+        ]
+        if operations:
+            await self.db.embedding_cache.bulk_write(operations, ordered=False)
+
+    async def purge_embedding_cache(self, keep_model: str) -> int:
+        """Drops cached vectors produced by any model other than keep_model."""
+        result = await self.db.embedding_cache.delete_many({"model": {"$ne": keep_model}})
+        return result.deleted_count
+
+    # ------------------------------------------------------------------
+    # Backfill Task Operations (bulk import pipeline)
+    # ------------------------------------------------------------------
+    async def add_backfill_tasks(self, run_id: str, kind: str, keys: List[tuple]):
+        """Registers (user_id, session_id) work items for a run; existing ones are left untouched."""
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"run_id": run_id, "kind": kind, "user_id": user_id, "session_id": session_id},
+                {"$setOnInsert": {"status": "pending", "messages_done": 0, "created_at": now}},
+                upsert=True
+            )
+            for user_id, session_id in keys
+        ]
+        if operations:
+            await self.db.backfill_tasks.bulk_write(operations, ordered=False)
+
+    async def get_open_backfill_tasks(self, run_id: str, kind: str, limit: int) -> List[Dict[str, Any]]:
+        """Pending tasks, plus ones left running by a crashed run."""
+        cursor = self.db.backfill_tasks.find(
+            {"run_id": run_id, "kind": kind, "status": {"$in": ["pending", "running"]}}
+        ).sort("_id", ASCENDING).limit(limit)
+        return [doc async for doc in cursor]
+
+    async def update_backfill_task(self, task_id, **fields):
+        fields["updated_at"] = datetime.utcnow()
+        await self.db.backfill_tasks.update_one({"_id": task_id}, {"$set": fields})
+
+    async def reopen_failed_backfill_tasks(self, run_id: str) -> int:
+        """Puts a run's failed tasks back to pending, progress kept, so a resume retries them."""
+        result = await self.db.backfill_tasks.update_many(
+            {"run_id": run_id, "status": "failed"},
+            {"$set": {"status": "pending", "updated_at": datetime.utcnow()}}
+        )
+        return result.modified_count
+
+    async def get_backfill_users(self, run_id: str) -> List[str]:
+        """Users whose session tasks in the run are all done."""
+        pipeline = [
+            {"$match": {"run_id": run_id, "kind": "session"}},
+            {"$group": {"_id": "$user_id", "open": {"$sum": {"$cond": [{"$eq": ["$status", "done"]}, 0, 1]}}}},
+            {"$match": {"open": 0}},
+        ]
+        return [row["_id"] async for row in self.db.backfill_tasks.aggregate(pipeline)]
+
+    async def get_backfill_progress(self, run_id: str) -> Dict[str, Dict[str, int]]:
+        pipeline = [
+            {"$match": {"run_id": run_id}},
+            {"$group": {"_id": {"kind": "$kind", "status": "$status"}, "count": {"$sum": 1}}},
+        ]
+        progress: Dict[str, Dict[str, int]] = {}
+        async for row in self.db.backfill_tasks.aggregate(pipeline):
+            progress.setdefault(row["_id"]["kind"], {})[row["_id"]["status"]] = row["count"]
+        return progress
+
+    # ------------------------------------------------------------------
+    # Export / Restore (streamed a batch at a time)
+    # ------------------------------------------------------------------
+    async def iter_messages(self, user_id: str, batch_size: int) -> AsyncIterator[Message]:
+        # The (user_id, session_id, created_at) index walked backwards, so the sort streams
+        cursor = self.db.messages.find({"user_id": user_id}, MESSAGE_FIELDS).sort(
+            [("session_id", DESCENDING), ("created_at", ASCENDING)]
+        ).batch_size(batch_size)
+        async for doc in cursor:
+            yield Message.model_construct(**doc)
+
+    async def iter_summaries(self, user_id: str, batch_size: int) -> AsyncIterator[Summary]:
+        cursor = self.db.summaries.find({"user_id": user_id}, SUMMARY_FIELDS).batch_size(batch_size)
+        async for doc in cursor:
+            yield Summary.model_construct(**doc)
 
-# ------------------------------------------------------------------
-# Create a global instance for imports
-# ------------------------------------------------------------------
-mongo_manager = MongoManager()
+    async def iter_episodes(self, user_id: str, batch_size: int, cold: bool = False) -> AsyncIterator[Episode]:
+        cursor = self._episodes(cold).find({"user_id": user_id}, {"_id": 0}).batch_size(batch_size)
+        async for doc in cursor:
+            doc["embedding"] = decode_embedding(doc["embedding"]).tolist()
+            yield Episode.model_construct(**doc)
@@ -0,0 +1,146 @@
+"""
+JSON rendering and response caching for the read-heavy memory endpoints.
+
+Uses orjson when it is installed (pip install orjson) and the standard library otherwise.
+Pydantic models are written straight from their field dict, so handlers can return models
+built with model_construct() as they are, without a model_dump()/jsonable_encoder pass.
+
+Rendered views are cached per user against the user's memory version (bumped by every
+write to their messages, summaries or episodes), and carry an ETag derived from it, so
+clients polling an unchanged view get a 304 after a single version lookup.
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from .config import settings
+from .metrics import RESPONSE_CACHE_LOOKUPS
+from .storage.store import store
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """Drop-in JSONResponse; returning it also skips FastAPI's response_model validation."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# ------------------------------------------------------------------
+# Versioned response cache
+# ------------------------------------------------------------------
+class ResponseCache:
+    """
+    Bounded LRU of rendered response bodies, keyed on (view, user_id, params...).
+    Each entry remembers the memory version it was rendered at and only serves that
+    version, so a write invalidates every cached view of the user without a purge.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lru: "OrderedDict[Tuple, Tuple[int, bytes]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def get(self, key: Tuple, version: int) -> Optional[bytes]:
+        entry = self._lru.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        self._lru.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: Tuple, version: int, body: bytes):
+        if self.max_entries <= 0:
+            return
+        # A slow render can finish after a newer one; keep the newer body
+        entry = self._lru.get(key)
+        if entry is not None and entry[0] > version:
+            return
+        self._lru[key] = (version, body)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses + self.not_modified
+        return {
+            "entries": len(self._lru),
+            "max_entries": self.max_entries,
+            "bytes": sum(len(body) for _, body in self._lru.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_rate": (self.hits + self.not_modified) / lookups if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_SIZE)
+
+
+def etag_for(key: Tuple, version: int) -> str:
+    # Weak: the same version renders the same document, not necessarily the same bytes (orjson vs json)
+    digest = hashlib.blake2b(repr((key, version)).encode("utf-8"), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison (RFC 9110 13.1.2): ignore the W/ prefix on both sides
+    return any(tag.strip().removeprefix("W/") == etag.removeprefix("W/") for tag in if_none_match.split(","))
+
+
+async def cached_json(request: Request, key: Tuple, build: Callable[[], Awaitable[Any]]) -> Response:
+    """
+    Serves the view `key` (whose second element is the user id) for the user's current
+    memory version: 304 if the client already holds it, the cached body if one was
+    rendered at this version, otherwise build() rendered and cached.
+    The version is read before the data, so a cached body is never older than its version.
+    """
+    version = await store.get_memory_version(key[1])
+    etag = etag_for(key, version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        response_cache.not_modified += 1
+        RESPONSE_CACHE_LOOKUPS.inc(result="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(key, version)
+    if body is not None:
+        response_cache.hits += 1
+        RESPONSE_CACHE_LOOKUPS.inc(result="hit")
+    else:
+        response_cache.misses += 1
+        RESPONSE_CACHE_LOOKUPS.inc(result="miss")
+        body = dumps(await build())
+        response_cache.put(key, version, body)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,26 +1,28 @@
-from fastapi import APIRouter
-from ..mongoimpl.mongo import mongo_manager
-from pymongo import ASCENDING
+from fastapi import APIRouter, Request
+from datetime import date
+from typing import Optional
+from ..responses import FastJSONResponse, cached_json
+from ..storage.store import store
 
 router = APIRouter()  # ← Removed prefix="/api/aggregate"
 
-@router.get("/{user_id}")
-async def aggregate_user_data(user_id: str):
+@router.get("/{user_id}", response_class=FastJSONResponse)
+async def aggregate_user_data(request: Request, user_id: str, start: Optional[date] = None, end: Optional[date] = None):
     """
     Returns daily message counts and recent summaries for a user.
+    Counts come from the per-day activity rollups; `start`/`end` (YYYY-MM-DD, inclusive) bound the range.
+    Cached per memory version with an ETag; If-None-Match gets a 304 until the user's memory changes.
     """
-    pipeline = [
-        {"$match": {"user_id": user_id}},
-        {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
-            "count": {"$sum": 1}
-        }},
-        {"$sort": {"_id": ASCENDING}}
-    ]
-    results = await mongo_manager.db.messages.aggregate(pipeline).to_list(length=100)
-    recent_summaries = await mongo_manager.get_all_session_summaries(user_id)
+    start_key = start.isoformat() if start else None
+    end_key = end.isoformat() if end else None
 
-    return {
-        "daily_message_counts": results,
-        "recent_summaries": [s.text for s in recent_summaries[:3]]
-    }
\ No newline at end of file
+    async def build():
+        daily = await store.get_daily_activity(user_id, start_key, end_key)
+        results = [{"_id": day["date"], "count": day["count"], "by_role": day["by_role"]} for day in daily]
+        recent_summaries = await store.get_all_session_summaries(user_id, limit=3)
+        return {
+            "daily_message_counts": results,
+            "recent_summaries": [s.text for s in recent_summaries]
+        }
+
+    return await cached_json(request, ("aggregate", user_id, start_key, end_key), build)
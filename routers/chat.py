@@ -1,29 +1,64 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List, Optional
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Optional, Set
 from datetime import datetime
-import json  # Used for parsing fact extraction
+import asyncio
+import json
+import logging
+import time
 
 from ..config import settings
-from ..models import ChatRequest, ChatResponse, Message, Summary, Episode
-from ..mongoimpl.mongo import mongo_manager
+from ..metrics import CHAT_REQUEST_SECONDS, CHAT_SIDE_TASK_FAILURES, LLM_REJECTIONS, STAGE_SECONDS
+from ..models import ChatRequest, ChatResponse, ChatTurn, Message
+from ..storage.store import store
+from ..services.llm_scheduler import LLMOverloaded, chat_rate_limiter
 from ..services.ollama_client import ollama_client
-from ..services.memory_logic import (
-    compose_chat_prompt,
-    extract_and_store_episodes,
-    summarize_conversation,
-    refresh_lifetime_summary
-)
-from ..services.embeddings import generate_embedding  # For episode retrieval
+from ..services.memory_logic import assemble_context, compose_chat_prompt, extract_episodes
+from ..services.memory_worker import memory_worker
+from ..services.prompt_packing import estimate_prompt_tokens
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
-@router.post("/", response_model=ChatResponse)  # ← Changed from "/chat" to "/"
-async def chat_endpoint(request: ChatRequest):
+# Persistence tasks spawned after a client disconnect, and side branches of pipelined turns;
+# referenced so they aren't GC'd mid-flight
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _start_side_task(name: str, user_id: str, coro) -> asyncio.Task:
+    """Runs a side branch of the turn; its failure is logged here and never fails the reply."""
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+
+    def done(task: asyncio.Task):
+        _background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Chat side task '%s' failed for user=%s: %s", name, user_id, task.exception())
+            CHAT_SIDE_TASK_FAILURES.inc(task=name)
+
+    task.add_done_callback(done)
+    return task
+
+
+def _admit_turn(user_id: str):
+    """Turns the chat away (429) before any work if the user is over their rate or replies can't be queued."""
+    wait = chat_rate_limiter.acquire(user_id)
+    if wait:
+        LLM_REJECTIONS.inc(pool="chat", priority="reply", reason="rate_limited")
+        raise LLMOverloaded("rate_limited", wait)
+    ollama_client.check_reply_capacity()
+
+
+async def _prepare_turn(request: ChatRequest) -> ChatTurn:
+    """Admits the turn, saves the user message and gathers memory context for the reply (steps 0-5)."""
     user_id = request.user_id
     session_id = request.session_id if request.session_id else f"default_session_{user_id}"
     user_message_content = request.message
 
+    # 0. Admission control
+    _admit_turn(user_id)
+
     # 1. Save the user message
     user_message = Message(
         user_id=user_id,
@@ -32,70 +67,168 @@ async def chat_endpoint(request: ChatRequest):
         content=user_message_content,
         created_at=datetime.utcnow()
     )
-    await mongo_manager.save_message(user_message)
+    with STAGE_SECONDS.time(stage="save_user_message"):
+        await store.save_message(user_message)
 
-    # 2. Short-term memory: fetch the last N messages for the session
-    # Include the current user message in the window, so we fetch N-1 older messages
-    short_term_messages = await mongo_manager.get_last_n_messages(
-        user_id, session_id, settings.SHORT_TERM_N - 1
-    )
+    # 2-4. Fact extraction for the current message: queued for the worker pool, or, when memory
+    # jobs run inline, a side branch overlapping retrieval and generation whose episode writes
+    # wait until retrieval is done. Then gather memory concurrently: short-term window,
+    # session/lifetime summaries and relevant episodic facts
+    side_tasks = {}
+    retrieval_done = asyncio.Event()
+    if settings.PIPELINED_EXTRACTION and not memory_worker.running:
+        side_tasks["extract_episodes"] = _start_side_task(
+            "extract_episodes", user_id,
+            extract_episodes(user_id, session_id, user_message_content, store_after=retrieval_done)
+        )
+    else:
+        with STAGE_SECONDS.time(stage="enqueue_extraction"):
+            await memory_worker.enqueue_extraction(user_id, session_id, user_message_content)
+    try:
+        with STAGE_SECONDS.time(stage="assemble_context"):
+            context = await assemble_context(user_id, session_id, user_message_content, request.search_cold_memory)
+    finally:
+        retrieval_done.set()
+    short_term_messages = context.short_term_messages
 
     # Add the current user message to the short-term window for prompt composition
     short_term_messages.insert(0, user_message)  # Most recent at the beginning, will be reversed for prompt
 
-    # 3. Long-term memory: fetch summaries
-    latest_session_summary = await mongo_manager.get_latest_summary(user_id, "session", session_id)
-    latest_lifetime_summary = await mongo_manager.get_latest_summary(user_id, "user", None)
-
-    # 4. Episodic memory: extract facts from current message and retrieve relevant ones
-    await extract_and_store_episodes(user_id, session_id, user_message_content)
-    current_message_embedding = await generate_embedding(user_message_content)
-    top_k_episodes = await mongo_manager.get_top_k_episodes_by_similarity(
-        user_id, current_message_embedding, settings.EPISODE_RETRIEVAL_K
-    )
-    episodic_facts_retrieved = [ep.fact for ep in top_k_episodes]
-
     # 5. Compose the prompt
-    ollama_messages_prompt = await compose_chat_prompt(
+    with STAGE_SECONDS.time(stage="compose_prompt"):
+        ollama_messages_prompt = await compose_chat_prompt(
+            user_id=user_id,
+            session_id=session_id,
+            current_message_content=user_message_content,
+            short_term_messages=short_term_messages,
+            latest_session_summary=context.latest_session_summary,
+            latest_lifetime_summary=context.latest_lifetime_summary,
+            episodic_facts=context.episodic_facts
+        )
+
+    return ChatTurn(
         user_id=user_id,
         session_id=session_id,
-        current_message_content=user_message_content,
+        user_message=user_message,
         short_term_messages=short_term_messages,
-        latest_session_summary=latest_session_summary,
-        latest_lifetime_summary=latest_lifetime_summary,
-        episodic_facts=episodic_facts_retrieved
+        latest_session_summary=context.latest_session_summary,
+        latest_lifetime_summary=context.latest_lifetime_summary,
+        episodic_facts=context.episodic_facts,
+        prompt=ollama_messages_prompt,
+        context_latency_ms=context.latency_ms,
+        missed_context_sources=context.missed_sources,
+        side_tasks=side_tasks
     )
 
-    # 6. Call the Ollama chat API
-    assistant_reply_content = await ollama_client.chat_completion(ollama_messages_prompt)
 
+async def _finish_turn(turn: ChatTurn, assistant_reply_content: str):
+    """Saves the assistant reply and triggers summarization when due (steps 7-8)."""
     # 7. Save the assistant message
     assistant_message = Message(
-        user_id=user_id,
-        session_id=session_id,
+        user_id=turn.user_id,
+        session_id=turn.session_id,
         role="assistant",
         content=assistant_reply_content,
         created_at=datetime.utcnow()
     )
-    await mongo_manager.save_message(assistant_message)
+    with STAGE_SECONDS.time(stage="save_reply"):
+        session_state = await store.save_message(assistant_message)
 
-    # 8. Long-term summarization trigger
-    user_msg_count = await mongo_manager.count_user_messages_in_session(user_id, session_id)
-    if user_msg_count % settings.SUMMARIZE_EVERY_USER_MSGS == 0:
-        recent_session_messages = await mongo_manager.get_last_n_messages(
-            user_id, session_id, settings.SHORT_TERM_N * 2
-        )  # Get more messages for summary
-        new_session_summary = await summarize_conversation(user_id, session_id, recent_session_messages)
-        if new_session_summary:
-            await mongo_manager.upsert_summary(new_session_summary)
+    # 8. Long-term summarization trigger, every SUMMARIZE_EVERY_USER_MSGS user messages
+    with STAGE_SECONDS.time(stage="summary_trigger"):
+        if session_state and await store.claim_session_summary(
+            session_state, settings.SUMMARIZE_EVERY_USER_MSGS
+        ):
+            # Session summary, then lifetime summary, deduplicated per user/session
+            await memory_worker.enqueue_session_summary(turn.user_id, turn.session_id)
 
-        # Recompute lifetime summary occasionally
-        await refresh_lifetime_summary(user_id)
+    # Pipelined side branches land before the turn completes; a failure is reported, not raised
+    for name, task in turn.side_tasks.items():
+        with STAGE_SECONDS.time(stage=f"join_{name}"):
+            try:
+                await asyncio.shield(task)
+            except Exception as e:
+                turn.side_task_errors[name] = str(e) or type(e).__name__
 
-    # 9. Return structured response
+
+def _build_response(turn: ChatTurn, assistant_reply_content: str) -> ChatResponse:
     return ChatResponse(
         assistant_reply=assistant_reply_content,
-        short_term_messages_count=len(short_term_messages),
-        long_term_summary_text=latest_session_summary.text if latest_session_summary else None,
-        episodic_facts_retrieved=episodic_facts_retrieved
-    )
\ No newline at end of file
+        short_term_messages_count=len(turn.short_term_messages),
+        long_term_summary_text=turn.latest_session_summary.text if turn.latest_session_summary else None,
+        episodic_facts_retrieved=turn.episodic_facts,
+        context_latency_ms=turn.context_latency_ms,
+        missed_context_sources=turn.missed_context_sources,
+        prompt_tokens=estimate_prompt_tokens(turn.prompt),
+        side_task_errors=turn.side_task_errors
+    )
+
+
+@router.post("/", response_model=ChatResponse)  # ← Changed from "/chat" to "/"
+async def chat_endpoint(request: ChatRequest):
+    start = time.perf_counter()
+    turn = await _prepare_turn(request)
+
+    # 6. Call the Ollama chat API
+    with STAGE_SECONDS.time(stage="generate"):
+        assistant_reply_content = await ollama_client.chat_completion(turn.prompt)
+
+    await _finish_turn(turn, assistant_reply_content)
+    CHAT_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="chat")
+
+    # 9. Return structured response
+    return _build_response(turn, assistant_reply_content)
+
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+@router.post("/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Same pipeline as POST /api/chat, but the reply is streamed as Server-Sent Events:
+    `data: {"token": ...}` frames while generating, then an `event: done` frame carrying
+    the ChatResponse fields. The assistant message is persisted when the stream completes,
+    or with whatever was generated if the client disconnects.
+    """
+    start = time.perf_counter()
+    turn = await _prepare_turn(request)
+
+    async def event_stream() -> AsyncIterator[str]:
+        reply_parts: List[str] = []
+        finished = False
+        try:
+            generate_start = time.perf_counter()
+            async for chunk in ollama_client.chat_completion_stream(turn.prompt):
+                if not reply_parts:
+                    STAGE_SECONDS.observe(time.perf_counter() - generate_start, stage="first_token")
+                reply_parts.append(chunk)
+                yield _sse({"token": chunk})
+            STAGE_SECONDS.observe(time.perf_counter() - generate_start, stage="generate")
+
+            assistant_reply_content = "".join(reply_parts)
+            finished = True
+            # Shielded so a disconnect at this point can't cut the save short
+            await asyncio.shield(_finish_turn(turn, assistant_reply_content))
+            yield _sse(_build_response(turn, assistant_reply_content).model_dump(), event="done")
+            CHAT_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="stream")
+        except Exception as e:
+            logger.error("Streaming chat failed for user=%s: %s", turn.user_id, e)
+            error = {"detail": str(e)}
+            if isinstance(e, LLMOverloaded):
+                error["retry_after"] = e.retry_after
+            yield _sse(error, event="error")
+        finally:
+            if not finished and reply_parts:
+                # The request scope may already be cancelled, so persist from a detached task
+                task = asyncio.ensure_future(_finish_turn(turn, "".join(reply_parts)))
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
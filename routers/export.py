@@ -0,0 +1,37 @@
+import re
+from typing import Optional
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from ..services.export import export_user_memory, gzip_chunks, import_user_memory, maybe_gunzip
+from ..services.ingest import iter_lines
+
+router = APIRouter()
+
+
+@router.get("/{user_id}")
+async def export_memory(user_id: str, gzip: bool = False):
+    """
+    Streams the user's messages, summaries and episodes (both tiers) as NDJSON, read from
+    storage a batch at a time; `gzip=true` compresses on the fly.
+    """
+    filename = re.sub(r"[^A-Za-z0-9._-]", "_", user_id) + ".ndjson"
+    if gzip:
+        return StreamingResponse(
+            gzip_chunks(export_user_memory(user_id)),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.gz"'}
+        )
+    return StreamingResponse(
+        export_user_memory(user_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.post("/restore")
+async def restore_memory(request: Request, user_id: Optional[str] = None):
+    """
+    Restores an export streamed in the request body, plain or gzipped.
+    `user_id` restores into a different user than the one exported.
+    """
+    return await import_user_memory(iter_lines(maybe_gunzip(request.stream())), user_id)
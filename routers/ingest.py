@@ -0,0 +1,47 @@
+import asyncio
+from typing import Set
+from fastapi import APIRouter, HTTPException, Request
+from ..storage.store import store
+from ..services.ingest import ingest_conversations, iter_lines, run_backfill
+
+router = APIRouter()
+
+# Backfills started by this process; referenced so they aren't GC'd mid-flight
+_backfills: Set[asyncio.Task] = set()
+
+
+@router.post("/")
+async def ingest_history(request: Request, backfill: bool = True):
+    """
+    Bulk-imports NDJSON conversations streamed in the request body, one per line:
+    {"user_id": ..., "session_id": ..., "messages": [{"role": ..., "content": ..., "created_at": ...}]}
+
+    Messages are loaded before the response returns; episode extraction and summaries run
+    as a background backfill whose progress is available at GET /api/ingest/{run_id}.
+    """
+    stats = await ingest_conversations(iter_lines(request.stream()))
+    if backfill and stats["messages"]:
+        task = asyncio.create_task(run_backfill(stats["run_id"]))
+        _backfills.add(task)
+        task.add_done_callback(_backfills.discard)
+    return stats
+
+
+@router.get("/{run_id}")
+async def get_ingest_progress(run_id: str):
+    """Backfill task counts by kind and status for an import run."""
+    progress = await store.get_backfill_progress(run_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Unknown import run")
+    return {"run_id": run_id, "progress": progress}
+
+
+@router.post("/{run_id}/resume")
+async def resume_backfill(run_id: str):
+    """Restarts an interrupted backfill; finished tasks are skipped, failed ones retried from where they stopped."""
+    if not await store.get_backfill_progress(run_id):
+        raise HTTPException(status_code=404, detail="Unknown import run")
+    task = asyncio.create_task(run_backfill(run_id))
+    _backfills.add(task)
+    task.add_done_callback(_backfills.discard)
+    return {"run_id": run_id, "status": "resumed"}
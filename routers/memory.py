@@ -1,25 +1,35 @@
-from fastapi import APIRouter
-from ..mongoimpl.mongo import mongo_manager
+from fastapi import APIRouter, Request
+from typing import Optional
+from ..responses import FastJSONResponse, cached_json
+from ..storage.store import store
 
 router = APIRouter()  # ← Removed prefix="/api/memory"
 
-@router.get("/{user_id}")
-async def get_memory_snapshot(user_id: str):
+@router.get("/{user_id}", response_class=FastJSONResponse)
+async def get_memory_snapshot(request: Request, user_id: str, session_id: Optional[str] = None):
     """
     Returns a consolidated memory snapshot:
     - Last 16 messages
     - Latest session summary
     - Latest lifetime summary
     - Last 20 episodic facts
+    - Session counters, when a session_id is given
+    Cached per memory version with an ETag; If-None-Match gets a 304 until the user's memory changes.
     """
-    messages = await mongo_manager.get_last_n_messages(user_id, None, 16)
-    session_summary = await mongo_manager.get_latest_summary(user_id, "session")
-    lifetime_summary = await mongo_manager.get_latest_summary(user_id, "user")
-    episodic_facts = await mongo_manager.get_last_n_episodic_facts(user_id, 20)
+    async def build():
+        messages = await store.get_last_n_messages(user_id, None, 16)
+        session_summary = await store.get_latest_summary(user_id, "session")
+        lifetime_summary = await store.get_latest_summary(user_id, "user")
+        episodic_facts = await store.get_last_n_episodic_facts(user_id, 20)
+        session_state = await store.get_session_state(user_id, session_id) if session_id else None
 
-    return {
-        "messages": [m.model_dump() for m in messages],
-        "latest_session_summary": session_summary.text if session_summary else None,
-        "latest_lifetime_summary": lifetime_summary.text if lifetime_summary else None,
-        "episodic_facts": episodic_facts
-    }
\ No newline at end of file
+        # Models go to the encoder as they are; no model_dump()/jsonable_encoder pass
+        return {
+            "messages": messages,
+            "latest_session_summary": session_summary.text if session_summary else None,
+            "latest_lifetime_summary": lifetime_summary.text if lifetime_summary else None,
+            "episodic_facts": episodic_facts,
+            "session_state": session_state
+        }
+
+    return await cached_json(request, ("memory", user_id, session_id), build)
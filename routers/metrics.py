@@ -0,0 +1,74 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..metrics import Gauge, registry
+from ..responses import response_cache
+from ..storage.store import store
+from ..services.embeddings import embedding_cache
+from ..services.memory_worker import memory_worker
+from ..services.ollama_client import ollama_client
+
+router = APIRouter()
+
+# Gauges mirror state that already exists elsewhere, so they are read at scrape time
+registry.register(Gauge(
+    "ai_memory_episode_index_users", "Users with an in-memory episode index loaded.",
+    lambda: len(store.episode_indexes)
+))
+registry.register(Gauge(
+    "ai_memory_episode_index_episodes", "Episodes held in in-memory episode indexes.",
+    lambda: store.episode_indexes.stats()["episodes"]
+))
+registry.register(Gauge(
+    "ai_memory_episode_index_bytes", "Memory used by in-memory episode indexes.",
+    lambda: store.episode_indexes.nbytes
+))
+registry.register(Gauge(
+    "ai_memory_ann_index_episodes", "Episodes in the open on-disk ANN indexes.",
+    lambda: store.ann_indexes.stats()["episodes"] if store.ann_indexes else 0
+))
+registry.register(Gauge(
+    "ai_memory_cold_index_episodes", "Cold-tier episodes held in memory for cold searches.",
+    lambda: store.cold_indexes.stats()["episodes"]
+))
+registry.register(Gauge(
+    "ai_memory_session_windows", "Sessions with a short-term message window held in memory.",
+    lambda: len(store.session_windows)
+))
+registry.register(Gauge(
+    "ai_memory_embedding_cache_entries", "Entries in the in-process embedding cache.",
+    lambda: embedding_cache.stats()["entries"]
+))
+registry.register(Gauge(
+    "ai_memory_response_cache_entries", "Rendered views in the in-process response cache.",
+    lambda: len(response_cache)
+))
+registry.register(Gauge(
+    "ai_memory_memory_jobs_backlog", "Background memory jobs queued or running in this process.",
+    lambda: memory_worker.backlog
+))
+registry.register(Gauge(
+    "ai_memory_llm_slots_in_use", "Chat and embedding slots held by running LLM calls.",
+    lambda: {slots.name: slots.in_use for slots in (ollama_client.chat_slots, ollama_client.embed_slots)},
+    ["pool"]
+))
+registry.register(Gauge(
+    "ai_memory_llm_queue_depth", "LLM calls waiting for a slot, by pool and priority.",
+    lambda: {
+        (slots.name, priority): waits["queued"]
+        for slots in (ollama_client.chat_slots, ollama_client.embed_slots)
+        for priority, waits in slots.stats()["priorities"].items()
+    },
+    ["pool", "priority"]
+))
+registry.register(Gauge(
+    "ai_memory_ollama_in_flight", "Ollama calls in flight per backend.",
+    lambda: {backend.base_url: backend.in_flight for backend in ollama_client.backends},
+    ["backend"]
+))
+
+
+@router.get("", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of this process's metrics."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,31 @@
+from fastapi import APIRouter
+from ..responses import response_cache
+from ..storage.store import store
+from ..services.embeddings import embedding_cache
+from ..services.llm_scheduler import chat_rate_limiter
+from ..services.ollama_client import ollama_client
+
+router = APIRouter()
+
+@router.get("/")
+async def get_stats():
+    """
+    Returns in-process runtime statistics:
+    - Embedding cache hit/miss counters
+    - Versioned response cache size and hit/miss/304 counters
+    - Short-term session window occupancy and hit/miss counters
+    - Episode index memory usage (exact in-memory, ANN and cold tiers)
+    - Ollama per-backend, per-endpoint latency and errors, retries and hedges
+    - LLM scheduler slots in use, queue depth and wait times per priority, and shed calls
+    - Per-user chat rate limiting
+    """
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "session_window": store.session_windows.stats(),
+        "episode_index": store.episode_indexes.stats(),
+        "ann_index": store.ann_indexes.stats() if store.ann_indexes else None,
+        "cold_index": store.cold_indexes.stats(),
+        "ollama": ollama_client.stats(),
+        "chat_rate_limit": chat_rate_limiter.stats(),
+    }
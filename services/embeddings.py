@@ -1,21 +1,199 @@
-from typing import List
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+from ..config import settings
+from ..metrics import EMBEDDING_CACHE_LOOKUPS
+from ..storage.store import store
+from .llm_scheduler import Priority
 from .ollama_client import ollama_client
 
-async def generate_embedding(text: str) -> List[float]:
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests (from many in-flight chats) into batched
+    /api/embed calls. A batch is sent once it reaches max_batch_size texts or when the
+    oldest pending text has waited max_wait_ms, whichever comes first. A batch is sent at
+    the priority of its most important text.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._pending: List[Tuple[str, asyncio.Future, Priority]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def embed(self, texts: List[str], priority: Priority = Priority.QUERY_EMBEDDING) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future, priority))
+            futures.append(future)
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            task = asyncio.ensure_future(self._send(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future, Priority]]):
+        # Identical texts in a batch (greetings, retries) are embedded once
+        unique_texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = await ollama_client.generate_embeddings(unique_texts, min(p for _, _, p in batch))
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(unique_texts, vectors))
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+
+class EmbeddingCache:
+    """
+    Two-level embedding cache keyed on (EMBED_MODEL, sha256(text)).
+    Level 1 is a bounded in-process LRU of float32 vectors; level 2 is the storage
+    embedding_cache collection. Keying on the model means a model change never
+    serves stale vectors, and purge_stale() drops the old model's entries.
+    """
+
+    def __init__(self, model: str, max_entries: int, persist: bool):
+        self.model = model
+        self.max_entries = max_entries
+        self.persist = persist
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._pending_writes: Set[asyncio.Task] = set()
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _remember(self, text_hash: str, vector: np.ndarray):
+        self._lru[text_hash] = vector
+        self._lru.move_to_end(text_hash)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    async def get_many(self, texts: List[str]) -> Dict[str, List[float]]:
+        """Returns cached vectors by text; texts missing from both levels are left out."""
+        found: Dict[str, List[float]] = {}
+        missing: Dict[str, str] = {}
+        l1_hits, l2_hits = self.l1_hits, self.l2_hits
+        for text in texts:
+            text_hash = self.text_hash(text)
+            vector = self._lru.get(text_hash)
+            if vector is not None:
+                self._lru.move_to_end(text_hash)
+                found[text] = vector.tolist()
+                self.l1_hits += 1
+            else:
+                missing[text_hash] = text
+
+        if missing and self.persist and store.connected:
+            try:
+                stored = await store.get_cached_embeddings(self.model, list(missing))
+            except Exception as e:
+                logger.warning("Embedding cache lookup failed: %s", e)
+                stored = {}
+            for text_hash, vector in stored.items():
+                self._remember(text_hash, vector)
+                found[missing.pop(text_hash)] = vector.tolist()
+                self.l2_hits += 1
+
+        self.misses += len(missing)
+        EMBEDDING_CACHE_LOOKUPS.inc(self.l1_hits - l1_hits, result="l1_hit")
+        EMBEDDING_CACHE_LOOKUPS.inc(self.l2_hits - l2_hits, result="l2_hit")
+        EMBEDDING_CACHE_LOOKUPS.inc(len(missing), result="miss")
+        return found
+
+    def put_many(self, vectors: Dict[str, List[float]]):
+        by_hash = {self.text_hash(text): vector for text, vector in vectors.items()}
+        for text_hash, vector in by_hash.items():
+            self._remember(text_hash, np.asarray(vector, dtype=np.float32))
+
+        # Persist off the request path
+        if by_hash and self.persist and store.connected:
+            task = asyncio.ensure_future(self._persist(by_hash))
+            self._pending_writes.add(task)
+            task.add_done_callback(self._pending_writes.discard)
+
+    async def _persist(self, by_hash: Dict[str, List[float]]):
+        try:
+            await store.save_cached_embeddings(self.model, by_hash)
+        except Exception as e:
+            logger.warning("Embedding cache write failed: %s", e)
+
+    async def purge_stale(self) -> int:
+        if not self.persist:
+            return 0
+        return await store.purge_embedding_cache(self.model)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.l1_hits + self.l2_hits + self.misses
+        return {
+            "model": self.model,
+            "entries": len(self._lru),
+            "max_entries": self.max_entries,
+            "l1_hits": self.l1_hits,
+            "l2_hits": self.l2_hits,
+            "misses": self.misses,
+            "hit_rate": (self.l1_hits + self.l2_hits) / lookups if lookups else 0.0,
+        }
+
+
+embedding_batcher = EmbeddingBatcher(settings.EMBED_BATCH_MAX_SIZE, settings.EMBED_BATCH_MAX_WAIT_MS)
+embedding_cache = EmbeddingCache(settings.EMBED_MODEL, settings.EMBED_CACHE_SIZE, settings.EMBED_CACHE_PERSIST)
+
+
+async def generate_embedding(text: str, priority: Priority = Priority.QUERY_EMBEDDING) -> List[float]:
     """
     Generates an embedding using the Ollama embedding model.
     Should return a 768-dimensional vector (default for models like 'nomic-embed-text').
     """
-    embedding = await ollama_client.generate_embedding(text)
-    print(f"[DEBUG] Generated embedding length: {len(embedding)}")
+    embedding = (await generate_embeddings([text], priority))[0]
+    logger.debug("Generated embedding length: %d", len(embedding))
     return embedding
 
-    # --- Real embedding from Ollama ---
-    try:
-        embedding = await ollama_client.generate_embedding(text)
-        print(f"[DEBUG] Generated real embedding (len={len(embedding)}) for text: {text[:50]}...")
-        return embedding
-    except Exception as e:
-        print(f"[ERROR] Failed to generate embedding: {e}")
-        # Return a fallback dummy embedding to prevent crashes
-        return [0.0] * 10
+
+async def generate_embeddings(texts: List[str], priority: Priority = Priority.QUERY_EMBEDDING) -> List[List[float]]:
+    """
+    Embeds several texts, serving repeats from the cache.
+    Misses share upstream batches with any concurrent requests.
+    """
+    if not texts:
+        return []
+
+    found = await embedding_cache.get_many(texts)
+    missing = [text for text in dict.fromkeys(texts) if text not in found]
+    if missing:
+        fresh = dict(zip(missing, await embedding_batcher.embed(missing, priority)))
+        embedding_cache.put_many(fresh)
+        found.update(fresh)
+
+    return [found[text] for text in texts]
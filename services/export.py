@@ -0,0 +1,226 @@
+"""
+Streaming export and restore of a user's complete memory.
+
+The format is NDJSON, one record per line, optionally gzip-compressed as a whole:
+    {"type": "export", "version": 1, "user_id": "u1", "exported_at": "..."}
+    {"type": "message", "user_id": "u1", "session_id": "s1", "role": "user", "content": "...", "created_at": "..."}
+    {"type": "summary", "user_id": "u1", "scope": "session", "text": "...", ...}
+    {"type": "episode", "tier": "hot", "user_id": "u1", "fact": "...", "embedding": [...], ...}
+
+Both directions stream: storage is read EXPORT_BATCH_SIZE records per round-trip, and messages
+and episodes are written in batches of the same size (summaries, a few per session, are upserted
+one by one), so memory stays flat whatever the size of the user's history.
+Session counters and daily rollups are rebuilt from the restored messages. Restoring the
+same export twice duplicates its messages and episodes, so restore into an empty user.
+
+CLI (run from the directory containing the package):
+    python -m ai_memory_fastapi.services.export export u1 -o u1.ndjson.gz
+    python -m ai_memory_fastapi.services.export import u1.ndjson.gz [--user-id u2]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from ..config import settings
+from ..logging_config import configure_logging
+from ..models import Episode, Message, Summary
+from ..responses import dumps
+from ..storage.store import store
+from .ingest import iter_lines
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT_VERSION = 1
+CHUNK_BYTES = 64 * 1024  # Lines are coalesced into chunks of about this size
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+# ------------------------------------------------------------------
+# Export
+# ------------------------------------------------------------------
+async def export_records(user_id: str) -> AsyncIterator[Dict[str, Any]]:
+    batch_size = settings.EXPORT_BATCH_SIZE
+    yield {"type": "export", "version": EXPORT_FORMAT_VERSION, "user_id": user_id,
+           "exported_at": datetime.utcnow()}
+    async for message in store.iter_messages(user_id, batch_size):
+        yield {"type": "message", **message.__dict__}
+    async for summary in store.iter_summaries(user_id, batch_size):
+        yield {"type": "summary", **summary.__dict__}
+    for tier in ("hot", "cold"):
+        async for episode in store.iter_episodes(user_id, batch_size, cold=tier == "cold"):
+            yield {"type": "episode", "tier": tier, **episode.__dict__}
+
+
+async def export_user_memory(user_id: str) -> AsyncIterator[bytes]:
+    """NDJSON bytes of the user's memory, in chunks of about CHUNK_BYTES."""
+    chunk: List[bytes] = []
+    size = 0
+    async for record in export_records(user_id):
+        line = dumps(record) + b"\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield b"".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Gzip-compresses a byte stream on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 16 + 15: gzip container
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+# ------------------------------------------------------------------
+# Restore
+# ------------------------------------------------------------------
+async def maybe_gunzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Passes plain chunks through; a gzip stream (told by its magic bytes) is inflated on the fly."""
+    decompressor = None
+    first = True
+    async for chunk in chunks:
+        if first:
+            first = False
+            if chunk.startswith(GZIP_MAGIC):
+                decompressor = zlib.decompressobj(31)
+        if decompressor is None:
+            yield chunk
+            continue
+        # Bounded output per step, so a highly compressed chunk can't balloon memory
+        data = decompressor.decompress(chunk, CHUNK_BYTES)
+        while data:
+            yield data
+            data = decompressor.decompress(decompressor.unconsumed_tail, CHUNK_BYTES)
+    if decompressor is not None:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+async def import_user_memory(lines: AsyncIterator[str], user_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Restores an export stream. `user_id` restores into a different user than the one exported.
+    Malformed lines are skipped and counted.
+    """
+    batch_size = settings.EXPORT_BATCH_SIZE
+    stats = {"user_id": user_id, "messages": 0, "summaries": 0, "episodes": 0, "errors": 0}
+    messages: List[Message] = []
+    episodes: List[Tuple[Episode, bool]] = []
+    sessions: Set[Tuple[str, str]] = set()
+
+    async def flush_messages():
+        stats["messages"] += await store.save_messages_bulk(messages)
+        messages.clear()
+
+    async def flush_episodes():
+        await store.restore_episodes([episode for episode, _ in episodes], [cold for _, cold in episodes])
+        stats["episodes"] += len(episodes)
+        episodes.clear()
+
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            kind = record.pop("type")
+            if kind == "export":
+                if record.get("version") != EXPORT_FORMAT_VERSION:
+                    raise ValueError(f"unsupported export version {record.get('version')}")
+                stats["user_id"] = user_id or record["user_id"]
+                continue
+            if user_id:
+                record["user_id"] = user_id
+            if kind == "message":
+                message = Message(**record)
+                messages.append(message)
+                if message.session_id:
+                    sessions.add((message.user_id, message.session_id))
+                if len(messages) >= batch_size:
+                    await flush_messages()
+            elif kind == "summary":
+                await store.upsert_summary(Summary(**record))
+                stats["summaries"] += 1
+            elif kind == "episode":
+                cold = record.pop("tier", "hot") == "cold"
+                episodes.append((Episode(**record), cold))
+                if len(episodes) >= batch_size:
+                    await flush_episodes()
+            else:
+                raise ValueError(f"unknown record type {kind!r}")
+        except Exception as e:
+            stats["errors"] += 1
+            logger.warning("Skipping malformed export record on line %d: %s", line_number, e)
+
+    if messages:
+        await flush_messages()
+    if episodes:
+        await flush_episodes()
+
+    # The restored summaries already cover the history; don't re-trigger on the next live turn
+    for session_user_id, session_id in sessions:
+        state = await store.get_session_state(session_user_id, session_id)
+        if state:
+            await store.claim_session_summary(state, 1)
+    logger.info("Restored memory export: %s", stats)
+    return stats
+
+
+# ------------------------------------------------------------------
+# CLI
+# ------------------------------------------------------------------
+async def _file_chunks(path: str) -> AsyncIterator[bytes]:
+    with (sys.stdin.buffer if path == "-" else open(path, "rb")) as f:
+        while True:
+            chunk = f.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def main(args: argparse.Namespace):
+    await store.connect()
+    try:
+        if args.command == "export":
+            chunks = export_user_memory(args.user_id)
+            if args.gzip or (args.output or "").endswith(".gz"):
+                chunks = gzip_chunks(chunks)
+            out = open(args.output, "wb") if args.output else sys.stdout.buffer
+            try:
+                async for chunk in chunks:
+                    out.write(chunk)
+            finally:
+                if args.output:
+                    out.close()
+        else:
+            stats = await import_user_memory(iter_lines(maybe_gunzip(_file_chunks(args.file))), args.user_id)
+            print(f"Restored {stats['messages']} messages, {stats['summaries']} summaries and "
+                  f"{stats['episodes']} episodes for {stats['user_id']} ({stats['errors']} malformed)")
+    finally:
+        await store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a user's memory as NDJSON, or restore an export.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Stream a user's messages, summaries and episodes out")
+    export_parser.add_argument("user_id")
+    export_parser.add_argument("-o", "--output", help="Output file (default: stdout); a .gz name implies --gzip")
+    export_parser.add_argument("--gzip", action="store_true", help="Gzip-compress the output")
+    import_parser = commands.add_parser("import", help="Restore an export (plain or gzipped; - for stdin)")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--user-id", help="Restore into this user instead of the exported one")
+    parsed = parser.parse_args()
+    configure_logging()
+    asyncio.run(main(parsed))
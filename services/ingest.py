@@ -0,0 +1,204 @@
+"""
+Bulk history import.
+
+Conversations arrive as NDJSON, one conversation per line:
+    {"user_id": "u1", "session_id": "s1", "messages": [{"role": "user", "content": "...", "created_at": "..."}]}
+
+Messages are streamed into storage with batched unordered insert_many. Episode extraction and
+session/lifetime summaries then run as a resumable, bounded-concurrency backfill tracked in
+the backfill_tasks collection. A task that hits an error (e.g. Ollama down) is marked failed
+at the message it stopped on; resuming the run retries it from there, and a user's lifetime
+summary waits until all of their sessions are done.
+
+CLI (run from the directory containing the package):
+    python -m ai_memory_fastapi.services.ingest conversations.ndjson
+    python -m ai_memory_fastapi.services.ingest --resume <run_id>
+"""
+import argparse
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from ..config import settings
+from ..logging_config import configure_logging
+from ..models import Message
+from ..storage.store import store
+from .memory_logic import extract_episodes, refresh_session_summary, refresh_lifetime_summary
+
+logger = logging.getLogger(__name__)
+
+
+def parse_conversation(line: str) -> List[Message]:
+    record = json.loads(line)
+    user_id = record["user_id"]
+    session_id = record.get("session_id") or f"default_session_{user_id}"
+    return [
+        Message(user_id=user_id, session_id=session_id, **message)
+        for message in record["messages"]
+    ]
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Splits a byte stream (e.g. a request body) into text lines."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8")
+    if buffer:
+        yield buffer.decode("utf-8")
+
+
+async def ingest_conversations(lines: AsyncIterator[str], run_id: Optional[str] = None) -> Dict[str, Any]:
+    """Streams NDJSON conversations into the messages collection and registers backfill work."""
+    run_id = run_id or uuid.uuid4().hex
+    batch: List[Message] = []
+    batch_sessions: Set[Tuple[str, str]] = set()
+    stats = {"run_id": run_id, "conversations": 0, "messages": 0, "errors": 0}
+
+    async def flush():
+        stats["messages"] += await store.save_messages_bulk(batch)
+        # Registered per batch, so a crash mid-import still leaves backfill work for what landed
+        await store.add_backfill_tasks(run_id, "session", list(batch_sessions))
+        batch.clear()
+        batch_sessions.clear()
+
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            messages = parse_conversation(line)
+        except Exception as e:
+            stats["errors"] += 1
+            logger.warning("Skipping malformed conversation on line %d: %s", line_number, e)
+            continue
+
+        stats["conversations"] += 1
+        batch.extend(messages)
+        batch_sessions.update((m.user_id, m.session_id) for m in messages)
+        if len(batch) >= settings.INGEST_BATCH_SIZE:
+            await flush()
+
+    if batch:
+        await flush()
+    return stats
+
+
+async def _backfill_session(task: Dict[str, Any]):
+    """
+    Extracts episodes from each user message (resuming at messages_done), then summarizes the
+    session. Errors propagate with messages_done left at the failed message.
+    """
+    user_id, session_id = task["user_id"], task["session_id"]
+    done = task.get("messages_done", 0)
+    while True:
+        page = await store.get_session_messages(user_id, session_id, "user", done, 100)
+        for message in page:
+            await extract_episodes(user_id, session_id, message.content)
+            done += 1
+            await store.update_backfill_task(task["_id"], messages_done=done)
+        if len(page) < 100:
+            break
+
+    await refresh_session_summary(user_id, session_id)
+    state = await store.get_session_state(user_id, session_id)
+    if state:
+        # The import is summarized now; don't re-trigger on the session's next live turn
+        await store.claim_session_summary(state, 1)
+
+
+async def _backfill_lifetime(task: Dict[str, Any]):
+    # Sessions are extracted in parallel, so concurrent near-duplicates can slip past the write-time check
+    await store.compact_episodes(task["user_id"])
+    await store.enforce_retention(task["user_id"])
+    await refresh_lifetime_summary(task["user_id"])
+
+
+async def _run_tasks(run_id: str, kind: str, handler, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    completed = 0
+
+    async def run_one(task: Dict[str, Any]):
+        nonlocal completed
+        async with semaphore:
+            await store.update_backfill_task(task["_id"], status="running")
+            try:
+                await handler(task)
+            except Exception as e:
+                logger.error("Backfill %s task failed for user=%s: %s", kind, task["user_id"], e)
+                await store.update_backfill_task(task["_id"], status="failed", error=str(e))
+                return
+            await store.update_backfill_task(task["_id"], status="done")
+            completed += 1
+            if completed % 50 == 0:
+                logger.info("Backfill %s: %d %s tasks done in this pass", run_id, completed, kind)
+
+    while True:
+        tasks = await store.get_open_backfill_tasks(run_id, kind, concurrency * 25)
+        if not tasks:
+            break
+        await asyncio.gather(*(run_one(task) for task in tasks))
+
+
+async def run_backfill(run_id: str, concurrency: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Runs (or resumes) the backfill for an import run: per-session extraction and summaries,
+    then one lifetime refresh per user. Safe to call again after a crash; failed tasks are
+    retried from where they stopped.
+    """
+    concurrency = concurrency or settings.BACKFILL_CONCURRENCY
+    reopened = await store.reopen_failed_backfill_tasks(run_id)
+    if reopened:
+        logger.info("Backfill %s: retrying %d failed tasks", run_id, reopened)
+
+    await _run_tasks(run_id, "session", _backfill_session, concurrency)
+
+    # Users with a failed session wait for the next resume, so their lifetime summary covers it
+    users = await store.get_backfill_users(run_id)
+    await store.add_backfill_tasks(run_id, "lifetime", [(user_id, None) for user_id in users])
+    await _run_tasks(run_id, "lifetime", _backfill_lifetime, concurrency)
+
+    progress = await store.get_backfill_progress(run_id)
+    logger.info("Backfill %s finished: %s", run_id, progress)
+    return progress
+
+
+async def _file_lines(paths: Iterable[str]) -> AsyncIterator[str]:
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield line
+
+
+async def main(args: argparse.Namespace):
+    await store.connect()
+    try:
+        run_id = args.resume
+        if not run_id:
+            stats = await ingest_conversations(_file_lines(args.files), run_id=args.run_id)
+            print(f"Imported {stats['messages']} messages from {stats['conversations']} conversations "
+                  f"({stats['errors']} malformed) as run {stats['run_id']}")
+            run_id = stats["run_id"]
+        if not args.no_backfill:
+            await run_backfill(run_id, args.concurrency)
+    finally:
+        await store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-import NDJSON conversations and backfill memory.")
+    parser.add_argument("files", nargs="*", help="NDJSON files, one conversation per line")
+    parser.add_argument("--run-id", help="Name for this import run (default: random)")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Resume the backfill of an earlier run")
+    parser.add_argument("--no-backfill", action="store_true", help="Only load messages")
+    parser.add_argument("--concurrency", type=int, help="Sessions processed in parallel")
+    parsed = parser.parse_args()
+    configure_logging()
+    if not parsed.files and not parsed.resume:
+        parser.error("give NDJSON files to import or --resume RUN_ID")
+    asyncio.run(main(parsed))
@@ -0,0 +1,230 @@
+"""
+Admission control and priority scheduling for LLM calls.
+
+Every Ollama call takes a slot from its pool (chat or embed) at a priority. When the pool
+is busy, calls wait in a bounded queue and get freed slots most important first:
+    REPLY > QUERY_EMBEDDING > EXTRACTION > SUMMARIZATION
+A full queue sheds its least important waiter to make room for a more important call,
+and turns the call away otherwise, so background memory work gives way to replies
+before anything user-facing is refused.
+
+Chat turns are also admitted up front: a per-user token bucket caps how fast one user
+can start turns, and a turn whose reply couldn't be queued is refused before any work
+is done. Both raise LLMOverloaded, which the API answers with 429 and Retry-After.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..metrics import LLM_QUEUE_WAIT_SECONDS, LLM_REJECTIONS
+
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+
+
+class Priority(IntEnum):
+    """Lower value is served first."""
+    REPLY = 0
+    QUERY_EMBEDDING = 1
+    EXTRACTION = 2
+    SUMMARIZATION = 3
+
+
+class LLMOverloaded(Exception):
+    """A call or chat turn was turned away; retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        self.reason = reason
+        self.retry_after = min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(retry_after)))
+        super().__init__(f"LLM capacity exceeded ({reason}); retry after {self.retry_after}s")
+
+
+# ------------------------------------------------------------------
+# Per-user rate limits
+# ------------------------------------------------------------------
+class UserRateLimiter:
+    """
+    Token bucket per user: `burst` turns back to back, refilled at `rate_per_minute`.
+    Buckets of the least recently seen users are dropped beyond `max_users`; a dropped
+    bucket comes back full, which only ever errs on the side of admitting.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int, max_users: int = 100_000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_users = max_users
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # user -> (tokens, updated)
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, user_id: str) -> float:
+        """Takes a token for the user: 0.0 if granted, else seconds until one is available."""
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(user_id, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1.0:
+            tokens -= 1.0
+        else:
+            wait = (1.0 - tokens) / self.rate
+            self.limited += 1
+        self._buckets[user_id] = (tokens, now)
+        self._buckets.move_to_end(user_id)
+        while len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate_per_minute": self.rate * 60,
+            "burst": self.burst,
+            "users": len(self._buckets),
+            "limited": self.limited,
+        }
+
+
+# ------------------------------------------------------------------
+# Priority slots
+# ------------------------------------------------------------------
+class PrioritySlots:
+    """
+    A semaphore of `limit` slots whose waiters are served by priority, then arrival.
+    At most `max_queued` calls wait (0 for no bound). A freed slot is handed straight to
+    the next waiter, so a newcomer can't overtake the queue.
+    """
+
+    def __init__(self, name: str, limit: int, max_queued: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queued = max_queued
+        self.in_use = 0
+        # Heap of [priority, seq, future]; entries whose future is done are dead and skipped
+        self._waiters: List[List] = []
+        self._seq = itertools.count()
+        self._queued = {priority: 0 for priority in Priority}
+        self._hold_seconds = 1.0  # EWMA of how long a slot is held, for Retry-After estimates
+        self._waits = {priority: [0, 0.0, 0.0] for priority in Priority}  # count, total, max seconds
+        self._rejected = {priority: 0 for priority in Priority}
+        self._shed = {priority: 0 for priority in Priority}
+
+    @property
+    def queued(self) -> int:
+        return sum(self._queued.values())
+
+    def retry_after(self) -> float:
+        """Rough seconds until the current queue has drained."""
+        return self._hold_seconds * (self.queued + 1) / self.limit
+
+    def _full(self) -> bool:
+        return self.max_queued > 0 and self.queued >= self.max_queued
+
+    def _least_important_waiter(self) -> Optional[List]:
+        live = [entry for entry in self._waiters if not entry[2].done()]
+        return max(live, key=lambda entry: (entry[0], entry[1])) if live else None
+
+    def check(self, priority: Priority):
+        """Raises LLMOverloaded if a call at `priority` would be turned away right now."""
+        if self.in_use < self.limit or not self._full():
+            return
+        worst = self._least_important_waiter()
+        if worst is None or worst[0] <= priority:
+            self._reject(priority, "queue_full")
+
+    def _reject(self, priority: Priority, reason: str):
+        self._rejected[priority] += 1
+        LLM_REJECTIONS.inc(pool=self.name, priority=priority.name.lower(), reason=reason)
+        raise LLMOverloaded(reason, self.retry_after())
+
+    def _record_wait(self, priority: Priority, seconds: float):
+        stats = self._waits[priority]
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+        LLM_QUEUE_WAIT_SECONDS.observe(seconds, pool=self.name, priority=priority.name.lower())
+
+    async def acquire(self, priority: Priority):
+        if self.in_use < self.limit and not self.queued:
+            self.in_use += 1
+            self._record_wait(priority, 0.0)
+            return
+
+        if self._full():
+            worst = self._least_important_waiter()
+            if worst is None or worst[0] <= priority:
+                self._reject(priority, "queue_full")
+            # Make room by shedding the least important (and, among equals, newest) waiter
+            shed_priority = Priority(worst[0])
+            self._queued[shed_priority] -= 1
+            self._shed[shed_priority] += 1
+            LLM_REJECTIONS.inc(pool=self.name, priority=shed_priority.name.lower(), reason="shed")
+            worst[2].set_exception(LLMOverloaded("shed", self.retry_after()))
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [int(priority), next(self._seq), future])
+        self._queued[priority] += 1
+        start = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._queued[priority] -= 1
+            elif future.exception() is None:
+                # The slot was handed over just as the caller was cancelled; pass it on
+                self._release()
+            raise
+        self._record_wait(priority, time.perf_counter() - start)
+
+    def _release(self):
+        while self._waiters:
+            priority, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._queued[Priority(priority)] -= 1
+                future.set_result(None)  # The slot changes hands; in_use stays the same
+                return
+        self.in_use -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority):
+        await self.acquire(priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * (time.perf_counter() - start)
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        def waits(priority: Priority) -> Dict[str, Any]:
+            count, total, longest = self._waits[priority]
+            return {
+                "queued": self._queued[priority],
+                "granted": count,
+                "mean_wait_ms": round(total * 1000 / count, 1) if count else None,
+                "max_wait_ms": round(longest * 1000, 1),
+                "rejected": self._rejected[priority],
+                "shed": self._shed[priority],
+            }
+
+        return {
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "avg_hold_ms": round(self._hold_seconds * 1000, 1),
+            "priorities": {priority.name.lower(): waits(priority) for priority in Priority},
+        }
+
+
+chat_rate_limiter = UserRateLimiter(settings.CHAT_USER_RATE_PER_MINUTE, settings.CHAT_USER_BURST)
@@ -1,11 +1,89 @@
-from typing import List, Dict, Optional
+from typing import Any, Awaitable, List, Dict, Optional
 from datetime import datetime
 from ..config import settings
-from ..models import Message, Summary, Episode
-from ..mongoimpl.mongo import mongo_manager
+from ..metrics import CONTEXT_MISSES, STAGE_SECONDS
+from ..models import Message, Summary, Episode, MemoryContext
+from ..storage.store import store
 from .ollama_client import ollama_client
-from .embeddings import generate_embedding
+from .embeddings import generate_embedding, generate_embeddings
+from .llm_scheduler import Priority
+from .prompt_packing import ContextPacker
+import asyncio
 import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+async def assemble_context(user_id: str, session_id: str, current_message_content: str,
+                           include_cold: bool = False) -> MemoryContext:
+    """
+    Gathers chat memory concurrently: the short-term window, both summaries, and episodic
+    retrieval (query embedding, then similarity search; `include_cold` forces the cold tier in).
+    Each source has its own deadline; a source that misses it or fails is left out of the
+    context instead of stalling the turn.
+    """
+    context = MemoryContext()
+
+    async def timed(name: str, awaitable: Awaitable, timeout_ms: int, default: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(awaitable, timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            logger.warning("Context source '%s' missed its %dms deadline for user=%s", name, timeout_ms, user_id)
+            context.missed_sources.append(name)
+            CONTEXT_MISSES.inc(source=name)
+            return default
+        except Exception as e:
+            logger.error("Context source '%s' failed for user=%s: %s", name, user_id, e)
+            context.missed_sources.append(name)
+            CONTEXT_MISSES.inc(source=name)
+            return default
+        finally:
+            elapsed = time.perf_counter() - start
+            context.latency_ms[name] = round(elapsed * 1000, 3)
+            STAGE_SECONDS.observe(elapsed, stage=name)
+
+    async def retrieve_facts() -> List[str]:
+        embedding = await timed(
+            "query_embedding", generate_embedding(current_message_content),
+            settings.CONTEXT_EMBEDDING_TIMEOUT_MS, None
+        )
+        if embedding is None:
+            return []
+        episodes = await timed(
+            "episodes",
+            store.get_top_k_episodes_by_similarity(user_id, embedding, settings.EPISODE_RETRIEVAL_K, include_cold),
+            settings.CONTEXT_EPISODES_TIMEOUT_MS, []
+        )
+        return [ep.fact for ep in episodes]
+
+    (
+        context.short_term_messages,
+        context.latest_session_summary,
+        context.latest_lifetime_summary,
+        context.episodic_facts,
+    ) = await asyncio.gather(
+        # Include the current user message in the window, so we fetch N-1 older messages
+        timed(
+            "short_term",
+            store.get_last_n_messages(user_id, session_id, settings.SHORT_TERM_N - 1),
+            settings.CONTEXT_SHORT_TERM_TIMEOUT_MS, []
+        ),
+        timed(
+            "session_summary",
+            store.get_latest_summary(user_id, "session", session_id),
+            settings.CONTEXT_SUMMARY_TIMEOUT_MS, None
+        ),
+        timed(
+            "lifetime_summary",
+            store.get_latest_summary(user_id, "user", None),
+            settings.CONTEXT_SUMMARY_TIMEOUT_MS, None
+        ),
+        retrieve_facts(),
+    )
+    return context
 
 
 async def compose_chat_prompt(
@@ -17,42 +95,40 @@ async def compose_chat_prompt(
     latest_lifetime_summary: Optional[Summary],
     episodic_facts: List[str]
 ) -> List[Dict]:
-    """Composes the prompt for the chat model."""
-    
-    messages = []
+    """Composes the prompt for the chat model, packed into PROMPT_TOKEN_BUDGET tokens."""
 
     # System primer
     system_primer = (
         "You are a helpful AI assistant. Respond concisely and accurately. "
         "Use the provided context to inform your answers, but do not directly quote it unless necessary."
     )
-    messages.append({"role": "system", "content": system_primer})
 
-    # Long-term summaries
-    if latest_lifetime_summary:
-        messages.append({"role": "system", "content": f"User's lifetime summary: {latest_lifetime_summary.text}"})
-    if latest_session_summary:
-        messages.append({"role": "system", "content": f"Current session summary: {latest_session_summary.text}"})
+    # Short-term memory, newest first; the current message is sent separately, so skip its copies
+    history = [{"role": msg.role, "content": msg.content} for msg in short_term_messages]
+    while history and history[0]["role"] == "user" and history[0]["content"] == current_message_content:
+        history.pop(0)
 
-    # Episodic facts
-    if episodic_facts:
-        facts_str = "; ".join(episodic_facts)
-        messages.append({"role": "system", "content": f"Relevant past experiences: {facts_str}"})
-
-    # Short-term memory (reversed to be chronologically correct in prompt)
-    for msg in reversed(short_term_messages):
-        messages.append({"role": msg.role, "content": msg.content})
-
-    # Current user message
-    messages.append({"role": "user", "content": current_message_content})
-
-    return messages
+    packer = ContextPacker(
+        settings.PROMPT_TOKEN_BUDGET, settings.PROMPT_LIFETIME_SUMMARY_TOKENS, settings.PROMPT_SESSION_SUMMARY_TOKENS
+    )
+    return packer.pack(
+        system_primer=system_primer,
+        current_message=current_message_content,
+        history=history,
+        facts=episodic_facts,
+        session_summary=latest_session_summary.text if latest_session_summary else None,
+        lifetime_summary=latest_lifetime_summary.text if latest_lifetime_summary else None,
+    )
 
 
-async def extract_and_store_episodes(user_id: str, session_id: Optional[str], user_message: str):
+async def extract_episodes(user_id: str, session_id: Optional[str], user_message: str,
+                           store_after: Optional[asyncio.Event] = None) -> int:
     """
     Extracts facts from a user message, embeds them, and stores them as episodes.
-    This version safely handles malformed JSON and ensures only valid facts are stored.
+    Malformed extraction output stores nothing; LLM, embedding and storage failures raise.
+    With `store_after`, extraction and embedding run right away but the episode writes wait
+    for the event, so a retrieval running alongside only sees episodes stored before it.
+    Returns the number of episodes stored.
     """
     prompt_for_facts = (
         f"Extract up to {settings.EPISODE_EXTRACTION_LIMIT} short, concise facts "
@@ -63,53 +139,53 @@ async def extract_and_store_episodes(user_id: str, session_id: Optional[str], us
         f"User message: '{user_message}'"
     )
 
-    try:
+    with STAGE_SECONDS.time(stage="extract_facts"):
         response_text = await ollama_client.chat_completion(
-            messages=[{"role": "user", "content": prompt_for_facts}]
+            messages=[{"role": "user", "content": prompt_for_facts}], priority=Priority.EXTRACTION
         )
 
-        # Clean markdown if present (```json)
-        cleaned_text = response_text.replace("```json", "").replace("```", "").strip()
-
-        try:
-            parsed = json.loads(cleaned_text)
-            facts = [
-                f for f in parsed
-                if isinstance(f, dict) and "fact" in f and "importance" in f
-            ]
-            print(f"[DEBUG] Extracted valid facts: {facts}")
-        except Exception as e:
-            print(f"[WARN] Could not parse extracted facts: {e}\nRaw response:\n{response_text}")
-            return
+    # Clean markdown if present (```json)
+    cleaned_text = response_text.replace("```json", "").replace("```", "").strip()
 
-        for item in facts:
-            fact_text = item.get("fact")
-            importance = float(item.get("importance", 0.5))
-
-            if not fact_text:
-                continue
+    try:
+        parsed = json.loads(cleaned_text)
+        facts = [
+            f for f in parsed
+            if isinstance(f, dict) and "fact" in f and "importance" in f
+        ]
+        logger.debug("Extracted valid facts: %s", facts)
+    except Exception as e:
+        logger.warning("Could not parse extracted facts: %s\nRaw response:\n%s", e, response_text)
+        return 0
 
-            embedding = await generate_embedding(fact_text)
-            print(f"[DEBUG] Saving episode: '{fact_text}' | dim={len(embedding)} | importance={importance}")
+    facts = [
+        (item.get("fact"), float(item.get("importance", 0.5)))
+        for item in facts if item.get("fact")
+    ]
+    # One embedding round-trip for all extracted facts
+    embeddings = await generate_embeddings([fact_text for fact_text, _ in facts], Priority.EXTRACTION)
 
-            episode = Episode(
-                user_id=user_id,
-                session_id=session_id,
-                fact=fact_text,
-                importance=min(max(0.0, importance), 1.0),
-                embedding=embedding,
-                created_at=datetime.utcnow()
-            )
+    if store_after is not None:
+        await store_after.wait()
+    for (fact_text, importance), embedding in zip(facts, embeddings):
+        logger.debug("Saving episode: '%s' | dim=%d | importance=%s", fact_text, len(embedding), importance)
 
-            await mongo_manager.save_episode(episode)
-            print(f"[DEBUG] ✅ Episode saved for user={user_id}")
+        episode = Episode(
+            user_id=user_id,
+            session_id=session_id,
+            fact=fact_text,
+            importance=min(max(0.0, importance), 1.0),
+            embedding=embedding,
+            created_at=datetime.utcnow()
+        )
 
-    except Exception as e:
-        print(f"[ERROR] Episode extraction or storage failed: {e}")
+        await store.save_episode(episode)
+        logger.debug("Episode saved for user=%s", user_id)
+    return len(facts)
 
 
 async def summarize_conversation(user_id: str, session_id: str, recent_messages: List[Message]) -> Optional[Summary]:
-    """Generates a session summary from recent messages."""
+    """Generates a session summary from recent messages; LLM errors are raised."""
     
     if not recent_messages:
         return None
@@ -123,49 +199,84 @@ async def summarize_conversation(user_id: str, session_id: str, recent_messages:
         f"Conversation:\n{conversation_text}"
     )
 
-    try:
+    with STAGE_SECONDS.time(stage="summarize_session"):
         summary_text = await ollama_client.chat_completion(
-            messages=[{"role": "user", "content": prompt}]
+            messages=[{"role": "user", "content": prompt}], priority=Priority.SUMMARIZATION
         )
-        return Summary(
-            user_id=user_id,
-            session_id=session_id,
-            scope="session",
-            text=summary_text,
-            created_at=datetime.utcnow()
+    return Summary(
+        user_id=user_id,
+        session_id=session_id,
+        scope="session",
+        text=summary_text,
+        created_at=datetime.utcnow()
+    )
+
+
+async def refresh_session_summary(user_id: str, session_id: str) -> Optional[Summary]:
+    """Re-summarizes the recent window of a session and stores the result."""
+    recent_session_messages = await store.get_last_n_messages(
+        user_id, session_id, settings.SHORT_TERM_N * 2
+    )  # Get more messages for summary
+    new_session_summary = await summarize_conversation(user_id, session_id, recent_session_messages)
+    if new_session_summary:
+        await store.upsert_summary(new_session_summary)
+    return new_session_summary
+
+
+async def _merge_into_rollup(existing_text: Optional[str], new_texts: List[str], level: str) -> str:
+    """Folds a bounded batch of new summaries into an existing rollup with one LLM call."""
+    new_text = "\n".join([f"- {text}" for text in new_texts])
+    if existing_text:
+        prompt = (
+            f"Here is the current {level} profile of a user, followed by newer summaries. "
+            "Merge the new information into the profile, keeping recurring themes, user preferences, "
+            "and significant information, and replacing details the newer summaries contradict. "
+            "Return only the updated profile.\n"
+            f"Current profile:\n{existing_text}\n"
+            f"New summaries:\n{new_text}"
+        )
+    else:
+        prompt = (
+            f"Condense the following summaries into a single, comprehensive {level} profile "
+            "for the user. Focus on recurring themes, user preferences, and significant information "
+            "that defines the user's overall interaction. "
+            f"Summaries:\n{new_text}"
+        )
+    with STAGE_SECONDS.time(stage=f"summarize_{level}"):
+        return await ollama_client.chat_completion(
+            messages=[{"role": "user", "content": prompt}], priority=Priority.SUMMARIZATION
         )
-    except Exception as e:
-        print(f"Error during session summarization: {e}")
-        return None
 
 
 async def refresh_lifetime_summary(user_id: str):
-    """Refreshes the lifetime summary by condensing all session summaries."""
-    session_summaries = await mongo_manager.get_all_session_summaries(user_id)
-    if not session_summaries:
-        return None
+    """
+    Incrementally refreshes the lifetime summary.
+
+    Only session summaries newer than the lifetime summary's watermark are processed, a
+    page at a time: each page is folded into the lifetime summary with one LLM call, which
+    sees at most LIFETIME_MERGE_BATCH summaries plus the current lifetime summary, however
+    long the history. LLM and storage errors are raised; a retry resumes from the last
+    stored watermark.
+    """
+    batch_size = max(1, settings.LIFETIME_MERGE_BATCH)
+    lifetime_summary = await store.get_latest_summary(user_id, "user", None)
+
+    while True:
+        watermark = lifetime_summary.watermark if lifetime_summary else None
+        new_summaries = await store.get_session_summaries_since(user_id, watermark, batch_size)
+        if not new_summaries:
+            return lifetime_summary
 
-    summaries_text = "\n".join([f"- {s.text}" for s in session_summaries])
-    
-    prompt = (
-        "Condense the following session summaries into a single, comprehensive lifetime profile "
-        "for the user. Focus on recurring themes, user preferences, and significant information "
-        "that defines the user's overall interaction. "
-        f"Session Summaries:\n{summaries_text}"
-    )
-    try:
-        lifetime_summary_text = await ollama_client.chat_completion(
-            messages=[{"role": "user", "content": prompt}]
-        )
         lifetime_summary = Summary(
             user_id=user_id,
             session_id=None,  # Null for lifetime
             scope="user",
-            text=lifetime_summary_text,
+            text=await _merge_into_rollup(
+                lifetime_summary.text if lifetime_summary else None,
+                [s.text for s in new_summaries],
+                "lifetime"
+            ),
+            watermark=new_summaries[-1].created_at,
             created_at=datetime.utcnow()
         )
-        await mongo_manager.upsert_summary(lifetime_summary)
-        return lifetime_summary
-    except Exception as e:
-        print(f"Error during lifetime summarization: {e}")
-        return None
+        await store.upsert_summary(lifetime_summary)
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from ..config import settings
+from ..storage.store import store
+from .llm_scheduler import LLMOverloaded
+from .memory_logic import extract_episodes, refresh_session_summary, refresh_lifetime_summary
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryWorker:
+    """
+    Background pool for memory maintenance (fact extraction, session and lifetime summaries,
+    near-duplicate episode compaction, hot/cold episode retention).
+
+    Jobs are persisted in the storage backend's jobs table before they are put on a bounded
+    in-process queue, so queued work survives restarts. Summary jobs carry a dedup key:
+    while one is still queued, further requests for the same user/session collapse into it.
+    A job whose handler raises is released and retried, up to MEMORY_JOB_MAX_ATTEMPTS; one
+    whose LLM call was shed by the scheduler is left for the next sweep and not failed.
+    Users whose episodes changed are compacted, then have the retention policy applied,
+    every EPISODE_COMPACTION_INTERVAL_SECONDS.
+    """
+
+    def __init__(self):
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._queued_ids: Set[Any] = set()
+        self._running_ids: Set[Any] = set()
+        self._maintenance_candidates: Set[str] = set()
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Awaitable[None]]] = {
+            "extract_episodes": self._extract_episodes,
+            "summarize_session": self._summarize_session,
+            "refresh_lifetime": self._refresh_lifetime,
+            "compact_episodes": self._compact_episodes,
+            "enforce_retention": self._enforce_retention,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def backlog(self) -> int:
+        """Jobs queued or in progress in this process."""
+        return len(self._queued_ids) + len(self._running_ids)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=settings.MEMORY_QUEUE_MAXSIZE)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(settings.MEMORY_WORKERS)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+        if settings.EPISODE_COMPACTION_INTERVAL_SECONDS > 0:
+            self._tasks.append(asyncio.create_task(self._schedule_episode_maintenance()))
+        logger.info("Memory worker pool started (%d workers).", settings.MEMORY_WORKERS)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # Hand interrupted jobs straight back to the queue instead of waiting out their lease
+        for job_id in list(self._running_ids):
+            await store.release_job(job_id, error="interrupted by shutdown")
+        self._running_ids.clear()
+        self._queued_ids.clear()
+
+    # ------------------------------------------------------------------
+    # Enqueueing
+    # ------------------------------------------------------------------
+    async def enqueue_extraction(self, user_id: str, session_id: Optional[str], message: str):
+        await self._enqueue(
+            "extract_episodes",
+            {"user_id": user_id, "session_id": session_id, "message": message}
+        )
+
+    async def enqueue_session_summary(self, user_id: str, session_id: str):
+        await self._enqueue(
+            "summarize_session",
+            {"user_id": user_id, "session_id": session_id},
+            dedup_key=f"summarize_session:{user_id}:{session_id}"
+        )
+
+    async def enqueue_lifetime_refresh(self, user_id: str):
+        await self._enqueue(
+            "refresh_lifetime",
+            {"user_id": user_id},
+            dedup_key=f"refresh_lifetime:{user_id}"
+        )
+
+    async def enqueue_compaction(self, user_id: str):
+        await self._enqueue(
+            "compact_episodes",
+            {"user_id": user_id},
+            dedup_key=f"compact_episodes:{user_id}"
+        )
+
+    async def enqueue_retention(self, user_id: str):
+        await self._enqueue(
+            "enforce_retention",
+            {"user_id": user_id},
+            dedup_key=f"enforce_retention:{user_id}"
+        )
+
+    async def _enqueue(self, kind: str, payload: Dict[str, Any], dedup_key: Optional[str] = None):
+        # Without a running pool (BACKGROUND_MEMORY_JOBS off) the work happens inline, best effort
+        if not self.running:
+            try:
+                await self._handlers[kind](payload)
+            except Exception as e:
+                logger.error("Inline memory job %s failed: %s", kind, e)
+            return
+
+        job_id = await store.enqueue_job(kind, payload, dedup_key)
+        if job_id is None:
+            return  # Merged into an already queued job
+
+        if asyncio.current_task() in self._tasks:
+            # Workers must never block on their own queue; the sweeper picks overflow up from storage
+            if not self.queue.full():
+                self._put_nowait(job_id)
+            return
+
+        # Request handlers wait here when the queue is full (backpressure)
+        await self.queue.put(job_id)
+        self._queued_ids.add(job_id)
+
+    def _put_nowait(self, job_id):
+        self.queue.put_nowait(job_id)
+        self._queued_ids.add(job_id)
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+    async def _work(self):
+        while True:
+            job_id = await self.queue.get()
+            self._queued_ids.discard(job_id)
+            try:
+                job = await store.claim_job(job_id)
+                if job is None:
+                    continue  # Already claimed (duplicate queue entry or another process)
+                self._running_ids.add(job_id)
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Memory job %s could not be processed: %s", job_id, e)
+            finally:
+                self.queue.task_done()
+
+    async def _run_job(self, job: Dict[str, Any]):
+        job_id = job["_id"]
+        try:
+            await self._handlers[job["kind"]](job["payload"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Shed under load isn't the job's fault: it never fails the job, and waits for the next sweep
+            shed = isinstance(e, LLMOverloaded)
+            failed = not shed and job["attempts"] >= settings.MEMORY_JOB_MAX_ATTEMPTS
+            logger.warning("Memory job %s %s failed (attempt %d): %s", job["kind"], job_id, job["attempts"], e)
+            await store.release_job(job_id, error=str(e), failed=failed)
+            if not failed and not shed and not self.queue.full():
+                self._put_nowait(job_id)
+        else:
+            await store.complete_job(job_id)
+        self._running_ids.discard(job_id)
+
+    async def _sweep(self):
+        """Recovers jobs left by a previous process and any that overflowed the in-process queue."""
+        while True:
+            try:
+                await store.requeue_stale_jobs(settings.MEMORY_JOB_LEASE_SECONDS)
+                for job_id in await store.get_queued_job_ids(settings.MEMORY_QUEUE_MAXSIZE):
+                    if job_id not in self._queued_ids:
+                        await self.queue.put(job_id)
+                        self._queued_ids.add(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Memory job sweep failed: %s", e)
+            await asyncio.sleep(settings.MEMORY_JOB_POLL_SECONDS)
+
+    async def _schedule_episode_maintenance(self):
+        """Periodically queues compaction and retention for every user that gained episodes since the last round."""
+        while True:
+            await asyncio.sleep(settings.EPISODE_COMPACTION_INTERVAL_SECONDS)
+            users, self._maintenance_candidates = self._maintenance_candidates, set()
+            for user_id in users:
+                try:
+                    await self.enqueue_compaction(user_id)
+                    await self.enqueue_retention(user_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error("Could not schedule episode maintenance for user=%s: %s", user_id, e)
+
+    # ------------------------------------------------------------------
+    # Job Handlers
+    # ------------------------------------------------------------------
+    async def _extract_episodes(self, payload: Dict[str, Any]):
+        await extract_episodes(payload["user_id"], payload["session_id"], payload["message"])
+        if self.running and settings.EPISODE_COMPACTION_INTERVAL_SECONDS > 0:
+            self._maintenance_candidates.add(payload["user_id"])
+
+    async def _summarize_session(self, payload: Dict[str, Any]):
+        await refresh_session_summary(payload["user_id"], payload["session_id"])
+        # Recompute lifetime summary occasionally
+        await self.enqueue_lifetime_refresh(payload["user_id"])
+
+    async def _refresh_lifetime(self, payload: Dict[str, Any]):
+        await refresh_lifetime_summary(payload["user_id"])
+
+    async def _compact_episodes(self, payload: Dict[str, Any]):
+        await store.compact_episodes(payload["user_id"])
+
+    async def _enforce_retention(self, payload: Dict[str, Any]):
+        await store.enforce_retention(payload["user_id"])
+
+
+memory_worker = MemoryWorker()
@@ -1,51 +1,305 @@
+import asyncio
 import httpx
 import json
-from typing import List, Dict
+import logging
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
 
 from ..config import settings
+from ..metrics import LLM_TOKENS, OLLAMA_HEDGES, OLLAMA_REQUESTS, OLLAMA_RETRIES, OLLAMA_SECONDS
+from .llm_scheduler import Priority, PrioritySlots
+
+logger = logging.getLogger(__name__)
+
+# Worth another attempt: the model server is overloaded, restarting or briefly unreachable
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, httpx.TransportError)
+
+
+class EndpointStats:
+    """Request count, errors and a window of recent latencies for one backend endpoint."""
+
+    def __init__(self, window: int = 1000):
+        self.requests = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self._latencies: Deque[float] = deque(maxlen=window)
+
+    def record(self, elapsed_ms: float, ok: bool):
+        self.requests += 1
+        self.total_ms += elapsed_ms
+        self._latencies.append(elapsed_ms)
+        if not ok:
+            self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1)
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.requests, 1) if self.requests else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+        }
+
+
+class OllamaBackend:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.in_flight = 0
+        self.endpoints: Dict[str, EndpointStats] = {}
+
+    def stats_for(self, endpoint: str) -> EndpointStats:
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = EndpointStats()
+        return self.endpoints[endpoint]
+
+    @asynccontextmanager
+    async def track(self, endpoint: str):
+        """Counts the call as in flight and records its latency and outcome."""
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            yield
+        except asyncio.CancelledError:
+            # A hedge that lost the race, or a client that went away; not a backend failure
+            raise
+        except BaseException:
+            self._record(endpoint, time.perf_counter() - start, ok=False)
+            raise
+        else:
+            self._record(endpoint, time.perf_counter() - start, ok=True)
+        finally:
+            self.in_flight -= 1
+
+    def _record(self, endpoint: str, elapsed: float, ok: bool):
+        self.stats_for(endpoint).record(elapsed * 1000, ok)
+        OLLAMA_REQUESTS.inc(backend=self.base_url, endpoint=endpoint, outcome="ok" if ok else "error")
+        OLLAMA_SECONDS.observe(elapsed, endpoint=endpoint)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "endpoints": {name: s.snapshot() for name, s in self.endpoints.items()},
+        }
+
 
 class OllamaClient:
     def __init__(self):
-        self.base_url = settings.OLLAMA_BASE_URL
+        urls = [settings.OLLAMA_BASE_URL] + [u.strip() for u in settings.OLLAMA_BASE_URLS.split(",") if u.strip()]
+        self.backends = [OllamaBackend(url) for url in dict.fromkeys(urls)]
+        self.base_url = self.backends[0].base_url
         self.chat_model = settings.CHAT_MODEL
         self.embed_model = settings.EMBED_MODEL
-        self.client = httpx.AsyncClient()
+        # One pooled client serves every backend; httpx keeps a separate pool per host
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.OLLAMA_KEEPALIVE_EXPIRY,
+            )
+        )
+        # Generations are slow and memory-hungry on the server; embeddings are cheap, so they get their own cap.
+        # Calls over a cap queue by priority, so replies go ahead of background memory work
+        self.chat_slots = PrioritySlots("chat", settings.OLLAMA_CHAT_CONCURRENCY, settings.LLM_CHAT_QUEUE_MAX)
+        self.embed_slots = PrioritySlots("embed", settings.OLLAMA_EMBED_CONCURRENCY, settings.LLM_EMBED_QUEUE_MAX)
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    # ------------------------------------------------------------------
+    # Transport: backend selection, retries and hedging
+    # ------------------------------------------------------------------
+    def _pick_backend(self, exclude: Optional[OllamaBackend] = None) -> OllamaBackend:
+        """Least in-flight backend; ties go to a random one so load spreads evenly."""
+        candidates = [b for b in self.backends if b is not exclude] or self.backends
+        fewest = min(b.in_flight for b in candidates)
+        return random.choice([b for b in candidates if b.in_flight == fewest])
+
+    async def _backoff(self, endpoint: str, attempt: int):
+        self.retries += 1
+        OLLAMA_RETRIES.inc(endpoint=endpoint)
+        delay = settings.OLLAMA_RETRY_BACKOFF_MS * (2 ** attempt) * random.uniform(0.5, 1.5)
+        await asyncio.sleep(delay / 1000)
 
-    async def chat_completion(self, messages: List[Dict]) -> str:
-        url = f"{self.base_url}/api/chat"
+    async def _post_once(self, backend: OllamaBackend, endpoint: str, payload: Dict, timeout: float) -> Dict:
+        async with backend.track(endpoint):
+            response = await self.client.post(f"{backend.base_url}{endpoint}", json=payload, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+
+    async def _post_hedged(self, endpoint: str, payload: Dict, timeout: float) -> Dict:
+        """
+        Sends to the least-loaded backend. If hedging is on and it hasn't answered within
+        OLLAMA_HEDGE_DELAY_MS, the same call goes to a second backend and the first answer wins.
+        """
+        primary = self._pick_backend()
+        hedge_delay = settings.OLLAMA_HEDGE_DELAY_MS / 1000
+        if hedge_delay <= 0 or len(self.backends) < 2:
+            return await self._post_once(primary, endpoint, payload, timeout)
+
+        first = asyncio.create_task(self._post_once(primary, endpoint, payload, timeout))
+        pending = {first}
+        error: Optional[BaseException] = None
+        # Requests still running are cancelled on the way out, also when the caller itself is cancelled
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+            if done:
+                return first.result()
+
+            self.hedges += 1
+            OLLAMA_HEDGES.inc(result="sent")
+            second = asyncio.create_task(self._post_once(self._pick_backend(exclude=primary), endpoint, payload, timeout))
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                            OLLAMA_HEDGES.inc(result="won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _post(self, endpoint: str, payload: Dict, timeout: float, slots: PrioritySlots, priority: Priority) -> Dict:
+        attempt = 0
+        while True:
+            try:
+                # A slot per attempt: the backoff sleep doesn't hold one other calls could use
+                async with slots.slot(priority):
+                    return await self._post_hedged(endpoint, payload, timeout)
+            except Exception as e:
+                if attempt >= settings.OLLAMA_MAX_RETRIES or not _is_transient(e):
+                    raise
+                logger.warning("Transient Ollama error on %s (attempt %d), retrying: %r", endpoint, attempt + 1, e)
+                await self._backoff(endpoint, attempt)
+                attempt += 1
+
+    @staticmethod
+    def _count_tokens(data: Dict):
+        # Ollama reports token counts on the final (done) chat response
+        LLM_TOKENS.inc(data.get("prompt_eval_count") or 0, kind="prompt")
+        LLM_TOKENS.inc(data.get("eval_count") or 0, kind="completion")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backends": {b.base_url: b.stats() for b in self.backends},
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "scheduler": {"chat": self.chat_slots.stats(), "embed": self.embed_slots.stats()},
+        }
+
+    def check_reply_capacity(self):
+        """Raises LLMOverloaded if a reply generation started now would be turned away."""
+        self.chat_slots.check(Priority.REPLY)
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    async def chat_completion(self, messages: List[Dict], priority: Priority = Priority.REPLY) -> str:
         payload = {
             "model": self.chat_model,
             "messages": messages,
             "stream": False
         }
         try:
-            response = await self.client.post(url, json=payload, timeout=60.0)
-            response.raise_for_status()
-            data = response.json()
+            data = await self._post("/api/chat", payload, 60.0, self.chat_slots, priority)
+            self._count_tokens(data)
             return data["message"]["content"]
         except httpx.HTTPStatusError as e:
-            print(f"HTTP error during chat completion: {e.response.status_code} - {e.response.text}")
+            logger.error("HTTP error during chat completion: %s - %s", e.response.status_code, e.response.text)
             raise
         except Exception as e:
-            print(f"Error during chat completion: {e}")
+            logger.error("Error during chat completion: %s", e)
             raise
 
-    async def generate_embedding(self, text: str) -> List[float]:
-        url = f"{self.base_url}/api/embeddings"
+    async def chat_completion_stream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        """
+        Yields reply content chunks as Ollama streams them (NDJSON, one object per line).
+        Transient failures are retried only until the first chunk is out; streams are not hedged.
+        """
+        payload = {
+            "model": self.chat_model,
+            "messages": messages,
+            "stream": True
+        }
+        try:
+            attempt = 0
+            yielded = False
+            while True:
+                backend = self._pick_backend()
+                try:
+                    # As in _post, the slot is given up for the backoff sleep between attempts
+                    async with self.chat_slots.slot(Priority.REPLY):
+                        async with backend.track("/api/chat:stream"):
+                            async with self.client.stream("POST", f"{backend.base_url}/api/chat", json=payload, timeout=60.0) as response:
+                                if response.is_error:
+                                    await response.aread()
+                                response.raise_for_status()
+                                async for line in response.aiter_lines():
+                                    if not line.strip():
+                                        continue
+                                    data = json.loads(line)
+                                    if "error" in data:
+                                        raise RuntimeError(data["error"])
+                                    chunk = data.get("message", {}).get("content", "")
+                                    if chunk:
+                                        yielded = True
+                                        yield chunk
+                                    if data.get("done"):
+                                        self._count_tokens(data)
+                                        break
+                    return
+                except Exception as e:
+                    if yielded or attempt >= settings.OLLAMA_MAX_RETRIES or not _is_transient(e):
+                        raise
+                    logger.warning("Transient Ollama error on /api/chat stream (attempt %d), retrying: %r", attempt + 1, e)
+                    await self._backoff("/api/chat:stream", attempt)
+                    attempt += 1
+        except httpx.HTTPStatusError as e:
+            logger.error("HTTP error during streaming chat completion: %s - %s", e.response.status_code, e.response.text)
+            raise
+        except Exception as e:
+            logger.error("Error during streaming chat completion: %s", e)
+            raise
+
+    async def generate_embeddings(self, texts: List[str], priority: Priority = Priority.QUERY_EMBEDDING) -> List[List[float]]:
+        """Embeds several texts in one round-trip via the multi-input /api/embed endpoint."""
         payload = {
             "model": self.embed_model,
-            "prompt": text
+            "input": texts
         }
         try:
-            response = await self.client.post(url, json=payload, timeout=30.0)
-            response.raise_for_status()
-            data = response.json()
-            return data["embedding"]
+            data = await self._post("/api/embed", payload, 60.0, self.embed_slots, priority)
+            return data["embeddings"]
         except httpx.HTTPStatusError as e:
-            print(f"HTTP error during embedding generation: {e.response.status_code} - {e.response.text}")
+            logger.error("HTTP error during batch embedding generation: %s - %s", e.response.status_code, e.response.text)
             raise
         except Exception as e:
-            print(f"Error during embedding generation: {e}")
+            logger.error("Error during batch embedding generation: %s", e)
             raise
 
-ollama_client = OllamaClient()
\ No newline at end of file
+    async def close(self):
+        await self.client.aclose()
+
+ollama_client = OllamaClient()
@@ -0,0 +1,118 @@
+from typing import Dict, List, Optional
+
+# Rough cost of a chat message's role/formatting wrapper in the model's template
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast local token estimate (no tokenizer round-trip): about 4 characters per token
+    for English text, but never fewer tokens than whitespace-separated words.
+    """
+    if not text:
+        return 0
+    return max(len(text) // 4 + 1, len(text.split()))
+
+
+def estimate_prompt_tokens(messages: List[Dict]) -> int:
+    return sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text at a word boundary so that it fits in roughly max_tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max(0, (max_tokens - 1) * 4)]
+    if " " in cut:
+        cut = cut[:cut.rfind(" ")]
+    while cut and estimate_tokens(cut + " …") > max_tokens:
+        cut = cut[:cut.rfind(" ")] if " " in cut else ""
+    return f"{cut} …" if cut else ""
+
+
+class ContextPacker:
+    """
+    Fills a token budget by priority: system primer, current message and the summaries
+    first, then the most recent turns, then top-ranked facts. Each summary is truncated to
+    its own fixed cap and reserved up front; turns and facts that don't fit are dropped.
+
+    The packed prompt is laid out most-stable-first (primer, lifetime summary, session
+    summary, history, facts, current message), so the model server can reuse its KV cache
+    for the shared prefix across turns. Capping the summaries independently of everything
+    else keeps that prefix byte-identical until a summary itself is rewritten.
+    """
+
+    def __init__(self, budget: int, lifetime_summary_tokens: int, session_summary_tokens: int):
+        self.budget = budget
+        self.lifetime_summary_tokens = lifetime_summary_tokens
+        self.session_summary_tokens = session_summary_tokens
+        self.used = 0
+
+    def _fits(self, tokens: int) -> bool:
+        return self.used + tokens <= self.budget
+
+    def _take(self, text: str) -> Optional[str]:
+        cost = estimate_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+        if not self._fits(cost):
+            return None
+        self.used += cost
+        return text
+
+    def _reserve_summary(self, text: str, cap: int) -> Optional[str]:
+        text = truncate_to_tokens(text, cap)
+        if not text:
+            return None
+        self.used += estimate_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+        return text
+
+    def pack(
+        self,
+        system_primer: str,
+        current_message: str,
+        history: List[Dict],
+        facts: List[str],
+        session_summary: Optional[str],
+        lifetime_summary: Optional[str],
+    ) -> List[Dict]:
+        """`history` is newest first; `facts` are best first."""
+        # Always sent, even if they alone exceed the budget
+        self.used = estimate_tokens(system_primer) + estimate_tokens(current_message) + 2 * MESSAGE_OVERHEAD_TOKENS
+
+        # Summaries are cut to their own caps, never to what's left, so the prefix doesn't move between turns
+        lifetime_text = session_text = None
+        if lifetime_summary:
+            lifetime_text = self._reserve_summary(f"User's lifetime summary: {lifetime_summary}", self.lifetime_summary_tokens)
+        if session_summary:
+            session_text = self._reserve_summary(f"Current session summary: {session_summary}", self.session_summary_tokens)
+
+        # Recent turns, newest first; stop at the first that doesn't fit so the window stays contiguous
+        kept_history: List[Dict] = []
+        for msg in history:
+            if self._take(msg["content"]) is None:
+                break
+            kept_history.append(msg)
+
+        # Top facts in rank order, sharing one system message
+        kept_facts: List[str] = []
+        facts_prefix = "Relevant past experiences: "
+        if facts and self._fits(estimate_tokens(facts_prefix) + MESSAGE_OVERHEAD_TOKENS):
+            self.used += estimate_tokens(facts_prefix) + MESSAGE_OVERHEAD_TOKENS
+            for fact in facts:
+                cost = estimate_tokens(fact) + 1
+                if self._fits(cost):
+                    self.used += cost
+                    kept_facts.append(fact)
+            if not kept_facts:
+                self.used -= estimate_tokens(facts_prefix) + MESSAGE_OVERHEAD_TOKENS
+
+
+        messages = [{"role": "system", "content": system_primer}]
+        if lifetime_text:
+            messages.append({"role": "system", "content": lifetime_text})
+        if session_text:
+            messages.append({"role": "system", "content": session_text})
+        messages.extend(reversed(kept_history))
+        if kept_facts:
+            messages.append({"role": "system", "content": facts_prefix + "; ".join(kept_facts)})
+        messages.append({"role": "user", "content": current_message})
+        return messages
@@ -0,0 +1,388 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+from .episode_index import normalize_rows
+
+ID_BYTES = 12  # ObjectId binary length
+RETIRED_MARKER = "RETIRED"  # Touched in a version directory when a rebuild supersedes it
+
+
+def _delta_dtype(dim: int) -> np.dtype:
+    # One fixed-size record per insert, so concurrent O_APPEND writers never interleave ids and vectors
+    return np.dtype([("id", f"V{ID_BYTES}"), ("vec", "<f4", (dim,))])
+
+
+def _spherical_kmeans(vectors: np.ndarray, nlist: int, iterations: int, seed: int) -> np.ndarray:
+    """Cosine k-means over normalized rows; trains on a sample so build time stays bounded."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * 32)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        counts = np.bincount(assign, minlength=nlist)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        empty = counts == 0
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(sample[np.argsort(assign, kind="stable")], starts[~empty], axis=0)
+        # Re-seed empty lists from random points so every list stays useful
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids.astype(np.float32)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    out = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        out[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+    return out
+
+
+class IVFFlatIndex:
+    """
+    IVF-flat cosine index persisted as memory-mapped files, so worker processes share pages.
+
+    Layout of one index directory:
+        CURRENT            name of the live version directory (swapped atomically once a rebuild is caught up)
+        <version>/meta.json, centroids.npy, offsets.npy
+        <version>/vectors.npy, ids.npy   rows grouped by inverted list
+        <version>/delta.bin               append-only (id, vector) records for incremental inserts
+        <version>/RETIRED                 present once a newer version is live
+
+    Inserts land in the delta, which is always searched exactly; a rebuild folds it into the lists.
+    A retired version stays on disk for a grace period so readers that still hold it keep
+    working, but refuses further inserts: they belong in the live version.
+    """
+
+    def __init__(self, root: str, version: str):
+        self.root = root
+        self.version = version
+        path = os.path.join(root, version)
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.nlist = meta["nlist"]
+        self.centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self._delta_path = os.path.join(path, "delta.bin")
+        self._delta_dtype = _delta_dtype(self.dim)
+        self._delta = np.zeros(0, dtype=self._delta_dtype)
+        self._delta_bytes = 0
+        self._retired = False
+
+    # ------------------------------------------------------------------
+    # Build / Open
+    # ------------------------------------------------------------------
+    @classmethod
+    def build(
+        cls,
+        root: str,
+        ids: List[bytes],
+        vectors: np.ndarray,
+        nlist: Optional[int] = None,
+        iterations: int = 10,
+        seed: int = 0
+    ) -> "IVFFlatIndex":
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        count, dim = vectors.shape
+        nlist = nlist or int(4 * np.sqrt(count))
+        nlist = max(1, min(nlist, count))
+
+        centroids = _spherical_kmeans(vectors, nlist, iterations, seed)
+        assign = _assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=nlist), out=offsets[1:])
+        id_array = np.frombuffer(b"".join(ids), dtype=np.uint8).reshape(count, ID_BYTES)
+
+        version = uuid.uuid4().hex
+        path = os.path.join(root, version)
+        os.makedirs(path)
+        np.save(os.path.join(path, "centroids.npy"), centroids)
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+        np.save(os.path.join(path, "vectors.npy"), vectors[order])
+        np.save(os.path.join(path, "ids.npy"), id_array[order])
+        open(os.path.join(path, "delta.bin"), "wb").close()
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"dim": int(dim), "nlist": int(nlist), "count": int(count)}, f)
+
+        # Not live until the registry's publish() has caught it up and calls make_current()
+        return cls(root, version)
+
+    def make_current(self):
+        """Publishes this version atomically: from now on every process opens it."""
+        pointer = os.path.join(self.root, f"CURRENT.{self.version}")
+        with open(pointer, "w") as f:
+            f.write(self.version)
+        os.replace(pointer, os.path.join(self.root, "CURRENT"))
+        self._retired = False
+
+    @staticmethod
+    def remove_stale_versions(root: str, keep: str, grace_seconds: float):
+        """
+        Marks every version but `keep` retired, and deletes those retired more than
+        `grace_seconds` ago. Open memmaps keep their pages alive after the files are unlinked.
+        """
+        now = time.time()
+        for entry in os.listdir(root):
+            path = os.path.join(root, entry)
+            if entry == keep or not os.path.isdir(path):
+                continue
+            marker = os.path.join(path, RETIRED_MARKER)
+            try:
+                retired_at = os.path.getmtime(marker)
+            except FileNotFoundError:
+                open(marker, "a").close()
+                retired_at = now
+            if now - retired_at >= grace_seconds:
+                shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def current_version(root: str) -> Optional[str]:
+        try:
+            with open(os.path.join(root, "CURRENT")) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    # ------------------------------------------------------------------
+    # Incremental inserts
+    # ------------------------------------------------------------------
+    @property
+    def base_size(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def delta_size(self) -> int:
+        self._refresh_delta()
+        return len(self._delta)
+
+    @property
+    def size(self) -> int:
+        return self.base_size + self.delta_size
+
+    @property
+    def retired(self) -> bool:
+        """Whether a rebuild (in this or another process) has superseded this version."""
+        if not self._retired and self.current_version(self.root) != self.version:
+            self._retired = True
+        return self._retired
+
+    @contextmanager
+    def delta_lock(self) -> Iterator[int]:
+        """
+        Exclusive lock on the delta file, shared by every process: appends take it, and a
+        rebuild holds it on the version it replaces while copying the last inserts across
+        and swapping CURRENT. Yields a descriptor open for appending.
+        """
+        fd = os.open(self._delta_path, os.O_WRONLY | os.O_APPEND)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield fd
+        finally:
+            os.close(fd)  # Releases the lock
+
+    def _records(self, rows: Sequence[Tuple[bytes, object]]) -> np.ndarray:
+        """Delta records for (id, vector) rows, normalized; vectors that don't fit are skipped."""
+        fitting = [(bytes(episode_id), np.asarray(vector, dtype=np.float32)) for episode_id, vector in rows]
+        fitting = [(episode_id, vec) for episode_id, vec in fitting if vec.shape == (self.dim,)]
+        records = np.zeros(len(fitting), dtype=self._delta_dtype)
+        if fitting:
+            records["id"] = [np.void(episode_id) for episode_id, _ in fitting]
+            records["vec"] = normalize_rows(np.stack([vec for _, vec in fitting]))
+        return records
+
+    def add(self, episode_id: bytes, vector) -> bool:
+        """
+        Appends to the delta. Returns False, writing nothing, if the vector doesn't fit or
+        the version isn't live. Blocking file IO: call it from a worker thread.
+        """
+        return self.add_many([(episode_id, vector)]) == 1
+
+    def add_many(self, rows: Sequence[Tuple[bytes, object]]) -> int:
+        """
+        Appends (id, vector) rows to the delta in one write, skipping vectors that don't fit.
+        Returns the number written: 0 if the version isn't live. Blocking file IO.
+        """
+        records = self._records(rows)
+        if not len(records):
+            return 0
+        try:
+            with self.delta_lock() as fd:
+                if self.retired:
+                    return 0
+                os.write(fd, records.tobytes())
+        except FileNotFoundError:
+            self._retired = True  # Removed after its grace period
+            return 0
+        return len(records)
+
+    def append_unpublished(self, rows: Sequence[Tuple[bytes, object]]) -> int:
+        """Appends rows to a version no process has opened yet, while it is caught up before publishing."""
+        records = self._records(rows)
+        if len(records):
+            with open(self._delta_path, "ab") as f:
+                f.write(records.tobytes())
+        return len(records)
+
+    def delta_since(self, start: int) -> np.ndarray:
+        """Delta records from the `start`-th on."""
+        self._refresh_delta()
+        return self._delta[start:]
+
+    def _refresh_delta(self):
+        # Other processes append too; remap whenever the file grew
+        try:
+            size = os.path.getsize(self._delta_path)
+        except FileNotFoundError:
+            return  # Superseded by a rebuild; the registry reopens the new version on next use
+        size -= size % self._delta_dtype.itemsize
+        if size != self._delta_bytes:
+            count = size // self._delta_dtype.itemsize
+            if count:
+                self._delta = np.memmap(self._delta_path, dtype=self._delta_dtype, mode="r", shape=(count,))
+            else:
+                self._delta = np.zeros(0, dtype=self._delta_dtype)
+            self._delta_bytes = size
+
+    def all_rows(self) -> Tuple[List[bytes], np.ndarray]:
+        """Every (id, vector) in the index, base then delta; used to rebuild."""
+        self._refresh_delta()
+        ids = [bytes(row) for row in np.asarray(self.ids)]
+        ids += [bytes(record) for record in self._delta["id"]]
+        vectors = np.concatenate([np.asarray(self.vectors), np.asarray(self._delta["vec"]).reshape(-1, self.dim)])
+        return ids, vectors
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Inverted list of each normalized row, e.g. to group rows for per-list work."""
+        return _assign(np.asarray(vectors, dtype=np.float32), self.centroids)
+
+    def search(self, embedding, k: int, nprobe: int) -> List[Tuple[bytes, float, np.ndarray]]:
+        """
+        Returns up to k (id, cosine similarity, vector) triples, best first.
+        nprobe is the recall/latency knob: the number of inverted lists scanned.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        if k <= 0 or query.shape != (self.dim,):
+            return []
+        norm = float(np.linalg.norm(query))
+        if norm > 0:
+            query = query / norm
+
+        nprobe = max(1, min(nprobe, self.nlist))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe] if nprobe < self.nlist else np.arange(self.nlist)
+
+        ranges = [(int(self.offsets[l]), int(self.offsets[l + 1])) for l in np.sort(probe)]
+        rows = np.concatenate([np.arange(a, b) for a, b in ranges]) if ranges else np.zeros(0, dtype=np.int64)
+        base_vectors = np.concatenate([self.vectors[a:b] for a, b in ranges]) if ranges else np.zeros((0, self.dim), np.float32)
+
+        self._refresh_delta()
+        delta_vectors = np.asarray(self._delta["vec"]).reshape(-1, self.dim)
+        candidates = np.concatenate([base_vectors, delta_vectors])
+        if len(candidates) == 0:
+            return []
+
+        scores = candidates @ query
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            if i < len(rows):
+                episode_id = bytes(self.ids[rows[i]])
+            else:
+                episode_id = bytes(self._delta["id"][i - len(rows)])
+            results.append((episode_id, float(scores[i]), candidates[i]))
+        return results
+
+
+class AnnIndexRegistry:
+    """Opens per-user IVF-flat indexes under a root directory and keeps a bounded set mapped."""
+
+    def __init__(self, root: str, max_open: int = 256, retired_grace_seconds: float = 300.0):
+        self.root = root
+        self.max_open = max_open
+        self.retired_grace_seconds = retired_grace_seconds
+        self._open: "OrderedDict[str, IVFFlatIndex]" = OrderedDict()
+        self._lock = threading.Lock()  # Guards the LRU of open indexes
+
+    def path_for(self, user_id: str) -> str:
+        # User ids are arbitrary strings; hex keeps them filesystem-safe
+        return os.path.join(self.root, user_id.encode("utf-8").hex())
+
+    def get(self, user_id: str) -> Optional[IVFFlatIndex]:
+        """Returns the user's index, reopening it if another process published a newer version."""
+        path = self.path_for(user_id)
+        version = IVFFlatIndex.current_version(path)
+        with self._lock:
+            index = self._open.get(user_id)
+            if version is None:
+                self._open.pop(user_id, None)
+                return None
+            if index is None or index.version != version:
+                index = IVFFlatIndex(path, version)
+            self._open[user_id] = index
+            self._open.move_to_end(user_id)
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+            return index
+
+    def build(self, user_id: str, ids: List[bytes], vectors: np.ndarray) -> IVFFlatIndex:
+        """Builds a fresh, not yet published index. CPU-heavy: run it in a worker thread."""
+        path = self.path_for(user_id)
+        os.makedirs(path, exist_ok=True)
+        return IVFFlatIndex.build(path, ids, vectors)
+
+    @staticmethod
+    def catch_up(index: IVFFlatIndex, previous: Optional[IVFFlatIndex], carried: int,
+                 replay: Sequence[Tuple[bytes, object]] = ()) -> int:
+        """
+        Writes the rows a built index is missing into its delta: `replay`, then the delta
+        records that reached `previous` past the first `carried` ones its build snapshotted.
+        Returns how many of previous's delta records are carried now. Blocking file IO: run
+        it in a worker thread before publish(), which then only copies what arrived meanwhile.
+        """
+        late = previous.delta_since(carried) if previous is not None else index._records([])
+        index.append_unpublished(list(replay) + list(zip(late["id"], late["vec"])))
+        return carried + len(late)
+
+    def publish(self, user_id: str, index: IVFFlatIndex, previous: Optional[IVFFlatIndex] = None,
+                carried: int = 0, replay: Sequence[Tuple[bytes, object]] = ()):
+        """
+        Makes a built index live: catches it up (see catch_up), then swaps CURRENT, so no
+        process ever opens the new version without those rows. `previous` is locked until
+        the swap, so no insert lands in it after its delta was copied; later ones are turned
+        away and retried on the new version.
+        """
+        with previous.delta_lock() if previous is not None else nullcontext():
+            self.catch_up(index, previous, carried, replay)
+            index.make_current()
+        with self._lock:
+            self._open[user_id] = index
+            self._open.move_to_end(user_id)
+
+    def remove_retired(self, index: IVFFlatIndex):
+        """Retires every version but the live `index`, deleting those past their grace period. Blocking file IO."""
+        IVFFlatIndex.remove_stale_versions(index.root, index.version, self.retired_grace_seconds)
+
+    def stats(self):
+        return {
+            "users": len(self._open),
+            "episodes": sum(index.size for index in self._open.values()),
+        }
@@ -0,0 +1,749 @@
+"""
+Storage interface for every memory backend.
+
+A backend implements the persistence primitives below (messages, session counters, daily
+rollups, summaries, episodes, jobs, the embedding cache and bulk-import bookkeeping). The
+write-through short-term session windows, the in-memory episode indexes, the optional
+on-disk ANN tier and the hot/cold retention policy are backend-independent and live here:
+a backend only stores episodes in a hot and a cold table and hands back their ids, vectors
+and fields.
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+import numpy as np
+
+from ..config import settings
+from ..metrics import COLD_EPISODE_SEARCHES, EPISODE_MERGES, EPISODE_TIER_MOVES
+from ..models import Message, SessionState, Summary, Episode
+from .ann_index import AnnIndexRegistry, IVFFlatIndex
+from .episode_index import EpisodeIndex, EpisodeIndexCache, cluster_near_duplicates
+from .retention import RetentionPolicy
+from .session_window import SessionKey, SessionWindowCache
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStore(ABC):
+    def __init__(self):
+        # Sized for the largest chat-path read: the summarizer's SHORT_TERM_N * 2 window
+        self.session_windows = SessionWindowCache(settings.SHORT_TERM_N * 2, settings.SESSION_WINDOW_MAX_SESSIONS)
+        self._window_loads: Dict[SessionKey, asyncio.Task] = {}
+        self._window_writes: Dict[SessionKey, int] = {}  # Message writes in flight per session
+        self._stale_window_loads: Set[SessionKey] = set()
+        self.episode_indexes = EpisodeIndexCache(settings.EPISODE_INDEX_MAX_BYTES)
+        self._index_loads: Dict[str, asyncio.Task] = {}
+        self._pending_index_appends: Dict[str, list] = {}
+        self.ann_indexes = (
+            AnnIndexRegistry(settings.ANN_INDEX_DIR, retired_grace_seconds=settings.ANN_RETIRED_GRACE_SECONDS)
+            if settings.ANN_INDEX_DIR else None
+        )
+        self._ann_builds: Dict[str, asyncio.Task] = {}
+        self._ann_build_appends: Dict[str, list] = {}
+        self.retention = RetentionPolicy.from_settings(settings)
+        self.cold_indexes = EpisodeIndexCache(settings.EPISODE_COLD_INDEX_MAX_BYTES)
+        # Retrieval bookkeeping runs off the request path; referenced so it isn't GC'd mid-flight
+        self._pending_writes: Set[asyncio.Task] = set()
+
+    # ------------------------------------------------------------------
+    # Connection Management
+    # ------------------------------------------------------------------
+    @abstractmethod
+    async def connect(self):
+        """Opens the backend and makes sure its schema/indexes exist."""
+
+    @abstractmethod
+    async def close(self):
+        ...
+
+    @property
+    @abstractmethod
+    def connected(self) -> bool:
+        ...
+
+    # ------------------------------------------------------------------
+    # Message Operations
+    # ------------------------------------------------------------------
+    async def save_message(self, message: Message) -> Optional[SessionState]:
+        """
+        Stores the message, then bumps its session's counters and its daily activity rollup.
+        Returns the updated session state (None for messages without a session).
+        """
+        if not message.session_id:
+            return await self._save_message(message)
+        key = (message.user_id, message.session_id)
+        self._begin_window_writes([key])
+        try:
+            state = await self._save_message(message)
+        except Exception:
+            self._end_window_writes([key], None)
+            raise
+        self._end_window_writes([key], message)
+        return state
+
+    async def save_messages_bulk(self, messages: List[Message]) -> int:
+        """Bulk-loads messages with their session counter and daily rollup increments."""
+        keys = list({(m.user_id, m.session_id) for m in messages if m.session_id})
+        self._begin_window_writes(keys)
+        try:
+            return await self._save_messages_bulk(messages)
+        finally:
+            # Imported history can land anywhere in a session's timeline; reload those windows
+            self._end_window_writes(keys, None)
+
+    @abstractmethod
+    async def _save_message(self, message: Message) -> Optional[SessionState]:
+        ...
+
+    @abstractmethod
+    async def _save_messages_bulk(self, messages: List[Message]) -> int:
+        ...
+
+    @abstractmethod
+    async def get_daily_activity(self, user_id: str, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Per-day {date, count, by_role, sessions}, oldest first; `start`/`end` are inclusive YYYY-MM-DD."""
+
+    @abstractmethod
+    async def get_session_messages(self, user_id: str, session_id: str, role: str, skip: int, limit: int) -> List[Message]:
+        """Oldest-first page of one role's messages in a session."""
+
+    async def get_last_n_messages(self, user_id: str, session_id: Optional[str], n: int) -> List[Message]:
+        """Newest-first. Reads within a session's window size are served from the in-process window."""
+        if not session_id or not self.session_windows.covers(n):
+            return await self._get_last_n_messages(user_id, session_id, n)
+
+        key = (user_id, session_id)
+        window = self.session_windows.get(key, n)
+        if window is not None:
+            return window
+        # Concurrent misses share one cold load, shielded like the episode index loads
+        if key not in self._window_loads:
+            self._window_loads[key] = asyncio.ensure_future(self._load_session_window(key))
+        messages = await asyncio.shield(self._window_loads[key])
+        return messages[:n]
+
+    @abstractmethod
+    async def _get_last_n_messages(self, user_id: str, session_id: Optional[str], n: int) -> List[Message]:
+        """Newest-first."""
+
+    def _begin_window_writes(self, keys: List[SessionKey]):
+        for key in keys:
+            self._window_writes[key] = self._window_writes.get(key, 0) + 1
+
+    def _end_window_writes(self, keys: List[SessionKey], message: Optional[Message]):
+        """Writes `message` through to its held window; None (bulk or failed writes) drops the windows."""
+        for key in keys:
+            self._window_writes[key] -= 1
+            if not self._window_writes[key]:
+                del self._window_writes[key]
+            if key in self._window_loads:
+                # A load overlapping the write may or may not have read it; don't keep what it returns
+                self._stale_window_loads.add(key)
+            elif message is None:
+                self.session_windows.discard(key)
+            else:
+                self.session_windows.append(key, message)
+
+    async def _load_session_window(self, key: SessionKey) -> List[Message]:
+        try:
+            messages = await self._get_last_n_messages(*key, self.session_windows.capacity)
+            if key not in self._stale_window_loads and key not in self._window_writes:
+                self.session_windows.put(key, messages)
+            return messages
+        finally:
+            del self._window_loads[key]
+            self._stale_window_loads.discard(key)
+
+    @abstractmethod
+    async def get_session_state(self, user_id: str, session_id: str) -> Optional[SessionState]:
+        ...
+
+    async def count_user_messages_in_session(self, user_id: str, session_id: str) -> int:
+        state = await self.get_session_state(user_id, session_id)
+        return state.user_messages if state else 0
+
+    @abstractmethod
+    async def claim_session_summary(self, state: SessionState, every: int) -> bool:
+        """
+        Compare-and-set on the session's summarize watermark. Returns True for exactly one
+        caller once `every` user messages have accumulated since the last summary trigger.
+        Doesn't bump the memory version: the summary it triggers does.
+        """
+
+    # ------------------------------------------------------------------
+    # Memory Versions (response cache invalidation)
+    # ------------------------------------------------------------------
+    @abstractmethod
+    async def get_memory_version(self, user_id: str) -> int:
+        """Counter bumped by every write to a user's memory; 0 for a user never written."""
+
+    @abstractmethod
+    async def _bump_memory_versions(self, user_ids: List[str]):
+        """
+        Bumps no earlier than the write's primary records (messages, summaries, episodes)
+        are issued. Backends send it together with the write's other updates where they can
+        (one transaction on SQLite, one concurrent round-trip on Mongo), so that a write
+        costs no extra round-trip for it.
+        """
+
+    # ------------------------------------------------------------------
+    # Summary Operations
+    # ------------------------------------------------------------------
+    @abstractmethod
+    async def upsert_summary(self, summary: Summary):
+        """One summary per (user, scope, session, period)."""
+
+    @abstractmethod
+    async def get_latest_summary(self, user_id: str, scope: str, session_id: Optional[str] = None) -> Optional[Summary]:
+        ...
+
+    @abstractmethod
+    async def get_all_session_summaries(self, user_id: str, limit: Optional[int] = None) -> List[Summary]:
+        """Newest first; `limit` keeps only the newest few."""
+
+    @abstractmethod
+    async def get_session_summaries_since(self, user_id: str, since: Optional[datetime], limit: int) -> List[Summary]:
+        """Oldest-first session summaries created (or last updated) after `since`."""
+
+    # ------------------------------------------------------------------
+    # Episode Storage (backend primitives)
+    # ------------------------------------------------------------------
+    @abstractmethod
+    async def _insert_episodes(self, episodes: List[Episode]) -> List[Any]:
+        """Stores the episodes (embeddings L2-normalized) in one round-trip and returns their ids, in order."""
+
+    async def _insert_episode(self, episode: Episode) -> Any:
+        return (await self._insert_episodes([episode]))[0]
+
+    @abstractmethod
+    async def _load_episode_vectors(self, user_id: str, cold: bool = False) -> Tuple[List[Any], List[np.ndarray]]:
+        """Every (id, embedding) of a user in the hot (or cold) tier."""
+
+    @abstractmethod
+    async def _get_episode_fields(self, episode_ids: List[Any], cold: bool = False) -> Dict[Any, Dict[str, Any]]:
+        """Episode fields except the embedding, by id."""
+
+    @abstractmethod
+    async def _get_retention_fields(self, user_id: str) -> Dict[Any, Dict[str, Any]]:
+        """
+        importance, created_at, last_seen_at, retrieval_hits and last_retrieved_at of every
+        hot episode of a user, by id.
+        """
+
+    @abstractmethod
+    async def _set_episode_tier(self, episode_ids: List[Any], cold: bool) -> List[Any]:
+        """Moves episodes to the cold (or back to the hot) tier. Returns the ids actually moved."""
+
+    @abstractmethod
+    async def _record_episode_hits(self, episode_ids: List[Any], retrieved_at: datetime):
+        """Counts one retrieval hit for each (hot) episode."""
+
+    @abstractmethod
+    async def _reinforce_episode(self, episode_id: Any, importance: float, seen: int, seen_at: datetime):
+        """
+        Folds merged duplicates into an episode: raises its importance to at least `importance`,
+        adds `seen` to its seen count and moves last_seen_at forward to `seen_at`.
+        """
+
+    @abstractmethod
+    async def _delete_episodes(self, episode_ids: List[Any]):
+        ...
+
+    @abstractmethod
+    def _episode_id_to_bytes(self, episode_id: Any) -> bytes:
+        """12-byte form of an episode id, as kept in ANN index files."""
+
+    @abstractmethod
+    def _episode_id_from_bytes(self, raw: bytes) -> Any:
+        ...
+
+    @abstractmethod
+    async def get_last_n_episodic_facts(self, user_id: str, n: int) -> List[str]:
+        ...
+
+    # ------------------------------------------------------------------
+    # Episode Operations
+    # ------------------------------------------------------------------
+    async def save_episode(self, episode: Episode):
+        """
+        Stores the episode, unless the user already has one at least EPISODE_DEDUP_THRESHOLD
+        similar: then that episode absorbs it (importance bump, seen count, last-seen time).
+        """
+        if settings.EPISODE_DEDUP_THRESHOLD <= 1.0 and await self._merge_duplicate(episode):
+            await self._bump_memory_versions([episode.user_id])
+            return
+
+        episode_id = await self._insert_episode(episode)
+        await self._add_to_index(episode.user_id, episode_id, episode.embedding)
+        await self._bump_memory_versions([episode.user_id])
+
+    async def _add_to_index(self, user_id: str, episode_id: Any, embedding: List[float]):
+        """Makes a new (or promoted) hot episode searchable."""
+        # Users on the ANN tier take the insert in their on-disk delta
+        ann = self.ann_indexes.get(user_id) if self.ann_indexes else None
+        if ann is not None:
+            raw_id = self._episode_id_to_bytes(episode_id)
+            while not await asyncio.to_thread(ann.add, raw_id, embedding):
+                # A rebuild retired the version in hand; the insert belongs in the live one
+                live = self.ann_indexes.get(user_id)
+                if live is None or live.version == ann.version:
+                    return  # Dimension mismatch
+                ann = live
+            self._maybe_rebuild_ann(user_id, ann)
+            return
+
+        # A first ANN build in flight replays the insert once it is published
+        if user_id in self._ann_builds:
+            self._ann_build_appends[user_id].append((episode_id, embedding))
+        # Keep an already-loaded index in sync; a load in flight replays this after it finishes
+        if user_id in self._index_loads:
+            self._pending_index_appends[user_id].append((episode_id, embedding))
+        else:
+            self.episode_indexes.append(user_id, episode_id, embedding)
+
+    def _remove_from_index(self, user_id: str, episode_ids: Set[Any]):
+        """Takes merged or demoted episodes out of whichever hot index serves the user."""
+        ann = self.ann_indexes.get(user_id) if self.ann_indexes else None
+        if ann is None:
+            index = self.episode_indexes.get(user_id)
+            if index is not None:
+                index.remove(episode_ids)
+            return
+        # ANN lists are immutable: rebuild without the rows. A build already in flight keeps
+        # them until the next rebuild; reads skip them since their fields are gone.
+        if user_id not in self._ann_builds:
+            self._launch_ann_build(user_id, previous=ann, exclude=episode_ids)
+
+    async def _merge_duplicate(self, episode: Episode) -> bool:
+        """Merges the episode into its nearest stored neighbor if that is a near-duplicate."""
+        threshold = settings.EPISODE_DEDUP_THRESHOLD
+        ann = self.ann_indexes.get(episode.user_id) if self.ann_indexes else None
+        if ann is not None:
+            hits = await asyncio.to_thread(ann.search, episode.embedding, 1, settings.ANN_NPROBE)
+            if not hits or hits[0][1] < threshold:
+                return False
+            duplicate_id = self._episode_id_from_bytes(hits[0][0])
+        else:
+            index = await self._get_episode_index(episode.user_id)
+            hits = index.search(episode.embedding, 1) if index is not None else []
+            if not hits or hits[0][1] < threshold:
+                return False
+            duplicate_id = index.ids[hits[0][0]]
+
+        fields = (await self._get_episode_fields([duplicate_id])).get(duplicate_id)
+        if fields is None:
+            return False  # Compacted away since the index was built
+        importance = min(1.0, max(fields["importance"], episode.importance) + settings.EPISODE_DEDUP_IMPORTANCE_BOOST)
+        await self._reinforce_episode(duplicate_id, importance, 1, episode.created_at)
+        EPISODE_MERGES.inc(path="write")
+        logger.debug("Merged episode into %s for user=%s (similarity %.3f)", duplicate_id, episode.user_id, hits[0][1])
+        return True
+
+    async def compact_episodes(self, user_id: str) -> Dict[str, int]:
+        """
+        Merges every cluster of near-duplicate episodes a user has built up into its most
+        important member, then deletes the rest. Users on the ANN tier are clustered within
+        their inverted lists (near-duplicates almost always share one; the rare pair split
+        across lists is left alone) and get their index rebuilt.
+        """
+        stats = {"episodes": 0, "clusters": 0, "merged": 0}
+        if user_id in self._ann_builds:
+            return stats  # The build in flight would publish the merged rows again
+
+        ann = self.ann_indexes.get(user_id) if self.ann_indexes else None
+        if ann is not None:
+            raw_ids, vectors, groups = await asyncio.to_thread(self._ann_rows_and_lists, ann)
+            ids = [self._episode_id_from_bytes(raw) for raw in raw_ids]
+        else:
+            index = await self._get_episode_index(user_id)
+            if index is None:
+                return stats
+            ids, vectors, groups = list(index.ids), index.vectors.copy(), None
+        stats["episodes"] = len(ids)
+
+        clusters = await asyncio.to_thread(
+            cluster_near_duplicates, vectors, settings.EPISODE_DEDUP_THRESHOLD, groups
+        )
+        members = [ids[row] for cluster in clusters for row in cluster]
+        fields: Dict[Any, Dict[str, Any]] = {}
+        for start in range(0, len(members), 500):
+            fields.update(await self._get_episode_fields(members[start:start + 500]))
+
+        removed = set()
+        for cluster in clusters:
+            found = [ids[row] for row in cluster if ids[row] in fields]
+            if len(found) < 2:
+                continue
+            keeper = max(found, key=lambda episode_id: (fields[episode_id]["importance"], fields[episode_id].get("seen_count") or 1))
+            others = [episode_id for episode_id in found if episode_id != keeper]
+            importance = min(
+                1.0,
+                max(fields[episode_id]["importance"] for episode_id in found)
+                + settings.EPISODE_DEDUP_IMPORTANCE_BOOST * len(others)
+            )
+            seen = sum(fields[episode_id].get("seen_count") or 1 for episode_id in others)
+            seen_at = max(fields[episode_id].get("last_seen_at") or fields[episode_id]["created_at"] for episode_id in found)
+            await self._reinforce_episode(keeper, importance, seen, seen_at)
+            await self._delete_episodes(others)
+            removed.update(others)
+            stats["clusters"] += 1
+        stats["merged"] = len(removed)
+        if not removed:
+            return stats
+        EPISODE_MERGES.inc(len(removed), path="compaction")
+        await self._bump_memory_versions([user_id])
+
+        self._remove_from_index(user_id, removed)
+        logger.info("Compacted episodes for user=%s: %s", user_id, stats)
+        return stats
+
+    async def _get_episode_index(self, user_id: str) -> Optional[EpisodeIndex]:
+        """Returns the user's episode index, loading it from storage on first use."""
+        index = self.episode_indexes.get(user_id)
+        if index is not None:
+            return index
+
+        # Concurrent queries for the same user share a single load, which runs as its own
+        # task so a caller hitting its deadline doesn't abort it for everyone else
+        if user_id not in self._index_loads:
+            self._pending_index_appends[user_id] = []
+            self._index_loads[user_id] = asyncio.ensure_future(self._load_and_register_index(user_id))
+        return await asyncio.shield(self._index_loads[user_id])
+
+    async def _load_and_register_index(self, user_id: str) -> Optional[EpisodeIndex]:
+        try:
+            index = await self._load_episode_index(user_id)
+            for episode_id, embedding in self._pending_index_appends[user_id]:
+                if index is None:
+                    index = EpisodeIndex(len(embedding))
+                if episode_id not in index.ids:
+                    index.append(episode_id, embedding)
+            if index is not None:
+                self.episode_indexes.put(user_id, index)
+            return index
+        finally:
+            del self._index_loads[user_id]
+            del self._pending_index_appends[user_id]
+
+    async def _load_episode_index(self, user_id: str, cold: bool = False) -> Optional[EpisodeIndex]:
+        ids, rows = await self._load_episode_vectors(user_id, cold)
+        if not rows:
+            return None
+
+        # The index holds a single dimension; the most common one wins (e.g. after an embed model change)
+        dims, counts = np.unique([len(row) for row in rows], return_counts=True)
+        dim = int(dims[np.argmax(counts)])
+        keep = [i for i, row in enumerate(rows) if len(row) == dim]
+        if len(keep) != len(rows):
+            logger.warning("Skipping %d episodes with dim != %d for user=%s", len(rows) - len(keep), dim, user_id)
+
+        vectors = np.stack([rows[i] for i in keep])
+        return EpisodeIndex.from_rows([ids[i] for i in keep], vectors)
+
+    async def get_top_k_episodes_by_similarity(self, user_id: str, embedding: List[float], k: int,
+                                               include_cold: bool = False) -> List[Episode]:
+        """
+        Retrieves the top-k most similar episodic memories for a given user.
+        The hot tier of large users is served by their on-disk ANN index, everyone else's by an
+        exact search over their in-memory episode index. The cold tier is searched as well when
+        `include_cold` is set, or when the best hot match scores below EPISODE_COLD_SEARCH_THRESHOLD.
+        Only the k winning episodes are fetched; their retrieval hits are recorded off the
+        request path, and cold winners are promoted back to the hot tier.
+        """
+        hits, total = await self._search_hot(user_id, embedding, k)
+
+        cold_hits = []
+        threshold = settings.EPISODE_COLD_SEARCH_THRESHOLD
+        if include_cold or (threshold > 0 and (not hits or hits[0][1] < threshold)):
+            COLD_EPISODE_SEARCHES.inc(trigger="on_demand" if include_cold else "low_score")
+            hot_ids = {episode_id for episode_id, _, _ in hits}
+            # An interrupted tier move can leave an episode in both tiers for a while
+            cold_hits = [hit for hit in await self._search_cold(user_id, embedding, k) if hit[0] not in hot_ids]
+            hits = sorted(hits + cold_hits, key=lambda hit: -hit[1])[:k]
+        if not hits:
+            return []
+
+        # The vectors are already in memory, so don't read them again
+        cold_ids = {episode_id for episode_id, _, _ in cold_hits}
+        hot_wanted = [episode_id for episode_id, _, _ in hits if episode_id not in cold_ids]
+        cold_wanted = [episode_id for episode_id, _, _ in hits if episode_id in cold_ids]
+        fields = await self._get_episode_fields(hot_wanted) if hot_wanted else {}
+        if cold_wanted:
+            fields.update(await self._get_episode_fields(cold_wanted, cold=True))
+        winners = [
+            (episode_id, Episode(**fields[episode_id], embedding=vector.tolist()))
+            for episode_id, _, vector in hits if episode_id in fields
+        ]
+        self._record_retrieval(user_id, winners, cold_ids)
+
+        logger.debug("Retrieved %d episodic facts for user=%s (from %d hot)", len(winners), user_id, total)
+        return [episode for _, episode in winners]
+
+    async def _search_hot(self, user_id: str, embedding: List[float], k: int) -> Tuple[List[tuple], int]:
+        """(id, score, vector) hits from the hot tier, best first, and the hot tier's size."""
+        ann = self.ann_indexes.get(user_id) if self.ann_indexes else None
+        if ann is not None:
+            if len(embedding) != ann.dim:
+                logger.warning("Query dim mismatch: query=%d, index=%d", len(embedding), ann.dim)
+                return [], ann.size
+            found = await asyncio.to_thread(ann.search, embedding, k, settings.ANN_NPROBE)
+            hits = [(self._episode_id_from_bytes(episode_id), score, vector) for episode_id, score, vector in found]
+            return hits, ann.size
+
+        index = await self._get_episode_index(user_id)
+        if index is None:
+            logger.debug("No episodes found for user %s", user_id)
+            return [], 0
+
+        if len(embedding) != index.dim:
+            logger.warning("Query dim mismatch: query=%d, index=%d", len(embedding), index.dim)
+            return [], index.size
+
+        hits = [(index.ids[row], score, index.vectors[row]) for row, score in index.search(embedding, k)]
+        if self.ann_indexes is not None and index.size >= settings.ANN_MIN_EPISODES:
+            self._start_ann_build(user_id, index)
+        return hits, index.size
+
+    async def _search_cold(self, user_id: str, embedding: List[float], k: int) -> List[tuple]:
+        """Exact search over the user's cold tier, loaded on first use into a separate LRU budget."""
+        index = self.cold_indexes.get(user_id)
+        if index is None:
+            index = await self._load_episode_index(user_id, cold=True)
+            if index is None:
+                return []
+            self.cold_indexes.put(user_id, index)
+        return [(index.ids[row], score, index.vectors[row].copy()) for row, score in index.search(embedding, k)]
+
+    def _record_retrieval(self, user_id: str, winners: List[Tuple[Any, Episode]], cold_ids: Set[Any]):
+        if not winners:
+            return
+        promoted = [(episode_id, episode) for episode_id, episode in winners if episode_id in cold_ids]
+        if promoted:
+            # Out of the cold index right away, so a concurrent query can't promote them twice
+            cold = self.cold_indexes.get(user_id)
+            if cold is not None:
+                cold.remove({episode_id for episode_id, _ in promoted})
+        task = asyncio.ensure_future(self._apply_retrieval(user_id, [episode_id for episode_id, _ in winners], promoted))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+
+    async def _apply_retrieval(self, user_id: str, episode_ids: List[Any], promoted: List[Tuple[Any, Episode]]):
+        try:
+            if promoted:
+                moved = set(await self._set_episode_tier([episode_id for episode_id, _ in promoted], cold=False))
+                for episode_id, episode in promoted:
+                    if episode_id in moved:
+                        await self._add_to_index(user_id, episode_id, episode.embedding)
+                EPISODE_TIER_MOVES.inc(len(moved), direction="promote")
+                if moved:
+                    await self._bump_memory_versions([user_id])
+            await self._record_episode_hits(episode_ids, datetime.utcnow())
+        except Exception as e:
+            logger.warning("Recording episode retrieval failed for user=%s: %s", user_id, e)
+
+    async def enforce_retention(self, user_id: str) -> Dict[str, int]:
+        """
+        Applies the retention policy: demotes the user's lowest-scoring hot episodes to the
+        cold tier until at most EPISODE_HOT_MAX remain hot.
+        """
+        stats = {"hot": 0, "demoted": 0}
+        if not self.retention.enabled:
+            return stats
+        fields = await self._get_retention_fields(user_id)
+        stats["hot"] = len(fields)
+        demote = self.retention.select_demotions(fields)
+        if not demote:
+            return stats
+
+        moved = await self._set_episode_tier(demote, cold=True)
+        self._remove_from_index(user_id, set(moved))
+        await self._bump_memory_versions([user_id])
+        # Reloaded with the newly demoted rows on the next cold search
+        self.cold_indexes.discard(user_id)
+        stats["hot"] -= len(moved)
+        stats["demoted"] = len(moved)
+        EPISODE_TIER_MOVES.inc(len(moved), direction="demote")
+        logger.info("Applied episode retention for user=%s: %s", user_id, stats)
+        return stats
+
+    # ------------------------------------------------------------------
+    # ANN Index Maintenance
+    # ------------------------------------------------------------------
+    def _start_ann_build(self, user_id: str, index: EpisodeIndex):
+        """Promotes a user past ANN_MIN_EPISODES from the exact index to an IVF-flat index."""
+        if user_id in self._ann_builds:
+            return
+        ids = [self._episode_id_to_bytes(episode_id) for episode_id in index.ids]
+        self._launch_ann_build(user_id, previous=None, rows=(ids, index.vectors.copy()))
+
+    def _maybe_rebuild_ann(self, user_id: str, ann: IVFFlatIndex):
+        """Folds the insert delta back into the inverted lists once it grows too large."""
+        if user_id in self._ann_builds:
+            return
+        if ann.delta_size <= settings.ANN_REBUILD_DELTA_FRACTION * ann.base_size:
+            return
+        self._launch_ann_build(user_id, previous=ann)
+
+    def _launch_ann_build(self, user_id: str, previous: Optional[IVFFlatIndex],
+                          rows: Optional[Tuple[List[bytes], np.ndarray]] = None, exclude: Set[Any] = frozenset()):
+        """
+        Builds from `rows`, or, on a rebuild, from every row of `previous` but those in
+        `exclude`, then publishes the result in `previous`'s place.
+        """
+        self._ann_build_appends[user_id] = []
+        self._ann_builds[user_id] = asyncio.ensure_future(self._build_ann(user_id, previous, rows, exclude))
+
+    @staticmethod
+    def _ann_rows_and_lists(ann: IVFFlatIndex) -> Tuple[List[bytes], np.ndarray, np.ndarray]:
+        """Every row of an ANN index with the inverted list it falls in. Reads the files: run it in a worker thread."""
+        raw_ids, vectors = ann.all_rows()
+        return raw_ids, vectors, ann.assign(vectors)
+
+    def _snapshot_and_build_ann(self, user_id: str, previous: Optional[IVFFlatIndex],
+                                rows: Optional[Tuple[List[bytes], np.ndarray]], exclude: Set[Any]):
+        """
+        Builds an unpublished index and returns it with how many of previous's delta
+        records it already holds. Reads and writes the files: run it in a worker thread.
+        """
+        if previous is None:
+            ids, vectors = rows
+            return self.ann_indexes.build(user_id, ids, vectors), 0
+        ids, vectors = previous.all_rows()
+        carried = len(ids) - previous.base_size
+        if exclude:
+            keep = [row for row, raw in enumerate(ids) if self._episode_id_from_bytes(raw) not in exclude]
+            ids, vectors = [ids[row] for row in keep], vectors[keep]
+        return self.ann_indexes.build(user_id, ids, vectors), carried
+
+    async def _build_ann(self, user_id: str, previous: Optional[IVFFlatIndex],
+                         rows: Optional[Tuple[List[bytes], np.ndarray]], exclude: Set[Any]):
+        try:
+            # Snapshot, k-means and file writes are CPU/IO heavy; keep them off the event loop
+            built, carried = await asyncio.to_thread(self._snapshot_and_build_ann, user_id, previous, rows, exclude)
+            # Inserts that reached the exact index (first build) or the previous version
+            # while the build ran go into the new delta before it is live. The bulk is copied
+            # in a worker thread; publish() then only copies what arrived meanwhile.
+            appends = [
+                (self._episode_id_to_bytes(episode_id), embedding)
+                for episode_id, embedding in self._ann_build_appends[user_id]
+            ]
+            carried = await asyncio.to_thread(self.ann_indexes.catch_up, built, previous, carried, appends)
+            # On the event loop, so no insert slips between the last copy and the swap
+            tail = [
+                (self._episode_id_to_bytes(episode_id), embedding)
+                for episode_id, embedding in self._ann_build_appends[user_id][len(appends):]
+            ]
+            self.ann_indexes.publish(user_id, built, previous, carried, tail)
+            self.episode_indexes.discard(user_id)
+            logger.info("Published ANN index for user=%s (%d episodes, %d lists)", user_id, built.size, built.nlist)
+            await asyncio.to_thread(self.ann_indexes.remove_retired, built)
+        except Exception:
+            logger.exception("ANN index build failed for user=%s", user_id)
+        finally:
+            del self._ann_builds[user_id]
+            del self._ann_build_appends[user_id]
+
+    # ------------------------------------------------------------------
+    # Job Operations (background memory maintenance)
+    # ------------------------------------------------------------------
+    @abstractmethod
+    async def enqueue_job(self, kind: str, payload: Dict[str, Any], dedup_key: Optional[str] = None):
+        """
+        Persists a queued job and returns its id.
+        Returns None when an identical job (same dedup_key) is already queued.
+        """
+
+    @abstractmethod
+    async def claim_job(self, job_id) -> Optional[Dict[str, Any]]:
+        """Atomically moves a queued job to running; returns None if someone else got it."""
+
+    @abstractmethod
+    async def complete_job(self, job_id):
+        ...
+
+    @abstractmethod
+    async def release_job(self, job_id, error: Optional[str] = None, failed: bool = False):
+        """Puts a job back in the queue, or parks it as failed."""
+
+    @abstractmethod
+    async def requeue_stale_jobs(self, lease_seconds: int) -> int:
+        """Returns running jobs whose lease expired (e.g. the process died) to the queue."""
+
+    @abstractmethod
+    async def get_queued_job_ids(self, limit: int) -> List[Any]:
+        """Oldest first."""
+
+    # ------------------------------------------------------------------
+    # Embedding Cache Operations
+    # ------------------------------------------------------------------
+    @abstractmethod
+    async def get_cached_embeddings(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        ...
+
+    @abstractmethod
+    async def save_cached_embeddings(self, model: str, vectors: Dict[str, List[float]]):
+        """Stores vectors as given (not normalized); existing entries are kept."""
+
+    @abstractmethod
+    async def purge_embedding_cache(self, keep_model: str) -> int:
+        """Drops cached vectors produced by any model other than keep_model."""
+
+    # ------------------------------------------------------------------
+    # Backfill Task Operations (bulk import pipeline)
+    # ------------------------------------------------------------------
+    @abstractmethod
+    async def add_backfill_tasks(self, run_id: str, kind: str, keys: List[tuple]):
+        """Registers (user_id, session_id) work items for a run; existing ones are left untouched."""
+
+    @abstractmethod
+    async def get_open_backfill_tasks(self, run_id: str, kind: str, limit: int) -> List[Dict[str, Any]]:
+        """Pending tasks, plus ones left running by a crashed run."""
+
+    @abstractmethod
+    async def update_backfill_task(self, task_id, **fields):
+        """Sets any of status, messages_done and error."""
+
+    @abstractmethod
+    async def reopen_failed_backfill_tasks(self, run_id: str) -> int:
+        """Puts a run's failed tasks back to pending, progress kept, so a resume retries them."""
+
+    @abstractmethod
+    async def get_backfill_users(self, run_id: str) -> List[str]:
+        """Users whose session tasks in the run are all done."""
+
+    @abstractmethod
+    async def get_backfill_progress(self, run_id: str) -> Dict[str, Dict[str, int]]:
+        """Task counts by kind, then status."""
+
+    # ------------------------------------------------------------------
+    # Export / Restore (streamed a batch at a time)
+    # ------------------------------------------------------------------
+    @abstractmethod
+    def iter_messages(self, user_id: str, batch_size: int) -> AsyncIterator[Message]:
+        """Every message of the user, fetched `batch_size` at a time."""
+
+    @abstractmethod
+    def iter_summaries(self, user_id: str, batch_size: int) -> AsyncIterator[Summary]:
+        ...
+
+    @abstractmethod
+    def iter_episodes(self, user_id: str, batch_size: int, cold: bool = False) -> AsyncIterator[Episode]:
+        """One tier's episodes, with their stored (L2-normalized) embeddings."""
+
+    async def restore_episodes(self, episodes: List[Episode], cold: List[bool]):
+        """
+        Inserts a batch of exported episodes in one round-trip, as they are: no duplicate
+        merging, counters and timestamps kept. Episodes flagged cold go straight to the cold tier.
+        """
+        ids = await self._insert_episodes(episodes)
+        demote = [episode_id for episode_id, is_cold in zip(ids, cold) if is_cold]
+        if demote:
+            await self._set_episode_tier(demote, cold=True)
+        for episode, episode_id, is_cold in zip(episodes, ids, cold):
+            if is_cold:
+                self.cold_indexes.discard(episode.user_id)
+            else:
+                await self._add_to_index(episode.user_id, episode_id, episode.embedding)
+        await self._bump_memory_versions(list({episode.user_id for episode in episodes}))
@@ -0,0 +1,183 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalizes each row; zero rows stay zero."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def cluster_near_duplicates(vectors: np.ndarray, threshold: float, groups: Optional[np.ndarray] = None) -> List[List[int]]:
+    """
+    Greedy leader clustering of L2-normalized rows: in row order, each row not yet taken
+    claims every untaken row whose cosine similarity reaches `threshold`.
+    Only rows sharing a `groups` label are compared (e.g. an IVF list), which turns the
+    O(n^2) all-pairs pass into one per group. Returns clusters of two or more rows, leader first.
+    """
+    if groups is None:
+        return _cluster_block(vectors, np.arange(len(vectors)), threshold)
+    clusters = []
+    for label in np.unique(groups):
+        clusters.extend(_cluster_block(vectors, np.flatnonzero(groups == label), threshold))
+    return clusters
+
+
+def _cluster_block(vectors: np.ndarray, rows: np.ndarray, threshold: float) -> List[List[int]]:
+    members = vectors[rows]
+    taken = np.zeros(len(rows), dtype=bool)
+    # Similarity rows are computed a slab at a time to keep the scratch matrix around 16MB
+    slab = max(1, min(1024, (1 << 22) // max(len(rows), 1)))
+    clusters = []
+    for start in range(0, len(rows), slab):
+        scores = members[start:start + slab] @ members.T
+        for offset, row_scores in enumerate(scores):
+            leader = start + offset
+            if taken[leader]:
+                continue
+            taken[leader] = True
+            matched = np.flatnonzero((row_scores >= threshold) & ~taken)
+            if len(matched):
+                taken[matched] = True
+                clusters.append([int(rows[leader])] + [int(rows[i]) for i in matched])
+    return clusters
+
+
+class EpisodeIndex:
+    """
+    In-memory similarity index for one user's episodes.
+    Holds a contiguous, pre-normalized float32 matrix and a parallel array of episode ids.
+    Rows are over-allocated so appends are amortized O(dim).
+    """
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.dim = dim
+        self.size = 0
+        self._vectors = np.zeros((max(capacity, 1), dim), dtype=np.float32)
+        self._ids: List[Any] = []
+
+    @classmethod
+    def from_rows(cls, ids: List[Any], vectors: np.ndarray) -> "EpisodeIndex":
+        index = cls(vectors.shape[1], capacity=len(ids))
+        index._vectors[:len(ids)] = normalize_rows(vectors.astype(np.float32, copy=False))
+        index._ids = list(ids)
+        index.size = len(ids)
+        return index
+
+    @property
+    def nbytes(self) -> int:
+        # ObjectIds are 12 bytes, plus list slot overhead
+        return self._vectors.nbytes + len(self._ids) * 20
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self.size]
+
+    @property
+    def ids(self) -> List[Any]:
+        return self._ids
+
+    def append(self, episode_id: Any, embedding: List[float]) -> bool:
+        vec = np.asarray(embedding, dtype=np.float32)
+        if vec.shape != (self.dim,):
+            return False
+
+        if self.size == self._vectors.shape[0]:
+            grown = np.zeros((self._vectors.shape[0] * 2, self.dim), dtype=np.float32)
+            grown[:self.size] = self._vectors[:self.size]
+            self._vectors = grown
+
+        norm = float(np.linalg.norm(vec))
+        self._vectors[self.size] = vec / norm if norm > 0 else vec
+        self._ids.append(episode_id)
+        self.size += 1
+        return True
+
+    def remove(self, episode_ids: Set[Any]) -> int:
+        """Drops the given episodes in place, keeping row order. Returns how many were removed."""
+        keep = [row for row, episode_id in enumerate(self._ids) if episode_id not in episode_ids]
+        removed = self.size - len(keep)
+        if removed:
+            self._vectors[:len(keep)] = self._vectors[keep]
+            self._vectors[len(keep):self.size] = 0
+            self._ids = [self._ids[row] for row in keep]
+            self.size = len(keep)
+        return removed
+
+    def search(self, embedding: List[float], k: int) -> List[Tuple[int, float]]:
+        """Returns up to k (row, cosine similarity) pairs, best first."""
+        query = np.asarray(embedding, dtype=np.float32)
+        if self.size == 0 or k <= 0 or query.shape != (self.dim,):
+            return []
+
+        norm = float(np.linalg.norm(query))
+        if norm > 0:
+            query = query / norm
+
+        scores = self.vectors @ query
+        if k < self.size:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(self.size)
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+class EpisodeIndexCache:
+    """
+    Per-user EpisodeIndex registry with LRU eviction under a byte budget.
+    The most recently used index is never evicted, even if it alone exceeds the budget.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._indexes: "OrderedDict[str, EpisodeIndex]" = OrderedDict()
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._indexes
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(index.nbytes for index in self._indexes.values())
+
+    def get(self, user_id: str) -> Optional[EpisodeIndex]:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+        return index
+
+    def put(self, user_id: str, index: EpisodeIndex):
+        self._indexes[user_id] = index
+        self._indexes.move_to_end(user_id)
+        self._evict()
+
+    def append(self, user_id: str, episode_id: Any, embedding: List[float]) -> bool:
+        """Appends to a loaded index; unloaded users pick the episode up on their next lazy load."""
+        index = self._indexes.get(user_id)
+        if index is None:
+            return False
+        appended = index.append(episode_id, embedding)
+        self._evict()
+        return appended
+
+    def discard(self, user_id: str):
+        self._indexes.pop(user_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self._indexes),
+            "episodes": sum(index.size for index in self._indexes.values()),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _evict(self):
+        total = self.nbytes
+        while total > self.max_bytes and len(self._indexes) > 1:
+            _, evicted = self._indexes.popitem(last=False)
+            total -= evicted.nbytes
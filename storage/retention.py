@@ -0,0 +1,82 @@
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+class RetentionPolicy:
+    """
+    Decides which of a user's episodes stay in the hot tier that live similarity search scans.
+
+    Each episode scores a weighted sum of three terms in [0, 1]:
+        importance                         as extracted (and bumped by duplicate merges)
+        recency                            halves every `half_life_days` since it was last
+                                           created, restated or retrieved
+        hits / (hits + hits_half)          saturating credit for retrieval hits
+    The best `hot_max` stay hot. Episodes younger than `min_age_days` are never demoted,
+    so a fresh fact always gets a chance to be retrieved.
+    """
+
+    def __init__(
+        self,
+        hot_max: int,
+        min_age_days: float = 7.0,
+        importance_weight: float = 1.0,
+        recency_weight: float = 1.0,
+        half_life_days: float = 30.0,
+        hits_weight: float = 1.0,
+        hits_half: float = 3.0,
+    ):
+        self.hot_max = hot_max
+        self.min_age_days = min_age_days
+        self.importance_weight = importance_weight
+        self.recency_weight = recency_weight
+        self.half_life_days = half_life_days
+        self.hits_weight = hits_weight
+        self.hits_half = hits_half
+
+    @classmethod
+    def from_settings(cls, settings) -> "RetentionPolicy":
+        return cls(
+            hot_max=settings.EPISODE_HOT_MAX,
+            min_age_days=settings.EPISODE_HOT_MIN_AGE_DAYS,
+            importance_weight=settings.RETENTION_IMPORTANCE_WEIGHT,
+            recency_weight=settings.RETENTION_RECENCY_WEIGHT,
+            half_life_days=settings.RETENTION_RECENCY_HALF_LIFE_DAYS,
+            hits_weight=settings.RETENTION_HITS_WEIGHT,
+            hits_half=settings.RETENTION_HITS_HALF,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.hot_max > 0
+
+    @staticmethod
+    def last_touched(fields: Dict[str, Any]) -> datetime:
+        return max(t for t in (fields["created_at"], fields.get("last_seen_at"), fields.get("last_retrieved_at")) if t)
+
+    def score(self, fields: Dict[str, Any], now: Optional[datetime] = None) -> float:
+        now = now or datetime.utcnow()
+        age_days = max(0.0, (now - self.last_touched(fields)).total_seconds() / 86400)
+        recency = math.pow(0.5, age_days / self.half_life_days) if self.half_life_days > 0 else 0.0
+        hits = fields.get("retrieval_hits") or 0
+        hit_credit = hits / (hits + self.hits_half) if self.hits_half > 0 else float(hits > 0)
+        return (
+            self.importance_weight * float(fields["importance"])
+            + self.recency_weight * recency
+            + self.hits_weight * hit_credit
+        )
+
+    def select_demotions(self, episodes: Dict[Any, Dict[str, Any]], now: Optional[datetime] = None) -> List[Any]:
+        """Ids of the hot episodes to move to the cold tier, lowest score first."""
+        if not self.enabled or len(episodes) <= self.hot_max:
+            return []
+        now = now or datetime.utcnow()
+        ranked = sorted(episodes, key=lambda episode_id: self.score(episodes[episode_id], now))
+        excess = len(episodes) - self.hot_max
+        demote = []
+        for episode_id in ranked:
+            if len(demote) == excess:
+                break
+            if (now - episodes[episode_id]["created_at"]).total_seconds() >= self.min_age_days * 86400:
+                demote.append(episode_id)
+        return demote
@@ -0,0 +1,81 @@
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from ..metrics import SESSION_WINDOW_LOOKUPS
+from ..models import Message
+
+SessionKey = Tuple[str, str]
+
+
+class SessionWindowCache:
+    """
+    Per-session ring buffers of the newest `capacity` messages, for up to `max_sessions`
+    sessions with LRU eviction of idle ones.
+
+    The store writes new messages through to a held window and cold-loads a session's
+    window from the backend on first read. Windows only see writes made through this
+    process, so a session is assumed to be served by one app process at a time.
+    """
+
+    def __init__(self, capacity: int, max_sessions: int):
+        self.capacity = capacity
+        self.max_sessions = max_sessions
+        self._windows: "OrderedDict[SessionKey, Deque[Message]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def covers(self, n: int) -> bool:
+        """Whether a read of the newest `n` messages can be served from a window."""
+        return self.max_sessions > 0 and 0 < n <= self.capacity
+
+    def get(self, key: SessionKey, n: int) -> Optional[List[Message]]:
+        """Newest-first copy of the last `n` messages, or None if the session isn't held."""
+        window = self._windows.get(key)
+        if window is None:
+            self.misses += 1
+            SESSION_WINDOW_LOOKUPS.inc(result="miss")
+            return None
+        self._windows.move_to_end(key)
+        self.hits += 1
+        SESSION_WINDOW_LOOKUPS.inc(result="hit")
+        newest_first = list(reversed(window))
+        return newest_first[:n]
+
+    def put(self, key: SessionKey, newest_first: List[Message]):
+        self._windows[key] = deque(reversed(newest_first[:self.capacity]), maxlen=self.capacity)
+        self._windows.move_to_end(key)
+        while len(self._windows) > self.max_sessions:
+            self._windows.popitem(last=False)
+
+    def append(self, key: SessionKey, message: Message) -> bool:
+        """Writes through to a held window; sessions not held pick the message up on their cold load."""
+        window = self._windows.get(key)
+        if window is None:
+            return False
+        if window and message.created_at < window[-1].created_at:
+            # Out-of-order timestamp: keep the backend's created_at order
+            ordered = sorted([*window, message], key=lambda m: m.created_at)
+            window.clear()
+            window.extend(ordered[-self.capacity:])
+        else:
+            window.append(message)
+        self._windows.move_to_end(key)
+        return True
+
+    def discard(self, key: SessionKey):
+        self._windows.pop(key, None)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._windows),
+            "max_sessions": self.max_sessions,
+            "capacity": self.capacity,
+            "messages": sum(len(window) for window in self._windows.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
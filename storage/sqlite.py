@@ -0,0 +1,844 @@
+"""
+Embedded single-node backend: SQLite in WAL mode, no server and no extra dependencies.
+
+Rows live in one SQLite file. Episode embeddings live next to it in append-only float32
+files, one per dimension ("<path>.vec<dim>.f32"), which are read through np.memmap so the
+episode index loads straight from the page cache. Every statement runs on a single
+dedicated thread; writes take SQLite's write lock (BEGIN IMMEDIATE), which also serializes
+vector appends across processes sharing the file.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+from ..models import Message, SessionState, Summary, Episode
+from .base import MemoryStore
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DTYPE = np.dtype("<f4")
+MMAP_BYTES = 256 * 1024 * 1024  # SQLite's own memory-mapped I/O window for the database file
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    session_id TEXT,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_user_session_created ON messages (user_id, session_id, created_at);
+CREATE INDEX IF NOT EXISTS messages_user_created ON messages (user_id, created_at);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    user_messages INTEGER NOT NULL DEFAULT 0,
+    assistant_messages INTEGER NOT NULL DEFAULT 0,
+    last_summarized_user_messages INTEGER NOT NULL DEFAULT 0,
+    last_activity_at TEXT,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, session_id)
+);
+
+CREATE TABLE IF NOT EXISTS daily_activity (
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, date, session_id, role)
+);
+
+CREATE TABLE IF NOT EXISTS summaries (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    period TEXT NOT NULL,
+    text TEXT NOT NULL,
+    watermark TEXT,
+    created_at TEXT NOT NULL,
+    UNIQUE (user_id, scope, session_id, period)
+);
+CREATE INDEX IF NOT EXISTS summaries_user_scope_created ON summaries (user_id, scope, created_at);
+
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    session_id TEXT,
+    fact TEXT NOT NULL,
+    importance REAL NOT NULL,
+    created_at TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector_row INTEGER NOT NULL,
+    last_seen_at TEXT,
+    seen_count INTEGER NOT NULL DEFAULT 1,
+    retrieval_hits INTEGER NOT NULL DEFAULT 0,
+    last_retrieved_at TEXT
+);
+CREATE INDEX IF NOT EXISTS episodes_user_created ON episodes (user_id, created_at);
+
+-- Demoted by the retention policy; same columns and id space as episodes, vectors stay in place
+CREATE TABLE IF NOT EXISTS episodes_cold (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    session_id TEXT,
+    fact TEXT NOT NULL,
+    importance REAL NOT NULL,
+    created_at TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector_row INTEGER NOT NULL,
+    last_seen_at TEXT,
+    seen_count INTEGER NOT NULL DEFAULT 1,
+    retrieval_hits INTEGER NOT NULL DEFAULT 0,
+    last_retrieved_at TEXT
+);
+CREATE INDEX IF NOT EXISTS episodes_cold_user ON episodes_cold (user_id);
+
+-- Id sequence shared by both episode tiers; AUTOINCREMENT never hands out an id twice, even after deletes
+CREATE TABLE IF NOT EXISTS episode_ids (
+    id INTEGER PRIMARY KEY AUTOINCREMENT
+);
+
+-- Bumped in the same transaction as every write to the user's memory
+CREATE TABLE IF NOT EXISTS memory_versions (
+    user_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    dedup_key TEXT,
+    last_error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+-- At most one queued job per dedup key; running jobs don't block a fresh one
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_queued_dedup ON jobs (dedup_key)
+    WHERE status = 'queued' AND dedup_key IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    model TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (model, hash)
+);
+
+CREATE TABLE IF NOT EXISTS backfill_tasks (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    messages_done INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT,
+    UNIQUE (run_id, kind, user_id, session_id)
+);
+CREATE INDEX IF NOT EXISTS backfill_tasks_run_status ON backfill_tasks (run_id, status);
+"""
+
+# Columns added after a table first shipped; connect() adds them to older database files
+ADDED_COLUMNS = {
+    "episodes": [
+        ("last_seen_at", "TEXT"), ("seen_count", "INTEGER NOT NULL DEFAULT 1"),
+        ("retrieval_hits", "INTEGER NOT NULL DEFAULT 0"), ("last_retrieved_at", "TEXT"),
+    ],
+}
+
+EPISODE_COLUMNS = (
+    "id, user_id, session_id, fact, importance, created_at, dim, vector_row, "
+    "last_seen_at, seen_count, retrieval_hits, last_retrieved_at"
+)
+
+BACKFILL_TASK_FIELDS = {"status", "messages_done", "error"}
+
+
+def _ts(value: Optional[datetime]) -> Optional[str]:
+    # Fixed-width ISO text sorts chronologically
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%f") if value is not None else None
+
+
+def _dt(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+def _key(value: Optional[str]) -> str:
+    # NULLs never collide in SQLite unique keys; '' stands in for "no session/period"
+    return value if value is not None else ""
+
+
+def _unkey(value: str) -> Optional[str]:
+    return value if value != "" else None
+
+
+class EmbeddingFile:
+    """Append-only float32 rows of one dimension, read through a memory map."""
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.row_bytes = dim * EMBEDDING_DTYPE.itemsize
+        self._map: Optional[np.memmap] = None
+
+    def append(self, vector: np.ndarray) -> int:
+        """Returns the new row number. Callers hold the database write lock."""
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            # A torn append from a crash leaves a partial row; pad past it
+            padding = -offset % self.row_bytes
+            f.write(b"\0" * padding + vector.astype(EMBEDDING_DTYPE, copy=False).tobytes())
+        return (offset + padding) // self.row_bytes
+
+    def rows(self, indices: np.ndarray) -> np.ndarray:
+        needed = int(indices.max()) + 1 if len(indices) else 0
+        if self._map is None or len(self._map) < needed:
+            rows = os.path.getsize(self.path) // self.row_bytes
+            self._map = np.memmap(self.path, dtype=EMBEDDING_DTYPE, mode="r", shape=(rows, self.dim))
+        return self._map[indices]
+
+
+class SQLiteStore(MemoryStore):
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._embedding_files: Dict[int, EmbeddingFile] = {}
+
+    # ------------------------------------------------------------------
+    # Connection Management
+    # ------------------------------------------------------------------
+    async def connect(self, path: Optional[str] = None):
+        """Opens (creating if needed) the database at SQLITE_PATH, or at `path` if given."""
+        self.path = path or self.path
+        # One thread owns the connection; SQLite calls are short, so this is the whole pool
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-store")
+        await self._run(self._open)
+        logger.info("Opened SQLite store: %s", self.path)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+        conn.executescript(SCHEMA)
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for name, definition in columns:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+        # Files from before the shared sequence: start it past every id already in use
+        conn.execute(
+            """INSERT OR IGNORE INTO episode_ids (id)
+               SELECT top FROM (SELECT MAX(COALESCE((SELECT MAX(id) FROM episodes), 0),
+                                           COALESCE((SELECT MAX(id) FROM episodes_cold), 0)) AS top)
+               WHERE top > COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'episode_ids'), 0)"""
+        )
+        conn.execute("DELETE FROM episode_ids")
+        self._conn = conn
+
+    async def close(self):
+        await self._run(self._conn.close)
+        self._conn = None
+        self._executor.shutdown(wait=True)
+        logger.info("SQLite store closed.")
+
+    @property
+    def connected(self) -> bool:
+        return self._conn is not None
+
+    async def _run(self, fn: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _read(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        return await self._run(lambda: self._conn.execute(sql, params).fetchall())
+
+    async def _write(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Runs fn(conn) in one immediate-mode transaction."""
+        def transaction():
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+        return await self._run(transaction)
+
+    # ------------------------------------------------------------------
+    # Message Operations
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _message_row(m: Message) -> tuple:
+        return (m.user_id, m.session_id, m.role, m.content, _ts(m.created_at))
+
+    @staticmethod
+    def _apply_counters(conn: sqlite3.Connection, messages: List[Message]):
+        """Session counter and daily rollup increments for a batch of messages."""
+        sessions: Dict[tuple, Dict[str, Any]] = {}
+        daily: Dict[tuple, int] = {}
+        for m in messages:
+            day_key = (m.user_id, m.created_at.strftime("%Y-%m-%d"), _key(m.session_id), m.role)
+            daily[day_key] = daily.get(day_key, 0) + 1
+            if not m.session_id:
+                continue
+            entry = sessions.setdefault(
+                (m.user_id, m.session_id), {"user": 0, "assistant": 0, "first": m.created_at, "last": m.created_at}
+            )
+            if m.role in ("user", "assistant"):
+                entry[m.role] += 1
+            entry["first"] = min(entry["first"], m.created_at)
+            entry["last"] = max(entry["last"], m.created_at)
+
+        conn.executemany(
+            """INSERT INTO sessions (user_id, session_id, user_messages, assistant_messages, last_activity_at, created_at)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (user_id, session_id) DO UPDATE SET
+                   user_messages = user_messages + excluded.user_messages,
+                   assistant_messages = assistant_messages + excluded.assistant_messages,
+                   last_activity_at = MAX(COALESCE(last_activity_at, ''), excluded.last_activity_at),
+                   created_at = MIN(created_at, excluded.created_at)""",
+            [(user_id, session_id, e["user"], e["assistant"], _ts(e["last"]), _ts(e["first"]))
+             for (user_id, session_id), e in sessions.items()]
+        )
+        conn.executemany(
+            """INSERT INTO daily_activity (user_id, date, session_id, role, count) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (user_id, date, session_id, role) DO UPDATE SET count = count + excluded.count""",
+            [(*key, count) for key, count in daily.items()]
+        )
+
+    @staticmethod
+    def _bump_versions(conn: sqlite3.Connection, user_ids: List[str]):
+        conn.executemany(
+            """INSERT INTO memory_versions (user_id, version) VALUES (?, 1)
+               ON CONFLICT (user_id) DO UPDATE SET version = version + 1""",
+            [(user_id,) for user_id in user_ids]
+        )
+
+    async def _save_message(self, message: Message) -> Optional[SessionState]:
+        def write(conn):
+            conn.execute(
+                "INSERT INTO messages (user_id, session_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                self._message_row(message)
+            )
+            self._apply_counters(conn, [message])
+            self._bump_versions(conn, [message.user_id])
+            if not message.session_id:
+                return None
+            return conn.execute(
+                "SELECT * FROM sessions WHERE user_id = ? AND session_id = ?",
+                (message.user_id, message.session_id)
+            ).fetchone()
+
+        row = await self._write(write)
+        return self._session_state(row) if row else None
+
+    async def _save_messages_bulk(self, messages: List[Message]) -> int:
+        if not messages:
+            return 0
+
+        def write(conn):
+            conn.executemany(
+                "INSERT INTO messages (user_id, session_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                [self._message_row(m) for m in messages]
+            )
+            self._apply_counters(conn, messages)
+            self._bump_versions(conn, list({m.user_id for m in messages}))
+
+        await self._write(write)
+        return len(messages)
+
+    async def get_daily_activity(self, user_id: str, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        rows = await self._read(
+            """SELECT date, session_id, role, count FROM daily_activity
+               WHERE user_id = ? AND date >= ? AND date <= ? ORDER BY date""",
+            (user_id, start or "", end or "9999-99-99")
+        )
+        days: Dict[str, Dict[str, Any]] = {}
+        sessions: Dict[str, set] = {}
+        for row in rows:
+            day = days.setdefault(row["date"], {"date": row["date"], "count": 0, "by_role": {}, "sessions": 0})
+            day["count"] += row["count"]
+            day["by_role"][row["role"]] = day["by_role"].get(row["role"], 0) + row["count"]
+            sessions.setdefault(row["date"], set()).add(row["session_id"])
+        for date, day in days.items():
+            day["sessions"] = len(sessions[date])
+        return list(days.values())
+
+    # Rows come from our own schema, so models are built without validation (model_construct)
+    @staticmethod
+    def _message(row: sqlite3.Row) -> Message:
+        return Message.model_construct(
+            user_id=row["user_id"], session_id=row["session_id"], role=row["role"],
+            content=row["content"], created_at=_dt(row["created_at"])
+        )
+
+    async def get_session_messages(self, user_id: str, session_id: str, role: str, skip: int, limit: int) -> List[Message]:
+        rows = await self._read(
+            """SELECT user_id, session_id, role, content, created_at FROM messages
+               WHERE user_id = ? AND session_id = ? AND role = ?
+               ORDER BY created_at, id LIMIT ? OFFSET ?""",
+            (user_id, session_id, role, limit, skip)
+        )
+        return [self._message(row) for row in rows]
+
+    async def _get_last_n_messages(self, user_id: str, session_id: Optional[str], n: int) -> List[Message]:
+        if session_id:
+            rows = await self._read(
+                """SELECT user_id, session_id, role, content, created_at FROM messages
+                   WHERE user_id = ? AND session_id = ? ORDER BY created_at DESC, id DESC LIMIT ?""",
+                (user_id, session_id, n)
+            )
+        else:
+            rows = await self._read(
+                """SELECT user_id, session_id, role, content, created_at FROM messages
+                   WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?""",
+                (user_id, n)
+            )
+        return [self._message(row) for row in rows]
+
+    @staticmethod
+    def _session_state(row: sqlite3.Row) -> SessionState:
+        return SessionState.model_construct(
+            user_id=row["user_id"],
+            session_id=row["session_id"],
+            user_messages=row["user_messages"],
+            assistant_messages=row["assistant_messages"],
+            last_summarized_user_messages=row["last_summarized_user_messages"],
+            last_activity_at=_dt(row["last_activity_at"]),
+            created_at=_dt(row["created_at"])
+        )
+
+    async def get_session_state(self, user_id: str, session_id: str) -> Optional[SessionState]:
+        rows = await self._read("SELECT * FROM sessions WHERE user_id = ? AND session_id = ?", (user_id, session_id))
+        return self._session_state(rows[0]) if rows else None
+
+    async def claim_session_summary(self, state: SessionState, every: int) -> bool:
+        if state.user_messages - state.last_summarized_user_messages < every:
+            return False
+        changed = await self._write(lambda conn: conn.execute(
+            """UPDATE sessions SET last_summarized_user_messages = ?
+               WHERE user_id = ? AND session_id = ? AND last_summarized_user_messages = ?""",
+            (state.user_messages, state.user_id, state.session_id, state.last_summarized_user_messages)
+        ).rowcount)
+        return changed == 1
+
+    # ------------------------------------------------------------------
+    # Memory Versions (response cache invalidation)
+    # ------------------------------------------------------------------
+    async def get_memory_version(self, user_id: str) -> int:
+        rows = await self._read("SELECT version FROM memory_versions WHERE user_id = ?", (user_id,))
+        return rows[0]["version"] if rows else 0
+
+    async def _bump_memory_versions(self, user_ids: List[str]):
+        await self._write(lambda conn: self._bump_versions(conn, user_ids))
+
+    # ------------------------------------------------------------------
+    # Summary Operations
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _summary(row: sqlite3.Row) -> Summary:
+        return Summary.model_construct(
+            user_id=row["user_id"],
+            session_id=_unkey(row["session_id"]),
+            scope=row["scope"],
+            text=row["text"],
+            period=_unkey(row["period"]),
+            watermark=_dt(row["watermark"]),
+            created_at=_dt(row["created_at"])
+        )
+
+    async def upsert_summary(self, summary: Summary):
+        def write(conn):
+            conn.execute(
+                """INSERT INTO summaries (user_id, session_id, scope, period, text, watermark, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (user_id, scope, session_id, period) DO UPDATE SET
+                       text = excluded.text, watermark = excluded.watermark, created_at = excluded.created_at""",
+                (summary.user_id, _key(summary.session_id), summary.scope, _key(summary.period),
+                 summary.text, _ts(summary.watermark), _ts(summary.created_at))
+            )
+            self._bump_versions(conn, [summary.user_id])
+
+        await self._write(write)
+
+    async def get_latest_summary(self, user_id: str, scope: str, session_id: Optional[str] = None) -> Optional[Summary]:
+        sql, params = "SELECT * FROM summaries WHERE user_id = ? AND scope = ?", [user_id, scope]
+        if scope == "session" and session_id:
+            sql += " AND session_id = ?"
+            params.append(session_id)
+        elif scope == "user":  # Lifetime summary has no session
+            sql += " AND session_id = ''"
+        rows = await self._read(sql + " ORDER BY created_at DESC LIMIT 1", tuple(params))
+        return self._summary(rows[0]) if rows else None
+
+    async def get_all_session_summaries(self, user_id: str, limit: Optional[int] = None) -> List[Summary]:
+        rows = await self._read(
+            "SELECT * FROM summaries WHERE user_id = ? AND scope = 'session' ORDER BY created_at DESC LIMIT ?",
+            (user_id, limit if limit else -1)
+        )
+        return [self._summary(row) for row in rows]
+
+    async def get_session_summaries_since(self, user_id: str, since: Optional[datetime], limit: int) -> List[Summary]:
+        rows = await self._read(
+            """SELECT * FROM summaries WHERE user_id = ? AND scope = 'session' AND created_at > ?
+               ORDER BY created_at LIMIT ?""",
+            (user_id, _ts(since) or "", limit)
+        )
+        return [self._summary(row) for row in rows]
+
+    # ------------------------------------------------------------------
+    # Episode Storage
+    # ------------------------------------------------------------------
+    def _embedding_file(self, dim: int) -> EmbeddingFile:
+        if dim not in self._embedding_files:
+            self._embedding_files[dim] = EmbeddingFile(f"{self.path}.vec{dim}.f32", dim)
+        return self._embedding_files[dim]
+
+    async def _insert_episodes(self, episodes: List[Episode]) -> List[int]:
+        vectors = []
+        for episode in episodes:
+            vector = np.asarray(episode.embedding, dtype=EMBEDDING_DTYPE)
+            norm = float(np.linalg.norm(vector))
+            vectors.append(vector / norm if norm > 0 else vector)
+
+        def write(conn):
+            ids = []
+            for episode, vector in zip(episodes, vectors):
+                row = self._embedding_file(len(vector)).append(vector)
+                # Ids come from the shared sequence, so neither a demoted nor a deleted episode's id is reused
+                episode_id = conn.execute("INSERT INTO episode_ids DEFAULT VALUES").lastrowid
+                conn.execute("DELETE FROM episode_ids WHERE id = ?", (episode_id,))
+                conn.execute(
+                    """INSERT INTO episodes (id, user_id, session_id, fact, importance, created_at, dim, vector_row,
+                                             last_seen_at, seen_count, retrieval_hits, last_retrieved_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (episode_id, episode.user_id, episode.session_id, episode.fact, episode.importance,
+                     _ts(episode.created_at), len(vector), row, _ts(episode.last_seen_at),
+                     episode.seen_count, episode.retrieval_hits, _ts(episode.last_retrieved_at))
+                )
+                ids.append(episode_id)
+            return ids
+
+        return await self._write(write)
+
+    @staticmethod
+    def _episode_table(cold: bool) -> str:
+        return "episodes_cold" if cold else "episodes"
+
+    async def _load_episode_vectors(self, user_id: str, cold: bool = False) -> Tuple[List[int], List[np.ndarray]]:
+        def load():
+            rows = self._conn.execute(
+                f"SELECT id, dim, vector_row FROM {self._episode_table(cold)} WHERE user_id = ? ORDER BY id", (user_id,)
+            ).fetchall()
+            ids, vectors = [], []
+            by_dim: Dict[int, List[sqlite3.Row]] = {}
+            for row in rows:
+                by_dim.setdefault(row["dim"], []).append(row)
+            for dim, dim_rows in by_dim.items():
+                block = self._embedding_file(dim).rows(np.array([r["vector_row"] for r in dim_rows], dtype=np.int64))
+                ids.extend(r["id"] for r in dim_rows)
+                vectors.extend(block)
+            return ids, vectors
+
+        return await self._run(load)
+
+    @staticmethod
+    def _episode_fields(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "user_id": row["user_id"], "session_id": row["session_id"], "fact": row["fact"],
+            "importance": row["importance"], "created_at": _dt(row["created_at"]),
+            "last_seen_at": _dt(row["last_seen_at"]), "seen_count": row["seen_count"],
+            "retrieval_hits": row["retrieval_hits"], "last_retrieved_at": _dt(row["last_retrieved_at"])
+        }
+
+    async def _get_episode_fields(self, episode_ids: List[int], cold: bool = False) -> Dict[int, Dict[str, Any]]:
+        rows = await self._read(
+            f"SELECT * FROM {self._episode_table(cold)} "
+            f"WHERE id IN ({', '.join('?' * len(episode_ids))})",
+            tuple(episode_ids)
+        )
+        return {row["id"]: self._episode_fields(row) for row in rows}
+
+    async def _get_retention_fields(self, user_id: str) -> Dict[int, Dict[str, Any]]:
+        rows = await self._read(
+            """SELECT id, importance, created_at, last_seen_at, retrieval_hits, last_retrieved_at
+               FROM episodes WHERE user_id = ?""",
+            (user_id,)
+        )
+        return {
+            row["id"]: {
+                "importance": row["importance"], "created_at": _dt(row["created_at"]),
+                "last_seen_at": _dt(row["last_seen_at"]), "retrieval_hits": row["retrieval_hits"],
+                "last_retrieved_at": _dt(row["last_retrieved_at"])
+            }
+            for row in rows
+        }
+
+    async def _set_episode_tier(self, episode_ids: List[int], cold: bool) -> List[int]:
+        source, target = self._episode_table(not cold), self._episode_table(cold)
+
+        def write(conn):
+            moved = []
+            for start in range(0, len(episode_ids), 500):
+                chunk = tuple(episode_ids[start:start + 500])
+                placeholders = ", ".join("?" * len(chunk))
+                moved.extend(row["id"] for row in conn.execute(
+                    f"SELECT id FROM {source} WHERE id IN ({placeholders})", chunk
+                ))
+                conn.execute(
+                    f"INSERT INTO {target} ({EPISODE_COLUMNS}) "
+                    f"SELECT {EPISODE_COLUMNS} FROM {source} WHERE id IN ({placeholders})",
+                    chunk
+                )
+                conn.execute(f"DELETE FROM {source} WHERE id IN ({placeholders})", chunk)
+            return moved
+
+        return await self._write(write)
+
+    async def _record_episode_hits(self, episode_ids: List[int], retrieved_at: datetime):
+        await self._write(lambda conn: conn.executemany(
+            "UPDATE episodes SET retrieval_hits = retrieval_hits + 1, last_retrieved_at = ? WHERE id = ?",
+            [(_ts(retrieved_at), episode_id) for episode_id in episode_ids]
+        ))
+
+    async def _reinforce_episode(self, episode_id: int, importance: float, seen: int, seen_at: datetime):
+        await self._write(lambda conn: conn.execute(
+            """UPDATE episodes SET importance = MAX(importance, ?), seen_count = seen_count + ?,
+                   last_seen_at = MAX(COALESCE(last_seen_at, created_at), ?)
+               WHERE id = ?""",
+            (importance, seen, _ts(seen_at), episode_id)
+        ))
+
+    async def _delete_episodes(self, episode_ids: List[int]):
+        # Their rows in the append-only vector files stay behind as unreferenced space
+        await self._write(lambda conn: conn.executemany(
+            "DELETE FROM episodes WHERE id = ?", [(episode_id,) for episode_id in episode_ids]
+        ))
+
+    def _episode_id_to_bytes(self, episode_id: int) -> bytes:
+        return episode_id.to_bytes(12, "big")
+
+    def _episode_id_from_bytes(self, raw: bytes) -> int:
+        return int.from_bytes(raw, "big")
+
+    async def get_last_n_episodic_facts(self, user_id: str, n: int) -> List[str]:
+        rows = await self._read(
+            "SELECT fact FROM episodes WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?", (user_id, n)
+        )
+        return [row["fact"] for row in rows]
+
+    # ------------------------------------------------------------------
+    # Job Operations (background memory maintenance)
+    # ------------------------------------------------------------------
+    async def enqueue_job(self, kind: str, payload: Dict[str, Any], dedup_key: Optional[str] = None):
+        now = _ts(datetime.utcnow())
+
+        def write(conn):
+            cursor = conn.execute(
+                """INSERT OR IGNORE INTO jobs (kind, payload, status, attempts, dedup_key, created_at, updated_at)
+                   VALUES (?, ?, 'queued', 0, ?, ?, ?)""",
+                (kind, json.dumps(payload), dedup_key, now, now)
+            )
+            return cursor.lastrowid if cursor.rowcount == 1 else None
+
+        return await self._write(write)
+
+    async def claim_job(self, job_id) -> Optional[Dict[str, Any]]:
+        def write(conn):
+            claimed = conn.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ?, attempts = attempts + 1 WHERE id = ? AND status = 'queued'",
+                (_ts(datetime.utcnow()), job_id)
+            ).rowcount
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone() if claimed else None
+
+        row = await self._write(write)
+        if row is None:
+            return None
+        return {
+            "_id": row["id"], "kind": row["kind"], "payload": json.loads(row["payload"]),
+            "status": row["status"], "attempts": row["attempts"], "dedup_key": row["dedup_key"],
+        }
+
+    async def complete_job(self, job_id):
+        await self._write(lambda conn: conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,)))
+
+    async def release_job(self, job_id, error: Optional[str] = None, failed: bool = False):
+        def write(conn):
+            try:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ?, last_error = COALESCE(?, last_error) WHERE id = ?",
+                    ("failed" if failed else "queued", _ts(datetime.utcnow()), error, job_id)
+                )
+            except sqlite3.IntegrityError:
+                # An identical job was queued meanwhile and will cover this one
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+        await self._write(write)
+
+    async def requeue_stale_jobs(self, lease_seconds: int) -> int:
+        cutoff = _ts(datetime.utcnow() - timedelta(seconds=lease_seconds))
+        rows = await self._read("SELECT id FROM jobs WHERE status = 'running' AND updated_at < ?", (cutoff,))
+        for row in rows:
+            await self.release_job(row["id"], error="lease expired")
+        return len(rows)
+
+    async def get_queued_job_ids(self, limit: int) -> List[Any]:
+        rows = await self._read("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT ?", (limit,))
+        return [row["id"] for row in rows]
+
+    # ------------------------------------------------------------------
+    # Embedding Cache Operations
+    # ------------------------------------------------------------------
+    async def get_cached_embeddings(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        if not hashes:
+            return {}
+        rows = await self._read(
+            f"SELECT hash, vector FROM embedding_cache WHERE model = ? AND hash IN ({', '.join('?' * len(hashes))})",
+            (model, *hashes)
+        )
+        return {row["hash"]: np.frombuffer(row["vector"], dtype=EMBEDDING_DTYPE) for row in rows}
+
+    async def save_cached_embeddings(self, model: str, vectors: Dict[str, List[float]]):
+        if not vectors:
+            return
+        now = _ts(datetime.utcnow())
+        await self._write(lambda conn: conn.executemany(
+            "INSERT OR IGNORE INTO embedding_cache (model, hash, vector, created_at) VALUES (?, ?, ?, ?)",
+            [(model, text_hash, np.asarray(vector, dtype=EMBEDDING_DTYPE).tobytes(), now)
+             for text_hash, vector in vectors.items()]
+        ))
+
+    async def purge_embedding_cache(self, keep_model: str) -> int:
+        return await self._write(lambda conn: conn.execute(
+            "DELETE FROM embedding_cache WHERE model != ?", (keep_model,)
+        ).rowcount)
+
+    # ------------------------------------------------------------------
+    # Backfill Task Operations (bulk import pipeline)
+    # ------------------------------------------------------------------
+    async def add_backfill_tasks(self, run_id: str, kind: str, keys: List[tuple]):
+        if not keys:
+            return
+        now = _ts(datetime.utcnow())
+        await self._write(lambda conn: conn.executemany(
+            """INSERT OR IGNORE INTO backfill_tasks (run_id, kind, user_id, session_id, status, messages_done, created_at)
+               VALUES (?, ?, ?, ?, 'pending', 0, ?)""",
+            [(run_id, kind, user_id, _key(session_id), now) for user_id, session_id in keys]
+        ))
+
+    async def get_open_backfill_tasks(self, run_id: str, kind: str, limit: int) -> List[Dict[str, Any]]:
+        rows = await self._read(
+            """SELECT * FROM backfill_tasks WHERE run_id = ? AND kind = ? AND status IN ('pending', 'running')
+               ORDER BY id LIMIT ?""",
+            (run_id, kind, limit)
+        )
+        return [
+            {**dict(row), "_id": row["id"], "session_id": _unkey(row["session_id"])}
+            for row in rows
+        ]
+
+    async def update_backfill_task(self, task_id, **fields):
+        unknown = set(fields) - BACKFILL_TASK_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown backfill task fields: {sorted(unknown)}")
+        fields["updated_at"] = _ts(datetime.utcnow())
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        await self._write(lambda conn: conn.execute(
+            f"UPDATE backfill_tasks SET {assignments} WHERE id = ?", (*fields.values(), task_id)
+        ))
+
+    async def reopen_failed_backfill_tasks(self, run_id: str) -> int:
+        return await self._write(lambda conn: conn.execute(
+            "UPDATE backfill_tasks SET status = 'pending', updated_at = ? WHERE run_id = ? AND status = 'failed'",
+            (_ts(datetime.utcnow()), run_id)
+        ).rowcount)
+
+    async def get_backfill_users(self, run_id: str) -> List[str]:
+        rows = await self._read(
+            """SELECT user_id FROM backfill_tasks WHERE run_id = ? AND kind = 'session'
+               GROUP BY user_id HAVING SUM(status != 'done') = 0""",
+            (run_id,)
+        )
+        return [row["user_id"] for row in rows]
+
+    async def get_backfill_progress(self, run_id: str) -> Dict[str, Dict[str, int]]:
+        rows = await self._read(
+            "SELECT kind, status, COUNT(*) AS count FROM backfill_tasks WHERE run_id = ? GROUP BY kind, status",
+            (run_id,)
+        )
+        progress: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            progress.setdefault(row["kind"], {})[row["status"]] = row["count"]
+        return progress
+
+    # ------------------------------------------------------------------
+    # Export / Restore (streamed a batch at a time)
+    # ------------------------------------------------------------------
+    async def _pages(self, table: str, user_id: str, batch_size: int,
+                     keys: Tuple[str, ...] = ("id",)) -> AsyncIterator[List[sqlite3.Row]]:
+        """
+        Keyset pages of a user's rows in `keys` order (that of a user_id index), so each page
+        is an index range scan and no cursor stays open across awaits.
+        """
+        columns = ", ".join(keys)
+        after: Optional[tuple] = None
+        while True:
+            where = f" AND ({columns}) > ({', '.join('?' * len(keys))})" if after else ""
+            rows = await self._read(
+                f"SELECT * FROM {table} WHERE user_id = ?{where} ORDER BY {columns} LIMIT ?",
+                (user_id, *(after or ()), batch_size)
+            )
+            if rows:
+                yield rows
+            if len(rows) < batch_size:
+                return
+            after = tuple(rows[-1][key] for key in keys)
+
+    async def iter_messages(self, user_id: str, batch_size: int) -> AsyncIterator[Message]:
+        async for rows in self._pages("messages", user_id, batch_size, ("created_at", "id")):
+            for row in rows:
+                yield self._message(row)
+
+    async def iter_summaries(self, user_id: str, batch_size: int) -> AsyncIterator[Summary]:
+        async for rows in self._pages("summaries", user_id, batch_size, ("scope", "created_at", "id")):
+            for row in rows:
+                yield self._summary(row)
+
+    async def iter_episodes(self, user_id: str, batch_size: int, cold: bool = False) -> AsyncIterator[Episode]:
+        def vectors(rows: List[sqlite3.Row]) -> List[np.ndarray]:
+            by_dim: Dict[int, List[int]] = {}
+            for i, row in enumerate(rows):
+                by_dim.setdefault(row["dim"], []).append(i)
+            out: List[Optional[np.ndarray]] = [None] * len(rows)
+            for dim, positions in by_dim.items():
+                block = self._embedding_file(dim).rows(
+                    np.array([rows[i]["vector_row"] for i in positions], dtype=np.int64)
+                )
+                for i, vector in zip(positions, block):
+                    out[i] = vector
+            return out
+
+        async for rows in self._pages(self._episode_table(cold), user_id, batch_size, ("id",) if cold else ("created_at", "id")):
+            for row, vector in zip(rows, await self._run(vectors, rows)):
+                yield Episode.model_construct(**self._episode_fields(row), embedding=vector.tolist())
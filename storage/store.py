@@ -0,0 +1,22 @@
+from typing import Optional
+
+from ..config import settings
+from .base import MemoryStore
+
+
+def create_store(backend: Optional[str] = None) -> MemoryStore:
+    """Builds the configured backend; only the chosen backend's driver is imported."""
+    backend = (backend or settings.STORAGE_BACKEND).lower()
+    if backend == "mongo":
+        from ..mongoimpl.mongo import MongoManager
+        return MongoManager()
+    if backend == "sqlite":
+        from .sqlite import SQLiteStore
+        return SQLiteStore(settings.SQLITE_PATH)
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r} (expected 'mongo' or 'sqlite')")
+
+
+# ------------------------------------------------------------------
+# Create a global instance for imports
+# ------------------------------------------------------------------
+store = create_store()
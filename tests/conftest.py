@@ -0,0 +1,37 @@
+"""
+Shared fixtures. The suite runs on the embedded SQLite backend with Ollama stubbed out per
+test, so it needs nothing beyond the app's own dependencies:
+    python -m pytest -q tests
+"""
+import os
+
+import pytest
+
+# Settings are read at import time; give the required ones harmless values
+os.environ["STORAGE_BACKEND"] = "sqlite"
+for name, value in {
+    "OLLAMA_BASE_URL": "http://ollama.invalid:11434",
+    "CHAT_MODEL": "test-chat",
+    "EMBED_MODEL": "test-embed",
+    "SHORT_TERM_N": "6",
+    "SUMMARIZE_EVERY_USER_MSGS": "4",
+    "EPISODE_EXTRACTION_LIMIT": "3",
+    "EPISODE_RETRIEVAL_K": "5",
+}.items():
+    os.environ.setdefault(name, value)
+
+from ..storage.sqlite import SQLiteStore  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def sqlite_store(tmp_path):
+    """A fresh, connected SQLite store (with empty in-process caches) per test."""
+    store = SQLiteStore(str(tmp_path / "memory.db"))
+    await store.connect()
+    yield store
+    await store.close()
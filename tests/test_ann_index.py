@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pytest
+
+from ..storage.ann_index import RETIRED_MARKER, AnnIndexRegistry
+
+DIM = 8
+
+
+def rows(start: int, count: int):
+    rng = np.random.default_rng(start)
+    ids = [i.to_bytes(12, "big") for i in range(start, start + count)]
+    return ids, rng.normal(size=(count, DIM)).astype(np.float32)
+
+
+def delta_ids(index):
+    index._refresh_delta()
+    return [bytes(raw) for raw in index._delta["id"]]
+
+
+def test_rebuild_retires_the_previous_version_without_deleting_it(tmp_path):
+    registry = AnnIndexRegistry(str(tmp_path))
+    old = registry.build("u1", *rows(0, 64))
+    registry.publish("u1", old)
+    late_ids, late_vectors = rows(100, 1)
+
+    new = registry.build("u1", *old.all_rows())
+    registry.publish("u1", new, previous=old, carried=0)
+    # Whoever still holds the old version has its insert refused, not lost in a dead delta
+    assert old.retired
+    assert old.add_many(list(zip(late_ids, late_vectors))) == 0
+    assert new.add(late_ids[0], late_vectors[0])
+
+    assert not os.path.exists(os.path.join(old.root, old.version, RETIRED_MARKER))
+    registry.remove_retired(new)
+    assert os.path.exists(os.path.join(old.root, old.version, RETIRED_MARKER))
+    assert old.search(late_vectors[0], 1, nprobe=old.nlist)  # Readers of the old version keep working
+    assert delta_ids(registry.get("u1")) == late_ids
+
+
+def test_build_is_not_live_until_published_with_the_late_and_replayed_rows(tmp_path):
+    registry = AnnIndexRegistry(str(tmp_path), retired_grace_seconds=0)
+    old = registry.build("u1", *rows(0, 64))
+    registry.publish("u1", old)
+    ids, vectors = old.all_rows()
+    late_ids, late_vectors = rows(100, 3)
+    replay_ids, replay_vectors = rows(200, 2)
+
+    new = registry.build("u1", ids, vectors)
+    # Inserts that land after the rebuild's snapshot still go to the live old version
+    assert not old.retired
+    assert old.add_many(list(zip(late_ids[:2], late_vectors[:2]))) == 2
+    carried = registry.catch_up(new, old, 0, [(replay_ids[0], replay_vectors[0])])
+    assert old.add(late_ids[2], late_vectors[2])
+    assert AnnIndexRegistry(str(tmp_path)).get("u1").version == old.version
+
+    registry.publish("u1", new, previous=old, carried=carried, replay=[(replay_ids[1], replay_vectors[1])])
+
+    assert AnnIndexRegistry(str(tmp_path)).get("u1").version == new.version
+    assert delta_ids(new) == [replay_ids[0], *late_ids[:2], replay_ids[1], late_ids[2]]
+    assert not old.add(late_ids[0], late_vectors[0])
+    registry.remove_retired(new)
+    assert not os.path.exists(os.path.join(old.root, old.version))  # No grace period: removed at once
+
+
+@pytest.mark.anyio
+async def test_insert_follows_a_rebuild_that_retired_the_index_in_hand(sqlite_store, tmp_path, monkeypatch):
+    registry = sqlite_store.ann_indexes = AnnIndexRegistry(str(tmp_path / "ann"), retired_grace_seconds=0)
+    stale = registry.build("u1", *rows(0, 64))
+    registry.publish("u1", stale)
+    new = registry.build("u1", *stale.all_rows())
+    registry.publish("u1", new, previous=stale)
+    registry.remove_retired(new)
+
+    # The store looked the index up just before the rebuild replaced (and deleted) it
+    real_get, handed = registry.get, [stale]
+    monkeypatch.setattr(registry, "get", lambda user_id: handed.pop() if handed else real_get(user_id))
+    await sqlite_store._add_to_index("u1", 500, rows(500, 1)[1][0].tolist())
+
+    assert delta_ids(real_get("u1")) == [(500).to_bytes(12, "big")]
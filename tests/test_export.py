@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import pytest
+
+from ..config import settings
+from ..models import Episode, Message, Summary
+from ..services import export
+from ..services.ingest import iter_lines
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_export_round_trips_into_another_user(sqlite_store, monkeypatch):
+    monkeypatch.setattr(export, "store", sqlite_store)
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 2)  # Several write batches per record type
+    await sqlite_store.save_messages_bulk([
+        Message(user_id="u1", session_id="s1", role="user", content=f"m{i}", created_at=datetime(2026, 1, 1, 9, i))
+        for i in range(5)
+    ])
+    await sqlite_store.upsert_summary(Summary(user_id="u1", session_id="s1", scope="session", text="likes tea"))
+    facts = [f"fact {i}" for i in range(5)]
+    await sqlite_store.restore_episodes(
+        [Episode(user_id="u1", fact=fact, importance=0.5, embedding=[float(i == d) for d in range(5)])
+         for i, fact in enumerate(facts)],
+        cold=[i % 2 == 1 for i in range(5)],
+    )
+
+    stats = await export.import_user_memory(iter_lines(export.export_user_memory("u1")), user_id="u2")
+
+    assert stats == {"user_id": "u2", "messages": 5, "summaries": 1, "episodes": 5, "errors": 0}
+    hot = [e.fact async for e in sqlite_store.iter_episodes("u2", 10)]
+    cold = [e.fact async for e in sqlite_store.iter_episodes("u2", 10, cold=True)]
+    assert sorted(hot) == ["fact 0", "fact 2", "fact 4"]
+    assert sorted(cold) == ["fact 1", "fact 3"]
+    assert (await sqlite_store.get_session_state("u2", "s1")).user_messages == 5
@@ -0,0 +1,85 @@
+import json
+from typing import AsyncIterator, Dict, List
+
+import httpx
+import pytest
+
+from ..services import ingest, memory_logic
+from ..services.ollama_client import ollama_client
+
+pytestmark = pytest.mark.anyio
+
+CONVERSATION = {
+    "user_id": "u1",
+    "session_id": "s1",
+    "messages": [
+        {"role": "user", "content": f"fact number {i}", "created_at": f"2026-01-0{i + 1}T10:00:00"}
+        for i in range(4)
+    ],
+}
+
+
+async def lines(records: List[Dict]) -> AsyncIterator[str]:
+    for record in records:
+        yield json.dumps(record)
+
+
+class FlakyLLM:
+    """Stub Ollama that fails every call while `down` is set."""
+
+    def __init__(self):
+        self.down = False
+        self.extracted: List[str] = []
+
+    async def chat_completion(self, messages, **kwargs):
+        if self.down:
+            raise httpx.ConnectError("model server down")
+        prompt = messages[-1]["content"]
+        if prompt.startswith("Extract up to"):
+            message = prompt.split("User message: ")[1].strip("'")
+            self.extracted.append(message)
+            return json.dumps([{"fact": f"User said {message}", "importance": 0.5}])
+        return "a summary"
+
+    async def generate_embeddings(self, texts, priority=None):
+        # One direction per fact number, so stored facts never look like near-duplicates
+        return [[1.0 if i == int(text[-1]) else 0.0 for i in range(4)] for text in texts]
+
+
+@pytest.fixture
+def llm(sqlite_store, monkeypatch) -> FlakyLLM:
+    monkeypatch.setattr(ingest, "store", sqlite_store)
+    monkeypatch.setattr(memory_logic, "store", sqlite_store)
+    stub = FlakyLLM()
+    monkeypatch.setattr(ollama_client, "chat_completion", stub.chat_completion)
+    monkeypatch.setattr(ollama_client, "generate_embeddings", stub.generate_embeddings)
+    return stub
+
+
+async def test_backfill_failure_is_resumable_at_the_failed_message(sqlite_store, llm, monkeypatch):
+    stats = await ingest.ingest_conversations(lines([CONVERSATION]))
+    run_id = stats["run_id"]
+
+    # The model server goes away after the second message
+    real_extract = memory_logic.extract_episodes
+    outage = [True]
+
+    async def extract_then_fail(user_id, session_id, message, store_after=None):
+        if len(llm.extracted) == 2 and outage:
+            llm.down = outage.pop()
+        return await real_extract(user_id, session_id, message, store_after)
+
+    monkeypatch.setattr(ingest, "extract_episodes", extract_then_fail)
+    progress = await ingest.run_backfill(run_id, concurrency=1)
+
+    assert progress == {"session": {"failed": 1}}  # No lifetime task while a session is unfinished
+    assert len(await sqlite_store.get_last_n_episodic_facts("u1", 10)) == 2
+
+    llm.down = False
+    progress = await ingest.run_backfill(run_id, concurrency=1)
+
+    assert progress == {"session": {"done": 1}, "lifetime": {"done": 1}}
+    assert llm.extracted == [f"fact number {i}" for i in range(4)]  # Each message extracted once
+    assert len(await sqlite_store.get_last_n_episodic_facts("u1", 10)) == 4
+    assert await sqlite_store.get_latest_summary("u1", "session", "s1") is not None
+    assert await sqlite_store.get_latest_summary("u1", "user") is not None
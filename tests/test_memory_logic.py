@@ -0,0 +1,70 @@
+from datetime import datetime
+from typing import List
+
+import pytest
+
+from ..config import settings
+from ..models import Summary
+from ..services import memory_logic
+from ..services.ollama_client import ollama_client
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def prompts(sqlite_store, monkeypatch) -> List[str]:
+    """Routes memory_logic to the test store and records every prompt sent to a stub LLM."""
+    monkeypatch.setattr(memory_logic, "store", sqlite_store)
+    sent: List[str] = []
+
+    async def chat_completion(messages, **kwargs):
+        sent.append(messages[-1]["content"])
+        return f"LIFETIME ROLLUP {len(sent)}"
+
+    monkeypatch.setattr(ollama_client, "chat_completion", chat_completion)
+    return sent
+
+
+async def summarize(store, session_id: str, text: str, at: datetime):
+    await store.upsert_summary(Summary(user_id="u1", session_id=session_id, scope="session", text=text, created_at=at))
+
+
+async def test_lifetime_merge_takes_only_new_session_summaries(sqlite_store, prompts):
+    await summarize(sqlite_store, "s1", "likes tea", datetime(2026, 3, 1))
+    await summarize(sqlite_store, "s2", "moved to Lisbon", datetime(2026, 3, 2))
+    await memory_logic.refresh_lifetime_summary("u1")
+    assert len(prompts) == 1  # One merge call per page, nothing else
+
+    # A session re-summarized later is merged again; untouched ones are not
+    prompts.clear()
+    await summarize(sqlite_store, "s1", "likes green tea", datetime(2026, 4, 1))
+    lifetime = await memory_logic.refresh_lifetime_summary("u1")
+
+    [lifetime_prompt] = prompts
+    assert "LIFETIME ROLLUP 1" in lifetime_prompt
+    assert "likes green tea" in lifetime_prompt
+    assert "moved to Lisbon" not in lifetime_prompt
+    assert lifetime.watermark == datetime(2026, 4, 1)
+
+
+async def test_lifetime_merge_pages_through_a_long_history(sqlite_store, prompts, monkeypatch):
+    monkeypatch.setattr(settings, "LIFETIME_MERGE_BATCH", 2)
+    for day in range(1, 6):
+        await summarize(sqlite_store, f"s{day}", f"fact {day}", datetime(2026, 3, day))
+
+    lifetime = await memory_logic.refresh_lifetime_summary("u1")
+
+    assert len(prompts) == 3
+    assert ["fact 5" in prompt for prompt in prompts] == [False, False, True]
+    assert lifetime.watermark == datetime(2026, 3, 5)
+
+
+async def test_lifetime_refresh_is_a_no_op_without_new_summaries(sqlite_store, prompts):
+    await summarize(sqlite_store, "s1", "likes tea", datetime(2026, 3, 1))
+    first = await memory_logic.refresh_lifetime_summary("u1")
+    prompts.clear()
+
+    again = await memory_logic.refresh_lifetime_summary("u1")
+
+    assert prompts == []
+    assert again.text == first.text
@@ -0,0 +1,80 @@
+import asyncio
+
+import httpx
+import pytest
+
+from ..config import settings
+from ..services import memory_worker as worker_module
+from ..services.llm_scheduler import LLMOverloaded
+from ..services.memory_worker import MemoryWorker
+from ..services.ollama_client import ollama_client
+
+pytestmark = pytest.mark.anyio
+
+PAYLOAD = {"user_id": "u1", "session_id": "s1", "message": "I moved to Lisbon last spring."}
+
+
+@pytest.fixture
+def worker(sqlite_store, monkeypatch):
+    monkeypatch.setattr(worker_module, "store", sqlite_store)
+    worker = MemoryWorker()
+    worker.queue = asyncio.Queue()
+    return worker
+
+
+def fail_llm(monkeypatch, error: Exception):
+    async def chat_completion(*args, **kwargs):
+        raise error
+    monkeypatch.setattr(ollama_client, "chat_completion", chat_completion)
+
+
+async def test_failed_job_is_released_for_retry(sqlite_store, worker, monkeypatch):
+    fail_llm(monkeypatch, httpx.ConnectError("model server down"))
+    job_id = await sqlite_store.enqueue_job("extract_episodes", PAYLOAD)
+
+    job = await sqlite_store.claim_job(job_id)
+    await worker._run_job(job)
+
+    # Still queued (claimable again) with the attempt counted, and handed back to the workers
+    retry = await sqlite_store.claim_job(job_id)
+    assert retry is not None
+    assert retry["attempts"] == 2
+    assert worker.queue.get_nowait() == job_id
+
+
+async def test_job_fails_after_max_attempts(sqlite_store, worker, monkeypatch):
+    fail_llm(monkeypatch, httpx.ConnectError("model server down"))
+    job_id = await sqlite_store.enqueue_job("extract_episodes", PAYLOAD)
+
+    for _ in range(settings.MEMORY_JOB_MAX_ATTEMPTS):
+        job = await sqlite_store.claim_job(job_id)
+        assert job is not None
+        await worker._run_job(job)
+
+    assert await sqlite_store.claim_job(job_id) is None
+    assert await sqlite_store.get_queued_job_ids(10) == []
+
+
+async def test_shed_job_waits_for_the_sweep_without_failing(sqlite_store, worker, monkeypatch):
+    fail_llm(monkeypatch, LLMOverloaded("shed", 1))
+    job_id = await sqlite_store.enqueue_job("extract_episodes", PAYLOAD)
+
+    for _ in range(settings.MEMORY_JOB_MAX_ATTEMPTS + 1):
+        job = await sqlite_store.claim_job(job_id)
+        assert job is not None
+        await worker._run_job(job)
+
+    assert await sqlite_store.get_queued_job_ids(10) == [job_id]
+    assert worker.queue.empty()
+
+
+async def test_completed_job_is_removed(sqlite_store, worker, monkeypatch):
+    async def chat_completion(*args, **kwargs):
+        return "[]"
+    monkeypatch.setattr(ollama_client, "chat_completion", chat_completion)
+    job_id = await sqlite_store.enqueue_job("extract_episodes", PAYLOAD)
+
+    await worker._run_job(await sqlite_store.claim_job(job_id))
+
+    assert await sqlite_store.claim_job(job_id) is None
+    assert await sqlite_store.get_queued_job_ids(10) == []
@@ -0,0 +1,60 @@
+import asyncio
+
+import httpx
+import pytest
+
+from ..config import settings
+from ..services.llm_scheduler import Priority
+from ..services.ollama_client import OllamaBackend, OllamaClient
+
+pytestmark = pytest.mark.anyio
+
+
+def make_client(handler, urls=("http://a.invalid", "http://b.invalid")) -> OllamaClient:
+    client = OllamaClient()
+    client.backends = [OllamaBackend(url) for url in urls]
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+async def test_cancelled_caller_cancels_the_unhedged_request(monkeypatch):
+    monkeypatch.setattr(settings, "OLLAMA_HEDGE_DELAY_MS", 10_000)
+    started, stalled = asyncio.Event(), asyncio.Event()
+
+    async def handler(request):
+        started.set()
+        await stalled.wait()  # Never answers
+
+    client = make_client(handler)
+    call = asyncio.create_task(client._post_hedged("/api/chat", {}, 60.0))
+    await started.wait()
+    call.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await call
+    await asyncio.sleep(0)
+
+    # The request to the primary was cancelled with its caller, not left running in the background
+    assert [backend.in_flight for backend in client.backends] == [0, 0]
+
+
+async def test_backoff_sleeps_without_holding_a_slot(monkeypatch):
+    monkeypatch.setattr(settings, "OLLAMA_MAX_RETRIES", 1)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("model server restarting")
+        return httpx.Response(200, json={"message": {"content": "hi"}})
+
+    client = make_client(handler, urls=("http://a.invalid",))
+    slots_during_backoff = []
+
+    async def backoff(endpoint, attempt):
+        slots_during_backoff.append(client.chat_slots.in_use)
+
+    monkeypatch.setattr(client, "_backoff", backoff)
+    assert await client.chat_completion([{"role": "user", "content": "hello"}], Priority.EXTRACTION) == "hi"
+
+    assert slots_during_backoff == [0]
+    assert client.chat_slots.in_use == 0
@@ -0,0 +1,29 @@
+from ..services.prompt_packing import ContextPacker, estimate_prompt_tokens, estimate_tokens
+
+PRIMER = "You are a helpful AI assistant."
+LIFETIME = " ".join(f"lifetime-fact-{i}" for i in range(400))
+SESSION = " ".join(f"session-fact-{i}" for i in range(300))
+
+
+def pack(current_message: str, history_turns: int, budget: int = 1024):
+    history = [{"role": "user", "content": f"turn {i} " + "words " * 40} for i in range(history_turns)]
+    facts = [f"fact {i} " + "detail " * 10 for i in range(10)]
+    return ContextPacker(budget, 256, 128).pack(PRIMER, current_message, history, facts, SESSION, LIFETIME)
+
+
+def test_summary_prefix_is_identical_across_turns():
+    short_turn = pack("hi", history_turns=0)
+    long_turn = pack("tell me everything " * 100, history_turns=12)
+
+    assert short_turn[:3] == long_turn[:3]
+    assert estimate_tokens(short_turn[1]["content"]) <= 256
+    assert estimate_tokens(short_turn[2]["content"]) <= 128
+
+
+def test_summaries_are_reserved_before_history_and_facts():
+    messages = pack("hi", history_turns=40)
+
+    assert messages[1]["content"].startswith("User's lifetime summary:")
+    assert messages[2]["content"].startswith("Current session summary:")
+    assert estimate_prompt_tokens(messages) <= 1024
+    assert len(messages) < 40  # History and facts took only what the summaries left
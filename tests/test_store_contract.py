@@ -0,0 +1,172 @@
+"""
+Behavior every MemoryStore backend has to share. Runs against each backend in BACKENDS;
+Mongo needs a server, so only the embedded SQLite backend runs here.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from ..models import Episode, Message, Summary
+from ..storage.sqlite import SQLiteStore
+
+pytestmark = pytest.mark.anyio
+
+BACKENDS = ["sqlite"]
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request):
+    return request.getfixturevalue(f"{request.param}_store")
+
+
+def episode(fact: str, direction: int, user_id: str = "u1", importance: float = 0.5) -> Episode:
+    embedding = [0.0] * 8
+    embedding[direction] = 1.0
+    return Episode(user_id=user_id, fact=fact, importance=importance, embedding=embedding)
+
+
+async def stored_ids(store, user_id: str = "u1", cold: bool = False):
+    ids, _ = await store._load_episode_vectors(user_id, cold=cold)
+    return ids
+
+
+# ------------------------------------------------------------------
+# Episode ids
+# ------------------------------------------------------------------
+async def test_episode_ids_are_not_reused_after_deletes(store):
+    for i in range(3):
+        await store.save_episode(episode(f"fact {i}", i))
+    *_, newest = await stored_ids(store)
+    await store._delete_episodes([newest])
+
+    await store.save_episode(episode("fact 3", 3))
+
+    ids = await stored_ids(store)
+    assert len(ids) == 3
+    assert newest not in ids
+
+
+async def test_episode_ids_are_unique_across_tiers(store):
+    for i in range(3):
+        await store.save_episode(episode(f"fact {i}", i))
+    *_, newest = await stored_ids(store)
+    await store._set_episode_tier([newest], cold=True)
+
+    await store.save_episode(episode("fact 3", 3))
+
+    assert await stored_ids(store, cold=True) == [newest]
+    assert newest not in await stored_ids(store)
+
+
+# ------------------------------------------------------------------
+# Episodes
+# ------------------------------------------------------------------
+async def test_near_duplicate_episode_is_merged(store):
+    await store.save_episode(episode("likes tea", 0, importance=0.4))
+    await store.save_episode(episode("really likes tea", 0, importance=0.7))
+
+    assert await store.get_last_n_episodic_facts("u1", 10) == ["likes tea"]
+    [merged] = await store.get_top_k_episodes_by_similarity("u1", episode("q", 0).embedding, 5)
+    assert merged.seen_count == 2
+    assert merged.importance >= 0.7
+
+
+async def test_similarity_search_is_best_first_and_per_user(store):
+    await store.save_episode(episode("likes tea", 0))
+    await store.save_episode(episode("lives in Lisbon", 1))
+    await store.save_episode(episode("someone else's fact", 0, user_id="u2"))
+
+    query = [0.9, 0.1] + [0.0] * 6
+    found = await store.get_top_k_episodes_by_similarity("u1", query, 5)
+
+    assert [e.fact for e in found] == ["likes tea", "lives in Lisbon"]
+
+
+async def test_saving_an_episode_bumps_the_memory_version(store):
+    before = await store.get_memory_version("u1")
+    await store.save_episode(episode("likes tea", 0))
+    assert await store.get_memory_version("u1") > before
+
+
+async def test_restored_episodes_keep_their_counters_and_tier(store):
+    source = [
+        episode("likes tea", 0).model_copy(update={"seen_count": 3, "retrieval_hits": 5}),
+        episode("used to live in Porto", 1),
+    ]
+    await store.restore_episodes(source, cold=[False, True])
+
+    hot = [e async for e in store.iter_episodes("u1", 10)]
+    cold = [e async for e in store.iter_episodes("u1", 10, cold=True)]
+    assert [(e.fact, e.seen_count, e.retrieval_hits) for e in hot] == [("likes tea", 3, 5)]
+    assert [e.fact for e in cold] == ["used to live in Porto"]
+
+
+# ------------------------------------------------------------------
+# Messages and summaries
+# ------------------------------------------------------------------
+async def test_messages_update_the_session_state(store):
+    start = datetime(2026, 1, 5, 9)
+    for i, role in enumerate(["user", "assistant", "user"]):
+        state = await store.save_message(
+            Message(user_id="u1", session_id="s1", role=role, content=f"m{i}", created_at=start + timedelta(minutes=i))
+        )
+
+    assert (state.user_messages, state.assistant_messages) == (2, 1)
+    assert state.created_at == start
+    assert [m.content for m in await store.get_last_n_messages("u1", "s1", 2)] == ["m2", "m1"]
+    assert [m.content for m in await store.get_session_messages("u1", "s1", "user", 0, 10)] == ["m0", "m2"]
+
+
+async def test_summary_upsert_keeps_one_per_session(store):
+    await store.upsert_summary(Summary(user_id="u1", session_id="s1", scope="session", text="v1"))
+    await store.upsert_summary(Summary(user_id="u1", session_id="s1", scope="session", text="v2"))
+
+    assert (await store.get_latest_summary("u1", "session", "s1")).text == "v2"
+    assert [s.text for s in await store.get_all_session_summaries("u1")] == ["v2"]
+
+
+# ------------------------------------------------------------------
+# Jobs and caches
+# ------------------------------------------------------------------
+async def test_job_lifecycle(store):
+    job_id = await store.enqueue_job("summarize", {"user_id": "u1"}, dedup_key="summarize:u1")
+    assert await store.enqueue_job("summarize", {"user_id": "u1"}, dedup_key="summarize:u1") is None
+
+    job = await store.claim_job(job_id)
+    assert job["attempts"] == 1
+    assert await store.claim_job(job_id) is None  # Already running
+
+    await store.release_job(job_id, error="boom")
+    assert (await store.claim_job(job_id))["attempts"] == 2
+    await store.complete_job(job_id)
+    assert await store.get_queued_job_ids(10) == []
+
+
+async def test_embedding_cache_is_per_model(store):
+    await store.save_cached_embeddings("m1", {"h1": [1.0, 2.0]})
+    await store.save_cached_embeddings("m2", {"h1": [3.0, 4.0]})
+
+    assert list(await store.get_cached_embeddings("m1", ["h1"])) == ["h1"]
+    assert await store.purge_embedding_cache(keep_model="m2") == 1
+    assert await store.get_cached_embeddings("m1", ["h1"]) == {}
+    assert list((await store.get_cached_embeddings("m2", ["h1", "h2"]))["h1"]) == [3.0, 4.0]
+
+
+# ------------------------------------------------------------------
+# SQLite specifics
+# ------------------------------------------------------------------
+async def test_sqlite_sequence_starts_past_ids_in_an_older_file(sqlite_store):
+    for i in range(3):
+        await sqlite_store.save_episode(episode(f"fact {i}", i))
+    *_, newest = await stored_ids(sqlite_store)
+    await sqlite_store._set_episode_tier([newest], cold=True)
+    # As a file written before the shared sequence existed: no sequence state at all
+    await sqlite_store._write(lambda conn: conn.execute("DELETE FROM sqlite_sequence"))
+
+    reopened = SQLiteStore(sqlite_store.path)
+    await reopened.connect()
+    try:
+        await reopened.save_episode(episode("fact 3", 3))
+        assert max(await stored_ids(reopened)) == newest + 1  # Past every id in either tier
+    finally:
+        await reopened.close()